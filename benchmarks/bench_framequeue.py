@@ -0,0 +1,98 @@
+"""
+Microbenchmark: writer wakeup latency and CPU use of the old deque + sleep(0.01)
+polling loop versus the event-driven campy.framequeue.FrameQueue.
+
+A producer thread emits small frames at a fixed rate (like unicam.GrabFrames)
+and a consumer thread dequeues them (like writer.WriteFrames). Latency is the time
+from put to dequeue. CPU is process time while the stream runs and while idle.
+
+Usage:
+python benchmarks/bench_framequeue.py [frameRate] [durationInSec]
+"""
+
+import sys, time, threading
+from collections import deque
+import numpy as np
+from campy.framequeue import FrameQueue, STOP
+from common import Report
+
+
+def Produce(put, put_stop, frameRate, numFrames, img):
+    period = 1.0 / frameRate
+    t_next = time.perf_counter()
+    for frameNumber in range(numFrames):
+        t_next += period
+        delay = t_next - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        put((frameNumber, time.perf_counter(), img))
+    put_stop()
+
+
+def ConsumeDeque(writeQueue, stopWriteQueue, latencies):
+    while True:
+        if writeQueue:
+            frameNumber, timeStamp, img = writeQueue.popleft()
+            latencies.append(time.perf_counter() - timeStamp)
+        else:
+            if stopWriteQueue:
+                break
+            time.sleep(0.01)
+
+
+def ConsumeFrameQueue(writeQueue, latencies):
+    while True:
+        for item in writeQueue.get_batch(timeout=0.5):
+            if item is STOP:
+                return
+            frameNumber, timeStamp, img = item
+            latencies.append(time.perf_counter() - timeStamp)
+
+
+def IdleCpu(durationInSec):
+    # CPU burned by a consumer waiting on an empty queue
+    t0 = time.process_time()
+    time.sleep(durationInSec)
+    return (time.process_time() - t0) / durationInSec
+
+
+def RunDeque(frameRate, numFrames, img, idleInSec):
+    writeQueue, stopWriteQueue, latencies = deque(), deque([], 1), []
+    consumer = threading.Thread(
+        target=ConsumeDeque, args=(writeQueue, stopWriteQueue, latencies)
+    )
+    consumer.start()
+    idle = IdleCpu(idleInSec)
+    t0, c0 = time.perf_counter(), time.process_time()
+    Produce(
+        writeQueue.append,
+        lambda: stopWriteQueue.append("STOP"),
+        frameRate,
+        numFrames,
+        img,
+    )
+    consumer.join()
+    return latencies, idle, (time.process_time() - c0) / (time.perf_counter() - t0)
+
+
+def RunFrameQueue(frameRate, numFrames, img, idleInSec):
+    writeQueue, latencies = FrameQueue(), []
+    consumer = threading.Thread(target=ConsumeFrameQueue, args=(writeQueue, latencies))
+    consumer.start()
+    idle = IdleCpu(idleInSec)
+    t0, c0 = time.perf_counter(), time.process_time()
+    Produce(writeQueue.put, writeQueue.put_stop, frameRate, numFrames, img)
+    consumer.join()
+    return latencies, idle, (time.process_time() - c0) / (time.perf_counter() - t0)
+
+
+if __name__ == "__main__":
+    frameRate = float(sys.argv[1]) if len(sys.argv) > 1 else 500
+    durationInSec = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+    numFrames = int(frameRate * durationInSec)
+    img = np.zeros((64, 64, 3), dtype="uint8")
+
+    print(f"{numFrames} frames at {frameRate:.0f} fps")
+    print("Note: streaming CPU includes the producer thread in both cases.")
+    Report("deque+sleep", *RunDeque(frameRate, numFrames, img, 2.0))
+    Report("FrameQueue", *RunFrameQueue(frameRate, numFrames, img, 2.0))
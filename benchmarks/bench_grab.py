@@ -0,0 +1,152 @@
+"""
+Microbenchmark: frame pickup latency and CPU use of the old zero-timeout polling
+grab (exception on an empty buffer, then sleep 1 ms) versus the blocking and
+callback grab modes of unicam.StartGrabbing, using the emulated camera.
+
+Latency is the time from a frame arriving in the camera buffer to the grab loop
+getting it. CPU is process time while waiting for a trigger (no frames) and while
+streaming (includes the emulator's frame thread).
+
+Backlog: how fast a full camera buffer (bufferSize frames, e.g. after the grab
+thread stalled) is drained one frame per loop iteration versus in batches, with
+the grab loop's bookkeeping (frametimes, frame stats, write queue, display and
+report checks).
+
+Usage:
+python benchmarks/bench_grab.py [frameRate] [durationInSec]
+"""
+
+import sys, time, tempfile
+import numpy as np
+from campy.cameras import emu, unicam
+from campy.framequeue import FrameQueue
+from campy.frametimes import FrameTimes
+from campy.framestats import FrameStats
+from common import Report
+
+
+class EmptyBuffer(Exception):
+    pass
+
+
+def PollGrab(camera):
+    # Old behavior: RetrieveResult(0, TimeoutHandling_ThrowException) + sleep in unicam
+    def grab(frameNumber):
+        try:
+            grabResult = camera.Retrieve(0)
+            if grabResult is None:
+                raise EmptyBuffer()
+            return [grabResult]
+        except Exception:
+            time.sleep(0.001)
+            return []
+
+    camera.Start()
+    return grab
+
+
+def GrabLoop(grab, numFrames, timeout):
+    # Core of unicam.GrabFrames without the writer and display
+    latencies = []
+    t_end = time.perf_counter() + timeout
+    while len(latencies) < numFrames and time.perf_counter() < t_end:
+        for grabResult in grab(len(latencies)):
+            latencies.append(time.perf_counter() - emu.GetTimeStamp(grabResult))
+    return latencies
+
+
+def Run(mode, frameRate, numFrames, img, idleInSec):
+    cam_params = {
+        "cameraName": mode,
+        "grabMode": mode,
+        "grabTimeoutInMs": 100,
+        "bufferSize": 100,
+        "cameraMake": "emu",
+    }
+
+    # Idle: grab loop running before the first trigger
+    camera = emu.EmulatedCamera([img], frameRate, 100)
+    camera.Start = lambda onFrame=None: None
+    if mode == "poll":
+        grab = PollGrab(camera)
+    else:
+        grabbing, grab = unicam.StartGrabbing(camera, cam_params, emu)
+    c0 = time.process_time()
+    GrabLoop(grab, 1, idleInSec)
+    idle = (time.process_time() - c0) / idleInSec
+
+    # Streaming
+    camera = emu.EmulatedCamera([img], frameRate, 100)
+    if mode == "poll":
+        grab = PollGrab(camera)
+    else:
+        grabbing, grab = unicam.StartGrabbing(camera, cam_params, emu)
+    t0, c0 = time.perf_counter(), time.process_time()
+    latencies = GrabLoop(grab, numFrames, 2 * numFrames / frameRate + 1)
+    busy = (time.process_time() - c0) / (time.perf_counter() - t0)
+    camera.Stop()
+    return latencies, idle, busy
+
+
+def DrainBacklog(batched, bufferSize, img, folder, frameRatio=10, reportEvery=500):
+    # Grab loop bookkeeping as in unicam.GrabFrames, before and after batching
+    camera = emu.EmulatedCamera([img], 100, bufferSize)
+    t = time.perf_counter()
+    camera.buffer.extend((img, t + n * 0.01, n) for n in range(bufferSize))
+    frameTimes, frameStats = FrameTimes(folder), FrameStats(100)
+    writeQueue, dispQueue = FrameQueue(), []
+    frameNumber, nextReport = 0, reportEvery
+    t0 = time.perf_counter()
+    if batched:
+        while camera.buffer:
+            grabResults = emu.GrabBatch(camera, 0, bufferSize)
+            items = []
+            for grabResult in grabResults:
+                frameNumber += 1
+                timeStamp = emu.GetTimeStamp(grabResult)
+                frameTimes.append(frameNumber, timeStamp)
+                frameStats.update(timeStamp)
+                items.append((frameNumber, timeStamp, emu.GetImageArray(grabResult), 0))
+            writeQueue.put_batch(items)
+            if frameNumber // frameRatio > (frameNumber - len(items)) // frameRatio:
+                dispQueue.append(grabResults[-1])
+            if frameNumber >= nextReport:
+                nextReport = frameNumber + reportEvery
+                frameStats.chunk()
+            for grabResult in grabResults:
+                emu.ReleaseFrame(grabResult)
+    else:
+        while camera.buffer:
+            grabResult = emu.GrabFrame(camera, frameNumber, 0)
+            frame = emu.GetImageArray(grabResult)
+            frameNumber += 1
+            timeStamp = emu.GetTimeStamp(grabResult)
+            frameTimes.append(frameNumber, timeStamp)
+            frameStats.update(timeStamp)
+            writeQueue.put((frameNumber, timeStamp, frame, 0))
+            if frameNumber % frameRatio == 0:
+                dispQueue.append(grabResult)
+            if frameNumber % reportEvery == 0:
+                frameStats.chunk()
+            emu.ReleaseFrame(grabResult)
+    elapsed = time.perf_counter() - t0
+    frameTimes.close()
+    return frameNumber / elapsed
+
+
+if __name__ == "__main__":
+    frameRate = float(sys.argv[1]) if len(sys.argv) > 1 else 200
+    durationInSec = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+    numFrames = int(frameRate * durationInSec)
+    img = np.zeros((64, 64), dtype="uint8")
+
+    print(f"{numFrames} frames at {frameRate:.0f} fps")
+    for mode in ["poll", "blocking", "callback"]:
+        Report(mode, *Run(mode, frameRate, numFrames, img, 2.0), width=9)
+
+    bufferSize = 500
+    print(f"Backlog of {bufferSize} frames")
+    with tempfile.TemporaryDirectory() as folder:
+        for batched in [False, True]:
+            rate = max(DrainBacklog(batched, bufferSize, img, folder) for i in range(5))
+            print(f"{'batched' if batched else 'per frame':<9} drained at {rate:,.0f} fps")
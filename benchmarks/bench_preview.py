@@ -0,0 +1,84 @@
+"""
+Microbenchmark: cost per preview frame in the grab thread, from a grabbed frame to
+the display frame in its live view preview slot.
+
+Bayer: the old path debayered the full frame (PySpin HQ_LINEAR, pylon
+ImageFormatConverter) and then decimated it. The camera SDKs aren't needed here:
+OpenCV's full-frame debayering (bilinear, and edge-aware which is closer to
+HQ_LINEAR) stands in for them. The new path bins the raw mosaic straight to RGB
+(campy.preview).
+
+Mono and RGB: the old FLIR path copied the full frame before decimating it. The new
+path decimates a view of the frame.
+
+Usage:
+python benchmarks/bench_preview.py [frameWidth] [frameHeight] [displayDownsample]
+"""
+
+import sys, time
+import numpy as np
+import cv2
+from campy import preview
+from campy.liveview import PreviewSlot
+
+
+def PerFrame(fn, img, repeats=50):
+    # Best of repeats, in milliseconds
+    best = float("inf")
+    for i in range(repeats):
+        t = time.perf_counter()
+        fn(img)
+        best = min(best, time.perf_counter() - t)
+    return best * 1000
+
+
+def Report(name, before, after):
+    print(
+        f"{name:<34} before {before:7.3f} ms | after {after:7.3f} ms "
+        f"| {before / after:6.1f}x"
+    )
+
+
+if __name__ == "__main__":
+    width = int(sys.argv[1]) if len(sys.argv) > 1 else 2448
+    height = int(sys.argv[2]) if len(sys.argv) > 2 else 2048
+    ds = int(sys.argv[3]) if len(sys.argv) > 3 else 2
+
+    rng = np.random.default_rng(0)
+    print(f"{width}x{height} frames, displayDownsample {ds}")
+    formats = {
+        "bayer_rggb8": (height, width),
+        "gray": (height, width),
+        "rgb24": (height, width, 3),
+    }
+    for pixelFormat, shape in formats.items():
+        cam_params = {
+            "frameWidth": width,
+            "frameHeight": height,
+            "displayDownsample": ds,
+            "pixelFormatInput": pixelFormat,
+        }
+        img = rng.integers(0, 256, shape, dtype=np.uint8)
+        slot = PreviewSlot(cam_params)
+
+        def New(img):
+            slot.append(preview.PreviewImage(cam_params, img))
+
+        if pixelFormat.startswith("bayer"):
+            for name, code in [
+                ("bilinear", cv2.COLOR_BayerRG2RGB),
+                ("edge-aware", cv2.COLOR_BayerRG2RGB_EA),
+            ]:
+
+                def Old(img):
+                    slot.append(cv2.cvtColor(img, code)[::ds, ::ds])
+
+                name = f"{pixelFormat} ({name} debayer)"
+                Report(name, PerFrame(Old, img), PerFrame(New, img))
+        else:
+
+            def Old(img):
+                slot.append(img.copy()[::ds, ::ds])
+
+            Report(f"{pixelFormat} (full copy)", PerFrame(Old, img), PerFrame(New, img))
+        slot.unlink()
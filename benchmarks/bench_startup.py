@@ -0,0 +1,131 @@
+"""
+Benchmark: startup cost of campy-acquire.
+
+Imports: `python -X importtime` cost of importing campy.campy and the modules a
+headless emulated-camera worker loads (unicam, emu driver, writer). Lists the
+heaviest modules imported by campy.campy and fails (exit code 1) if a GUI toolkit or another
+on-demand dependency (matplotlib, Qt, cv2, scipy, imageio) gets loaded, so
+import regressions are caught.
+
+Acquisition: writes a headless config (displayFrameRate 0) for numCams emulated
+cameras to a temporary folder, records recTimeInSec seconds and reports the time
+from launch until each camera is opened, and the total run time.
+
+Usage:
+python benchmarks/bench_startup.py [numCams] [numRuns]
+"""
+
+import os, re, sys, time, tempfile, subprocess
+import yaml
+
+# Modules loaded only on demand (display, frametimes.mat, imageio writer backend)
+ON_DEMAND = ["matplotlib", "PyQt5", "cv2", "scipy", "imageio", "imageio_ffmpeg"]
+
+HEADLESS_IMPORTS = (
+    "import campy.campy; "
+    "from campy.cameras import unicam; "
+    "unicam.ImportCam('emu'); "
+    "from campy import writer"
+)
+
+
+def ImportTime(code=HEADLESS_IMPORTS):
+    """
+    Import cost in microseconds of running code in a fresh interpreter: the total
+    for campy.campy, the cumulative time of each module it imports directly, and
+    the set of all imported modules.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        env=dict(os.environ, IMAGEIO_FFMPEG_EXE="ffmpeg"),
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr)
+    total, children, pending, modules = 0, {}, {}, set()
+    for line in result.stderr.splitlines():
+        m = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)", line)
+        if m is None:
+            continue
+        cumulative, depth, name = int(m.group(2)), len(m.group(3)), m.group(4)
+        modules.add(name)
+        # Modules are listed after the imports they trigger, indented by one level
+        if depth == 3:
+            pending[name] = cumulative
+        elif depth == 1:
+            if name == "campy.campy":
+                total, children = cumulative, pending
+            pending = {}
+    return total, children, modules
+
+
+def WriteConfig(folder, numCams):
+    config = {
+        "numCams": numCams,
+        "cameraMake": "emu",
+        "videoFolder": os.path.join(folder, "rec"),
+        "frameRate": 30,
+        "recTimeInSec": 1,
+        "frameWidth": 160,
+        "frameHeight": 120,
+        "pixelFormatInput": "gray",
+        "pixelFormatOutput": "yuv420p",
+        "gpuID": -1,
+        "chunkLengthInSec": 1,
+        "displayFrameRate": 0,
+        "frametimesMat": False,
+    }
+    config_path = os.path.join(folder, "config.yaml")
+    with open(config_path, "w") as f:
+        yaml.safe_dump(config, f)
+    return config_path
+
+
+def Run(config_path, numCams):
+    # Seconds from launch until each camera is opened, and the total run time
+    cmd = "import sys; sys.argv = ['campy-acquire', {!r}]; ".format(config_path)
+    cmd += "from campy.campy import Main; Main()"
+    t0 = time.perf_counter()
+    p = subprocess.Popen(
+        [sys.executable, "-u", "-c", cmd],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+    )
+    opened = []
+    for line in p.stdout:
+        if re.match(r"Opened Camera\d+: ", line):
+            opened.append(time.perf_counter() - t0)
+    p.wait()
+    total = time.perf_counter() - t0
+    if len(opened) < numCams:
+        raise RuntimeError("Only {} of {} cameras opened.".format(len(opened), numCams))
+    return opened, total
+
+
+if __name__ == "__main__":
+    numCams = int(sys.argv[1]) if len(sys.argv) > 1 else 6
+    numRuns = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    campy_us, children, modules = min(
+        (ImportTime() for i in range(numRuns)), key=lambda r: r[0]
+    )
+    print(f"import campy.campy: {campy_us / 1000:.0f} ms")
+    for name, us in sorted(children.items(), key=lambda kv: -kv[1])[:8]:
+        print(f"  {name:<24} {us / 1000:7.1f} ms")
+    loaded = sorted(m for m in ON_DEMAND if m in modules)
+
+    print(f"{numCams} emulated cameras (headless), {os.cpu_count()} CPUs")
+    with tempfile.TemporaryDirectory() as folder:
+        config_path = WriteConfig(folder, numCams)
+        for i in range(numRuns):
+            opened, total = Run(config_path, numCams)
+            print(
+                f"run {i}: first camera opened at {opened[0]:5.2f} s, "
+                f"all at {opened[-1]:5.2f} s | total {total:5.2f} s"
+            )
+
+    if loaded:
+        print("Loaded on-demand modules at import:", ", ".join(loaded))
+        sys.exit(1)
@@ -0,0 +1,85 @@
+"""
+Benchmark: frame throughput into ffmpeg of the imageio-ffmpeg write_frames path
+versus campy's native pipe writer (writer.OpenFFmpegWriter) at 4K rgb24.
+
+Frames are written as fast as possible. With the default "null" output ffmpeg
+discards the decoded frames, so the result measures the cost of moving frames
+through the pipe. Pass "x264" to include a real libx264 ultrafast encode.
+
+Usage:
+python benchmarks/bench_writer.py [null|x264] [numFrames]
+"""
+
+import os, sys, time, tempfile
+import numpy as np
+from imageio_ffmpeg import write_frames
+from campy import writer
+
+
+WIDTH, HEIGHT = 3840, 2160
+
+
+def OutputArgs(mode, folder):
+    if mode == "x264":
+        return "libx264", ["-preset", "ultrafast"], os.path.join(folder, "bench.mp4")
+    return "rawvideo", ["-f", "null"], "-"
+
+
+def RunImageio(frames, numFrames, codec, output_params, file_name):
+    w = write_frames(
+        file_name,
+        [WIDTH, HEIGHT],
+        fps=30,
+        quality=None,
+        codec=codec,
+        pix_fmt_in="rgb24",
+        pix_fmt_out="rgb24" if codec == "rawvideo" else "yuv420p",
+        input_params=["-an"],
+        output_params=output_params,
+    )
+    w.send(None)
+    return Time(w, frames, numFrames)
+
+
+def RunNative(frames, numFrames, codec, output_params, file_name):
+    cmd = writer.FFmpegCommand(
+        [WIDTH, HEIGHT],
+        30,
+        codec,
+        "rgb24",
+        "rgb24" if codec == "rawvideo" else "yuv420p",
+        output_params,
+        file_name,
+    )
+    w = writer.OpenFFmpegWriter(cmd, file_name)
+    w.send(None)
+    return Time(w, frames, numFrames)
+
+
+def Time(w, frames, numFrames):
+    t0, c0 = time.perf_counter(), time.process_time()
+    for i in range(numFrames):
+        w.send(frames[i % len(frames)])
+    w.close()
+    wall, cpu = time.perf_counter() - t0, time.process_time() - c0
+    return numFrames / wall, cpu / numFrames * 1e3
+
+
+if __name__ == "__main__":
+    mode = sys.argv[1] if len(sys.argv) > 1 else "null"
+    numFrames = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    rng = np.random.default_rng(0)
+    frames = [
+        rng.integers(0, 255, (HEIGHT, WIDTH, 3), dtype="uint8") for _ in range(4)
+    ]
+    mb = frames[0].nbytes / 2 ** 20
+
+    print(f"{numFrames} frames of {WIDTH}x{HEIGHT} rgb24 ({mb:.1f} MB), output: {mode}")
+    with tempfile.TemporaryDirectory() as folder:
+        codec, output_params, file_name = OutputArgs(mode, folder)
+        for name, run in [("imageio", RunImageio), ("native", RunNative)]:
+            fps, cpu_ms = run(frames, numFrames, codec, output_params, file_name)
+            print(
+                f"{name:<8} {fps:7.1f} fps  {fps * mb:8.1f} MB/s  "
+                f"writer CPU {cpu_ms:6.2f} ms/frame"
+            )
@@ -0,0 +1,16 @@
+"""
+Helpers shared by the benchmark scripts (run as python benchmarks/<script>.py, so
+this folder is on sys.path).
+"""
+
+import numpy as np
+
+
+def Report(name, latencies, idle, busy, width=12):
+    # One line per run: latency percentiles (latencies in seconds) and CPU fractions
+    lat = np.array(latencies) * 1e3
+    print(
+        f"{name:<{width}} latency ms: median {np.median(lat):6.3f}  "
+        f"p99 {np.percentile(lat, 99):6.3f}  max {lat.max():6.3f} | "
+        f"idle CPU {idle * 100:5.2f}% | streaming CPU {busy * 100:5.1f}%"
+    )
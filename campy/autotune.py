@@ -0,0 +1,370 @@
+"""
+"campy-autotune" finds encoder settings that keep every camera in a config real-time
+on this machine. Synthetic (or sample video) frames at each camera's resolution and
+pixel format are fed through every candidate encoder setup OpenWriter supports
+(CPU presets and the presets of the configured GPUs), for each codec and quality
+to try (default: as configured). Each setup's sustained frame rate and CPU cost are
+measured. For each camera the highest-quality setup that is fast enough
+(frameRate x margin) is chosen, then all cameras are checked together.
+The chosen codec, quality, gpuID and preset are written to a new config file.
+
+Usage:
+campy-autotune ./configs/campy_config.yaml --margin 1.25 --gpuIDs "[0, 1]"
+campy-autotune ./configs/campy_config.yaml --codecs "['h265', 'h264']" --qualities "[21, 25]"
+"""
+
+import os, ast, time, threading, yaml
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from pathlib import Path
+import numpy as np
+from imageio_ffmpeg import read_frames
+from rich.console import Console
+from campy import writer, configurator
+from campy.framering import FrameShape
+from campy.utils.utils import get_datetime
+
+
+console = Console()
+
+# Presets to try, from best compression to fastest
+PRESETS = {
+    "cpu": ["medium", "fast", "faster", "veryfast", "superfast", "ultrafast"],
+    "nvidia": ["slow", "medium", "fast", "hp", "llhq", "llhp"],
+    "amd": ["None"],  # AMF has no presets
+    "intel": ["medium", "fast", "faster", "veryfast"],
+}
+
+AUTOTUNE_ARGS = [
+    "margin",
+    "durationInSec",
+    "gpuIDs",
+    "codecs",
+    "qualities",
+    "sampleVideo",
+    "output",
+]
+
+
+def ParseClargs(parser):
+    parser.add_argument(
+        "--margin",
+        dest="margin",
+        type=float,
+        default=1.2,
+        help="Safety margin: required encoder speed as a multiple of frameRate.",
+    )
+    parser.add_argument(
+        "--durationInSec",
+        dest="durationInSec",
+        type=float,
+        default=3,
+        help="Time to run each candidate encoder.",
+    )
+    parser.add_argument(
+        "--gpuIDs",
+        dest="gpuIDs",
+        type=ast.literal_eval,
+        help="GPUs to try, e.g. [0, 1]. Default: the GPUs used in the config.",
+    )
+    parser.add_argument(
+        "--codecs",
+        dest="codecs",
+        type=ast.literal_eval,
+        help="Codecs to try, in order of preference, e.g. ['h265', 'h264']. \
+            Default: each camera's configured codec.",
+    )
+    parser.add_argument(
+        "--qualities",
+        dest="qualities",
+        type=ast.literal_eval,
+        help="Qualities to try, e.g. [19, 23, 27]. Lower values (less compression) \
+            are preferred. Default: each camera's configured quality.",
+    )
+    parser.add_argument(
+        "--sampleVideo",
+        dest="sampleVideo",
+        help="Video to take test frames from. Default: synthetic frames.",
+    )
+    parser.add_argument(
+        "--output",
+        dest="output",
+        help="Optimized config file. Default: <config>.autotuned.yaml",
+    )
+    return configurator.ParseClargs(parser)
+
+
+def SyntheticFrames(cam_params, numFrames=30):
+    # Moving smooth pattern with sensor-like noise, so encoders do realistic work
+    shape, dtype = FrameShape(cam_params)
+    height, width = shape[:2]
+    y, x = np.mgrid[0:height, 0:width].astype("float32")
+    rng = np.random.default_rng(0)
+    maxval = np.iinfo(dtype).max
+    frames = []
+    for i in range(numFrames):
+        img = 0.5 + 0.25 * np.sin((x + 4 * i) / 37.0) * np.cos((y - 3 * i) / 53.0)
+        img = img + rng.normal(0, 0.02, img.shape)
+        img = (np.clip(img, 0, 1) * maxval).astype(dtype)
+        if len(shape) == 3:
+            img = np.repeat(img[:, :, None], shape[2], axis=2)
+        frames.append(img)
+    return frames
+
+
+def SampleFrames(path, cam_params, numFrames=30):
+    # Frames from a sample video, scaled to the camera resolution and pixel format
+    shape, dtype = FrameShape(cam_params)
+    reader = read_frames(
+        path,
+        pix_fmt=cam_params["pixelFormatInput"],
+        bits_per_pixel=int(np.prod(shape[2:])) * dtype.itemsize * 8,
+        output_params=[
+            "-vf",
+            "scale={}:{}".format(cam_params["frameWidth"], cam_params["frameHeight"]),
+        ],
+    )
+    next(reader)  # Skip metadata
+    frames = []
+    for frame in reader:
+        frames.append(np.frombuffer(frame, dtype=dtype).reshape(shape))
+        if len(frames) == numFrames:
+            break
+    reader.close()
+    return frames
+
+
+def Candidates(cam_params, gpuIDs, codecs=None, qualities=None):
+    """
+    Encoder setups in order of preference: best quality first, then codecs in the
+    given order, then GPUs (off the CPU) before the CPU, each from slow to fast
+    presets. Codecs and qualities default to the camera's configured ones.
+    """
+    codecs = codecs or [cam_params["codec"]]
+    qualities = sorted(qualities or [cam_params["quality"]])
+    devices = [(gpuID, PRESETS[cam_params["gpuMake"]]) for gpuID in gpuIDs]
+    devices.append((-1, PRESETS["cpu"]))
+    candidates = []
+    for quality in qualities:
+        for codec in codecs:
+            for gpuID, presets in devices:
+                for preset in presets:
+                    candidates.append(
+                        {
+                            "codec": codec,
+                            "quality": quality,
+                            "gpuID": gpuID,
+                            "preset": preset,
+                        }
+                    )
+    return candidates
+
+
+def ChildCpuTime():
+    try:
+        import resource
+
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return usage.ru_utime + usage.ru_stime
+    except ImportError:
+        return None
+
+
+def MeasureEncoder(cam_params, candidate, frames, durationInSec):
+    """
+    Encode frames in a loop for durationInSec (output discarded) and return the
+    sustained frame rate and CPU cores used by ffmpeg (None where unavailable).
+    Returns a frame rate of 0 if the encoder failed.
+    """
+    cam_params = dict(cam_params, **candidate)
+    codec, pix_fmt_out, output_params = writer.EncoderParams(cam_params)
+    cmd = writer.FFmpegCommand(
+        [cam_params["frameWidth"], cam_params["frameHeight"]],
+        cam_params["frameRate"],
+        codec,
+        cam_params["pixelFormatInput"],
+        pix_fmt_out,
+        output_params + ["-f", "null"],
+        "-",
+    )
+    c0 = ChildCpuTime()
+    t0 = time.perf_counter()
+    numFrames = 0
+    try:
+        video_writer = writer.OpenFFmpegWriter(cmd, cam_params["cameraName"])
+        video_writer.send(None)  # Initialize the generator
+        while time.perf_counter() - t0 < durationInSec:
+            video_writer.send(frames[numFrames % len(frames)])
+            numFrames += 1
+        video_writer.close()  # Includes flushing the encoder
+    except IOError:
+        return 0.0, None
+    wall = time.perf_counter() - t0
+    c1 = ChildCpuTime()
+    cpu = None if c0 is None else (c1 - c0) / wall
+    return numFrames / wall, cpu
+
+
+def MeasureAll(cam_params_list, choices, frames, durationInSec):
+    # All cameras encoding at once, as during a recording
+    results = [None] * len(cam_params_list)
+
+    def Measure(n):
+        results[n] = MeasureEncoder(
+            cam_params_list[n], choices[n], frames[n], durationInSec
+        )
+
+    threads = [
+        threading.Thread(target=Measure, args=(n,)) for n in range(len(cam_params_list))
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    # CPU time of concurrent children can't be split per camera
+    return [fps for fps, cpu in results]
+
+
+def FormatCandidate(candidate):
+    device = "CPU" if candidate["gpuID"] == -1 else "GPU {}".format(candidate["gpuID"])
+    return "{} q{} {} preset {}".format(
+        candidate["codec"], candidate["quality"], device, candidate["preset"]
+    )
+
+
+def TuneCameras(
+    cam_params_list, frames, gpuIDs, margin, durationInSec, codecs=None, qualities=None
+):
+    # Solo pass: every candidate on every camera
+    passing = []
+    for cam_params, cam_frames in zip(cam_params_list, frames):
+        required = cam_params["frameRate"] * margin
+        cam_passing = []
+        for candidate in Candidates(cam_params, gpuIDs, codecs, qualities):
+            fps, cpu = MeasureEncoder(cam_params, candidate, cam_frames, durationInSec)
+            ok = fps >= required
+            console.log(
+                "{} {}x{}: {:<34} {:8.1f} fps  {}  {}".format(
+                    cam_params["cameraName"],
+                    cam_params["frameWidth"],
+                    cam_params["frameHeight"],
+                    FormatCandidate(candidate),
+                    fps,
+                    "" if cpu is None else "{:5.2f} cores".format(cpu),
+                    "ok" if ok else "too slow" if fps > 0 else "failed",
+                )
+            )
+            if ok:
+                cam_passing.append(candidate)
+        if not cam_passing:
+            console.log(
+                "{}: no encoder setup reaches {:.1f} fps.".format(
+                    cam_params["cameraName"], required
+                )
+            )
+            return None
+        passing.append(cam_passing)
+
+    # Joint pass: move cameras that fall behind to their next faster setup
+    index = [0] * len(cam_params_list)
+    while True:
+        choices = [cam_passing[i] for cam_passing, i in zip(passing, index)]
+        fps = MeasureAll(cam_params_list, choices, frames, durationInSec)
+        behind = [
+            n
+            for n, cam_params in enumerate(cam_params_list)
+            if fps[n] < cam_params["frameRate"] * margin
+        ]
+        for n, cam_params in enumerate(cam_params_list):
+            console.log(
+                "All cameras: {} {:<34} {:8.1f} fps".format(
+                    cam_params["cameraName"], FormatCandidate(choices[n]), fps[n]
+                )
+            )
+        if not behind:
+            return choices
+        moved = False
+        for n in behind:
+            if index[n] + 1 < len(passing[n]):
+                index[n] += 1
+                moved = True
+        if not moved:
+            console.log("Cameras can't all be real-time at once on this machine.")
+            return None
+
+
+def PerCamera(values):
+    # Single value when all cameras agree, else a list per camera
+    if all(value == values[0] for value in values):
+        return values[0]
+    return values
+
+
+def WriteConfig(config_path, output_path, choices, margin):
+    config = configurator.LoadConfig(config_path)
+    for key in ["codec", "quality", "gpuID", "preset"]:
+        config[key] = PerCamera([choice[key] for choice in choices])
+    with open(output_path, "w") as f:
+        f.write(
+            "# Autotuned from {} on {} (margin {:.2f})\n".format(
+                config_path, get_datetime(), margin
+            )
+        )
+        yaml.safe_dump(config, f, sort_keys=False)
+    console.log("Saved autotuned config to: " + output_path)
+
+
+def Main():
+    parser = ArgumentParser(
+        description="Campy encoder autotuner",
+        formatter_class=ArgumentDefaultsHelpFormatter,
+    )
+    clargs = ParseClargs(parser)
+    params = configurator.CombineConfigAndClargs(clargs)
+    for key in AUTOTUNE_ARGS:
+        params.pop(key, None)
+    if params["ffmpegPath"] != "None":
+        os.environ["IMAGEIO_FFMPEG_EXE"] = params["ffmpegPath"]
+
+    # Camera params without opening any camera
+    cam_params_list = []
+    for n_cam in range(params["numCams"]):
+        cam_params = configurator.ResolveCamParams(params, n_cam)
+        cam_params["ffmpegLogLevel"] = "quiet"
+        cam_params_list.append(cam_params)
+
+    gpuIDs = clargs.gpuIDs
+    if gpuIDs is None:
+        gpuIDs = sorted(
+            set(c["gpuID"] for c in cam_params_list if c["gpuID"] != -1)
+        )
+
+    frames, cache = [], {}
+    for cam_params in cam_params_list:
+        key = (
+            cam_params["frameWidth"],
+            cam_params["frameHeight"],
+            cam_params["pixelFormatInput"],
+        )
+        if key not in cache:
+            if clargs.sampleVideo is not None:
+                cache[key] = SampleFrames(clargs.sampleVideo, cam_params)
+            else:
+                cache[key] = SyntheticFrames(cam_params)
+        frames.append(cache[key])
+
+    choices = TuneCameras(
+        cam_params_list,
+        frames,
+        gpuIDs,
+        clargs.margin,
+        clargs.durationInSec,
+        clargs.codecs,
+        clargs.qualities,
+    )
+    if choices is None:
+        return
+
+    output_path = clargs.output
+    if output_path is None:
+        output_path = Path(clargs.config).with_suffix(".autotuned.yaml").as_posix()
+    WriteConfig(clargs.config, output_path, choices, clargs.margin)
@@ -3,6 +3,7 @@
 import pypylon.pylon as pylon
 import pypylon.genicam as geni
 from campy.cameras import unicam
+from campy import preview
 import os, sys, time, logging
 import numpy as np
 from collections import deque
@@ -73,9 +74,34 @@ def StartGrabbing(camera):
 		return False
 
 
-def GrabFrame(camera, frameNumber):
+def GrabSucceeded(grabResult):
+	# Failed grabs (e.g. incomplete frames) go back to the camera, nobody else will
+	if grabResult.GrabSucceeded():
+		return True
+	print("Grab failed with error %d: %s" % (grabResult.ErrorCode, grabResult.ErrorDescription))
+	grabResult.Release()
+	return False
+
+
+def GrabFrame(camera, frameNumber, timeoutInMs):
+	# Wait for the next frame; None if none arrived within the timeout or it failed
+	grabResult = camera.RetrieveResult(timeoutInMs, pylon.TimeoutHandling_Return)
+	if not grabResult.IsValid() or not GrabSucceeded(grabResult):
+		return None
+	return grabResult
 
-	return camera.RetrieveResult(0, pylon.TimeoutHandling_ThrowException)
+
+def GrabBatch(camera, timeoutInMs, maxFrames):
+	# Wait for the next frame, then take up to maxFrames already waiting in the buffer
+	batch = []
+	grabResult = camera.RetrieveResult(timeoutInMs, pylon.TimeoutHandling_Return)
+	while grabResult.IsValid():
+		if GrabSucceeded(grabResult):
+			batch.append(grabResult)
+			if len(batch) == maxFrames:
+				break
+		grabResult = camera.RetrieveResult(0, pylon.TimeoutHandling_Return)
+	return batch
 
 
 def GetImageArray(grabResult):
@@ -88,22 +114,19 @@ def GetTimeStamp(grabResult):
 	return grabResult.TimeStamp*1e-9
 
 
+def GetFrameID(grabResult):
+	# Stream block counter, incremented by the camera for every frame it sends
+	return grabResult.BlockID
+
+
 def DisplayImage(cam_params, dispQueue, grabResult):
 	# Basler display window is more performant than generic matplot figure
 	if sys.platform == 'win32':
 		dispQueue.SetImage(grabResult)
 		dispQueue.Show()
 	else:
-		# If pixelformat is bayer, first convert result to RGB
-		if cam_params["pixelFormatInput"].find("bayer") != -1:
-			converter = pylon.ImageFormatConverter()
-			converter.OutputPixelFormat = pylon.PixelType_RGB8packed
-			img = converter.Convert(grabResult).GetArray()
-		else:
-			img = grabResult.GetArray()
-
-		# Downsample image
-		img = img[::cam_params["displayDownsample"],::cam_params["displayDownsample"]]
+		# Downsample image (Bayer is binned straight to RGB)
+		img = preview.PreviewImage(cam_params, GetImageArray(grabResult))
 
 		# Send image to display window thru queue
 		dispQueue.append(img)
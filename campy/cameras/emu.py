@@ -1,30 +1,89 @@
 """
-
+Emulated camera. Frames from a video file (or a synthetic pattern if there is no
+video) are delivered by a thread at frameRate into a buffer of bufferSize frames,
+like a camera SDK, so grabbing, display and encoding can be tested without hardware.
 """
 
 from campy.cameras import unicam
+from campy.framering import FrameShape
+from campy import preview
 import os
 import time
 import logging
 import sys
+import threading
 import numpy as np
 from collections import deque
 import csv
-import imageio
+
+
+class EmulatedCamera:
+	def __init__(self, frames, frameRate, bufferSize):
+		self.frames = frames
+		self.period = 1.0 / frameRate
+		self.buffer = deque()
+		self.bufferSize = bufferSize
+		self.overwritten = 0
+		self.ready = threading.Condition()
+		self.onFrame = None
+		self.running = False
+
+	def Start(self, onFrame=None):
+		self.onFrame = onFrame
+		self.running = True
+		threading.Thread(target=self.Run, daemon=True).start()
+
+	def Stop(self):
+		self.running = False
+
+	def Run(self):
+		n = 0
+		nextTime = time.perf_counter()
+		while self.running:
+			nextTime += self.period
+			delay = nextTime - time.perf_counter()
+			if delay > 0:
+				time.sleep(delay)
+
+			# Grab result: image, the time it became available and a frame ID
+			grabResult = (self.frames[n % len(self.frames)], time.perf_counter(), n)
+			n += 1
+			if self.onFrame is not None:
+				self.onFrame(grabResult)
+				continue
+			with self.ready:
+				if len(self.buffer) >= self.bufferSize:
+					self.buffer.popleft()
+					self.overwritten += 1
+				self.buffer.append(grabResult)
+				self.ready.notify()
+
+	def RetrieveBatch(self, timeoutInMs, maxFrames):
+		with self.ready:
+			if not self.ready.wait_for(lambda: self.buffer, timeoutInMs / 1000):
+				return []
+			return [self.buffer.popleft() for i in range(min(len(self.buffer), maxFrames))]
+
+	def Retrieve(self, timeoutInMs):
+		with self.ready:
+			if not self.ready.wait_for(lambda: self.buffer, timeoutInMs / 1000):
+				return None
+			return self.buffer.popleft()
+
 
 def LoadSystem(params):
 
-	return params["cameraMake"]
+	return params["numCams"]
 
 
 def GetDeviceList(system):
 
-	return system
+	return ["Emulated{}".format(n) for n in range(system)]
 
 
-def LoadDevice(cam_params):
-
-	return cam_params["device"]
+def LoadDevice(systems, params, cam_params):
+	cam_params["camera"] = cam_params["device"]
+	return cam_params
 
 
 def GetSerialNumber(device):
@@ -37,16 +96,44 @@ def GetModelName(camera):
 	return "Emulated_Camera"
 
 
-def OpenCamera(cam_params, device):
-	# Open video reader for emulation
+def LoadFrames(cam_params, numFrames=0):
+	# Frames of a previous recording of this camera if there is one (all of them if
+	# numFrames is 0), else numFrames (default 100) of a moving gradient
 	videoFileName = cam_params["videoFilename"][3:len(cam_params["videoFilename"])]
 	full_file_name = os.path.join(cam_params["videoFolder"], cam_params["cameraName"], videoFileName)
-	camera = imageio.get_reader(full_file_name)
+	if os.path.isfile(full_file_name):
+		import imageio
+		reader = imageio.get_reader(full_file_name)
+		frames = []
+		for img in reader:
+			if cam_params["pixelFormatInput"] == "gray" and img.ndim == 3:
+				img = np.ascontiguousarray(img[:, :, 0])
+			frames.append(img)
+			if len(frames) == numFrames:
+				break
+		reader.close()
+		return frames
+
+	numFrames = numFrames or 100
+	shape, dtype = FrameShape(cam_params)
+	gradient = np.add.outer(np.arange(shape[0]), np.arange(shape[1]))
+	frames = []
+	for i in range(numFrames):
+		img = ((gradient + 4 * i) % 256).astype(dtype)
+		if len(shape) == 3:
+			img = np.repeat(img[:, :, None], shape[2], axis=2)
+		frames.append(img)
+	return frames
+
+
+def OpenCamera(cam_params):
+	frames = LoadFrames(cam_params, cam_params["emuNumFrames"])
+	camera = EmulatedCamera(frames, cam_params["frameRate"], cam_params["bufferSize"])
 
 	# Set features manually or automatically, depending on configuration
-	frame_size = camera.get_meta_data()['size']
-	cam_params['frameWidth'] = frame_size[0]
-	cam_params['frameHeight'] = frame_size[1]
+	cam_params['frameHeight'] = frames[0].shape[0]
+	cam_params['frameWidth'] = frames[0].shape[1]
+	cam_params['cameraModel'] = GetModelName(camera)
 
 	print("Opened {} emulation.".format(cam_params["cameraName"]))
 	return camera, cam_params
@@ -58,28 +145,49 @@ def LoadSettings(cam_params, camera):
 
 
 def StartGrabbing(camera):
+	camera.Start()
+	return True
+
 
+def StartGrabLoop(camera, onFrame):
+	# The emulator's frame thread calls onFrame with each grab result as it arrives
+	camera.Start(onFrame)
 	return True
 
 
-def GrabFrame(camera, frameNumber):
+def GrabFrame(camera, frameNumber, timeoutInMs):
 
-	return camera.get_data(frameNumber)
+	return camera.Retrieve(timeoutInMs)
+
+
+def GrabBatch(camera, timeoutInMs, maxFrames):
+
+	return camera.RetrieveBatch(timeoutInMs, maxFrames)
 
 
 def GetImageArray(grabResult):
 
-	return grabResult
+	return grabResult[0]
+
+
+def GetImageView(grabResult):
+
+	return grabResult[0]
 
 
 def GetTimeStamp(grabResult):
 
-	return time.perf_counter()
+	return grabResult[1]
+
+
+def GetFrameID(grabResult):
+	# Frames overwritten in a full buffer show up as frame ID gaps
+	return grabResult[2]
 
 
 def DisplayImage(cam_params, dispQueue, grabResult):
-	# Downsample image
-	img = grabResult[::cam_params["displayDownsample"],::cam_params["displayDownsample"],:]
+	# Downsample image (Bayer is binned straight to RGB)
+	img = preview.PreviewImage(cam_params, grabResult[0])
 
 	# Send to display queue
 	dispQueue.append(img)
@@ -93,7 +201,9 @@ def ReleaseFrame(grabResult):
 def CloseCamera(cam_params, camera):
 	print('Closing {}... Please wait.'.format(cam_params["cameraName"]))
 	# Close camera after acquisition stops
-	del camera
+	camera.Stop()
+	if camera.overwritten:
+		print('{} emulation overwrote {} frames in its full buffer.'.format(cam_params["cameraName"], camera.overwritten))
 
 
 def CloseSystem(system, device_list):
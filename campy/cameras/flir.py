@@ -2,6 +2,7 @@
 """
 import PySpin
 from campy.cameras import unicam
+from campy import preview
 import os, sys, time, logging
 import numpy as np
 
@@ -105,20 +106,53 @@ def StartGrabbing(camera):
 		return False
 
 
-def GrabFrame(camera, frameNumber):
-	image_result = camera.GetNextImage()
+def GrabFrame(camera, frameNumber, timeoutInMs):
+	# Wait for the next frame; None if none arrived within the timeout
+	try:
+		image_result = camera.GetNextImage(timeoutInMs)
+	except PySpin.SpinnakerException as e:
+		if e.errorcode == PySpin.SPINNAKER_ERR_TIMEOUT:
+			return None
+		raise
 
 	#  Ensure image completion
 	if image_result.IsIncomplete():
 		image_status = image_result.GetImageStatus()
+		# Hand the buffer back to the camera, nobody else will
+		image_result.Release()
 		print("Image incomplete with image status %d ..." % image_status)
 		raise ImageNotCompleteException("Image not complete", image_status)
 
 	return image_result
 
 
+def GrabBatch(camera, timeoutInMs, maxFrames):
+	# Wait for the next frame, then take up to maxFrames already waiting in the buffer
+	image_result = GrabFrame(camera, 0, timeoutInMs)
+	if image_result is None:
+		return []
+	batch = [image_result]
+	node_ready = PySpin.CIntegerPtr(camera.GetTLStreamNodeMap().GetNode("StreamOutputBufferCount"))
+	if PySpin.IsAvailable(node_ready) and PySpin.IsReadable(node_ready):
+		for i in range(min(node_ready.GetValue(), maxFrames - 1)):
+			try:
+				image_result = GrabFrame(camera, 0, timeoutInMs)
+			except ImageNotCompleteException:
+				# Already released by GrabFrame; take the next buffered frame
+				continue
+			if image_result is None:
+				break
+			batch.append(image_result)
+	return batch
+
+
 def GetImageArray(grabResult):
+	# GetNDArray is a view into the image buffer; copy it so it outlives ReleaseFrame
+	return grabResult.GetNDArray().copy()
+
 
+def GetImageView(grabResult):
+	# Zero-copy view into the image buffer, valid until ReleaseFrame (lendFrames)
 	return grabResult.GetNDArray()
 
 
@@ -127,24 +161,17 @@ def GetTimeStamp(grabResult):
 	return grabResult.GetChunkData().GetTimestamp() * 1e-9
 
 
-def GetFrameID(chunkData):
-
-	return chunkData.GetFrameID()
+def GetFrameID(grabResult):
+	# Hardware frame counter from the FrameID chunk (enabled in ConfigureChunkData)
+	return grabResult.GetChunkData().GetFrameID()
 
 
 def DisplayImage(cam_params, dispQueue, grabResult):
 	try:
-		if cam_params["pixelFormatInput"] == "bayer_rggb8" \
-		or cam_params["pixelFormatInput"] == "bayer_bggr8" \
-		or cam_params["pixelFormatInput"] == "gray":
-			# Convert to RGB
-			grabResult = grabResult.Convert(PySpin.PixelFormat_RGB8, PySpin.HQ_LINEAR)
-
-		# Convert to Numpy array
-		img = GetImageArray(grabResult)
-
-		# Downsample image
-		img = img[::cam_params["displayDownsample"], ::cam_params["displayDownsample"]]
+		# Downsample the raw frame (Bayer is binned to RGB; OpenCamera sets BayerRG8
+		# for either Bayer format). The preview slot copies it before it is released
+		pattern = "rggb" if preview.BayerPattern(cam_params["pixelFormatInput"]) else None
+		img = preview.PreviewImage(cam_params, GetImageView(grabResult), pattern)
 
 		# Send to display queue
 		dispQueue.append(img)
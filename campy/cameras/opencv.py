@@ -10,7 +10,6 @@
 import numpy as np
 from collections import deque
 import csv
-import imageio
 import cv2
 
 
@@ -81,7 +80,8 @@ def StartGrabbing(camera):
     return True
 
 
-def GrabFrame(camera, frameNumber):
+def GrabFrame(camera, frameNumber, timeoutInMs):
+    # read() blocks until the next frame
 
     success, img = camera.read()
     img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)  # BGR -> RGB
@@ -3,18 +3,23 @@
 reduce redundancy in campy code.
 """
 
-import os, sys, time, csv, logging
+import os, sys, time, csv, json, logging, queue
 import numpy as np
 from collections import deque
-from scipy import io as sio
 from rich.pretty import pprint
 from rich.console import Console
 from datetime import timedelta
 import traceback
+from campy.frametimes import FrameTimes
+from campy.framestats import FrameStats, FrameIDGaps
+from campy import placement, readiness
 
 
 console = Console()
 
+# Camera systems loaded by OpenDevice in a worker process, by make
+workerSystems = {}
+
 
 def ImportCam(make):
     if make == "basler":
@@ -62,10 +67,52 @@ def LoadDevice(systems, params, cam_params):
     return cam_params
 
 
-def OpenCamera(cam_params, stopWriteQueue):
+def OpenDevice(cam_params):
+    """
+    Load the device of a camera launch plan in a worker process. Only the camera's
+    own system is loaded (once per process). The device is found by serial number,
+    since enumeration order can differ between processes.
+    """
+    cam_make = cam_params["cameraMake"]
+    try:
+        cam = ImportCam(cam_make)
+        if cam_make not in workerSystems:
+            system = cam.LoadSystem(cam_params)
+            workerSystems[cam_make] = {"system": system}
+            GetDeviceList(workerSystems, {"cameraMake": cam_make})
+
+        serials = workerSystems[cam_make]["serials"]
+        cam_idx = cam_params["cameraSelection"]
+        if cam_idx >= len(serials) or serials[cam_idx] != cam_params["cameraSerialNo"]:
+            if cam_params["cameraSerialNo"] not in serials:
+                raise ValueError(
+                    "{} serial# {} not found.".format(
+                        cam_params["cameraName"], cam_params["cameraSerialNo"]
+                    )
+                )
+            cam_idx = serials.index(cam_params["cameraSerialNo"])
+        cam_params["device"] = workerSystems[cam_make]["deviceList"][cam_idx]
+        cam_params = cam.LoadDevice(workerSystems, cam_params, cam_params)
+    except Exception as e:
+        console.log(
+            "Caught exception at camera/unicam.py OpenDevice:\n" + traceback.format_exc()
+        )
+        raise
+    return cam_params
+
+
+def CloseDevices():
+    # Release the systems loaded by OpenDevice in this worker process
+    for cam_make, system in workerSystems.items():
+        ImportCam(cam_make).CloseSystem(system["system"], system["deviceList"])
+    workerSystems.clear()
+
+
+def OpenCamera(cam_params, writeQueue):
     # Import the cam module
     cam = ImportCam(cam_params["cameraMake"])
 
+    camera = None
     try:
         camera, cam_params = cam.OpenCamera(cam_params)
 
@@ -82,7 +129,7 @@ def OpenCamera(cam_params, stopWriteQueue):
         console.log(
             "Caught error at cameras/unicam.py OpenCamera:\n" + traceback.format_exc()
         )
-        stopWriteQueue.append("STOP")
+        writeQueue.put_stop()
 
     return cam, camera, cam_params
 
@@ -112,8 +159,6 @@ def GetMakeList(params):
 
 def GrabData(cam_params):
     grabdata = {}
-    grabdata["timeStamp"] = []
-    grabdata["frameNumber"] = []
     grabdata["cameraName"] = cam_params["cameraName"]
 
     # Calculate display rate
@@ -137,97 +182,271 @@ def GrabData(cam_params):
         round(cam_params["chunkLengthInSec"] * cam_params["frameRate"])
     )
 
+    # Frame numbers and timestamps, streamed to frametimes.npy while grabbing
+    grabdata["frameTimes"] = FrameTimes(
+        os.path.join(cam_params["videoFolder"], cam_params["cameraName"])
+    )
+
+    # Frame rate and jitter statistics, updated in constant time per frame
+    grabdata["frameStats"] = FrameStats(
+        cam_params["frameRate"], cam_params["missedTriggerThreshold"]
+    )
+    grabdata["nextReport"] = grabdata["chunkLengthInFrames"]
+
+    # Hardware frame ID gaps, for drivers that report frame IDs (see GrabFrames)
+    grabdata["frameIDGaps"] = None
+
     return grabdata
 
 
 def StartGrabbing(camera, cam_params, cam):
-    grabbing = cam.StartGrabbing(camera)
+    # Returns whether grabbing started and a grab(frameNumber) function that waits
+    # up to grabTimeoutInMs for the next frame. It returns a list of grab results:
+    # the next frame plus any backlog in the camera buffer (up to bufferSize),
+    # or an empty list if no frame arrived.
+    timeoutInMs = cam_params["grabTimeoutInMs"]
+    maxFrames = max(1, cam_params["bufferSize"])
+    if cam_params["grabMode"] == "callback" and hasattr(cam, "StartGrabLoop"):
+        # The SDK's grab thread hands each frame to a queue as it arrives
+        frames = queue.SimpleQueue()
+        grabbing = cam.StartGrabLoop(camera, frames.put)
+
+        def grab(frameNumber):
+            try:
+                batch = [frames.get(timeout=timeoutInMs / 1000)]
+            except queue.Empty:
+                return []
+            for i in range(min(frames.qsize(), maxFrames - 1)):
+                batch.append(frames.get_nowait())
+            return batch
+
+    elif hasattr(cam, "GrabBatch"):
+        grabbing = cam.StartGrabbing(camera)
+
+        def grab(frameNumber):
+            return cam.GrabBatch(camera, timeoutInMs, maxFrames)
+
+    else:
+        if cam_params["grabMode"] == "callback":
+            console.log(
+                f"{cam_params['cameraMake']} cameras have no callback grab mode. "
+                "Using blocking grabs."
+            )
+        grabbing = cam.StartGrabbing(camera)
+
+        def grab(frameNumber):
+            grabResult = cam.GrabFrame(camera, frameNumber, timeoutInMs)
+            return [] if grabResult is None else [grabResult]
+
     if grabbing:
         print(cam_params["cameraName"], "ready to trigger.")
-    return grabbing
+    return grabbing, grab
 
 
 def CountFPS(grabdata, frameNumber, timeStamp):
-    if frameNumber % grabdata["chunkLengthInFrames"] == 0:
-        elapsed = timeStamp - grabdata["timeStamp"][0]
-        elapsed_min, elapsed_sec = divmod(elapsed, 60)
-        elapsed_hour, elapsed_min = divmod(elapsed_min, 60)
-
-        frame_count = len(grabdata["timeStamp"])
-
-        ts = grabdata["timeStamp"]
-        if len(ts) > grabdata["chunkLengthInFrames"]:
-            ts = ts[-grabdata["chunkLengthInFrames"] :]
-        dts = np.abs(np.diff(ts))
-        fps = 1 / dts
-        fps_avg = fps.mean()
-        fps_std = fps.std()
-
-        sep = " [grey70]|[/grey70] "
-        console.log(
-            "".join(
-                [
-                    f"[bold]{grabdata['cameraName']}[/bold]",
-                    sep,
-                    "[bold]Session:[/bold] ",
-                    f"{int(elapsed_hour):02}:{int(elapsed_min):02}:{int(elapsed_sec):02}",
-                    sep,
-                    f"[bold]Frames:[/bold] {frame_count:,}",
-                    sep,
-                    f"[bold]FPS:[/bold] {fps_avg:.1f} +- {fps_std:.1f}",
-                ]
+    # Called by GrabFrames every chunkLengthInFrames frames
+    grabdata["nextReport"] = frameNumber + grabdata["chunkLengthInFrames"]
+    frameTimes = grabdata["frameTimes"]
+    frameStats = grabdata["frameStats"]
+    elapsed = timeStamp - frameTimes.firstTimeStamp
+    elapsed_min, elapsed_sec = divmod(elapsed, 60)
+    elapsed_hour, elapsed_min = divmod(elapsed_min, 60)
+
+    frame_count = frameTimes.count
+
+    fps_avg, fps_std = frameStats.chunk()
+
+    sep = " [grey70]|[/grey70] "
+    lost_stats = []
+    if grabdata["frameIDGaps"] is not None:
+        lost_stats = [sep, f"[bold]Lost:[/bold] {grabdata['frameIDGaps'].lost:,}"]
+    spool_stats = []
+    if grabdata["writeQueue"].policy == "Spill":
+        spool_depth, drain_rate = grabdata["writeQueue"].spool_stats()
+        spool_stats = [
+            sep,
+            f"[bold]Spool:[/bold] {spool_depth:,} frames, draining {drain_rate:.1f} fps",
+        ]
+    encoder_stats = []
+    progress = grabdata["writeQueue"].progress()
+    if progress:
+        # Frames queued for the encoder but not yet encoded
+        lag = frame_count - len(grabdata["droppedFrames"]) - progress["frame"]
+        encoder_stats = [
+            sep,
+            f"[bold]Encoder:[/bold] {progress['frame']:,} frames, "
+            f"{progress['fps']:.1f} fps, {progress['speed']:.2f}x, ",
+        ]
+        # Output size is not known to ffmpeg for segmented videos
+        if progress["totalSize"] > 0:
+            encoder_stats.append(
+                f"{progress['bitrate'] / 1000:.1f} Mbit/s, "
+                f"{progress['totalSize'] / 2**20:,.0f} MB, "
             )
+        encoder_stats.append(f"lag {lag:,}")
+    console.log(
+        "".join(
+            [
+                f"[bold]{grabdata['cameraName']}[/bold]",
+                sep,
+                "[bold]Session:[/bold] ",
+                f"{int(elapsed_hour):02}:{int(elapsed_min):02}:{int(elapsed_sec):02}",
+                sep,
+                f"[bold]Frames:[/bold] {frame_count:,}",
+                sep,
+                f"[bold]FPS:[/bold] {fps_avg:.1f} +- {fps_std:.1f}",
+                sep,
+                f"[bold]Dropped:[/bold] {len(grabdata['droppedFrames']):,}",
+                sep,
+                f"[bold]Missed:[/bold] {frameStats.missed:,}",
+            ]
+            + lost_stats
+            + spool_stats
+            + encoder_stats
         )
+    )
+
+
+def LendFrames(cam, cam_params, writeQueue):
+    # Pass frames to the writer as views into camera buffers, released once written
+    if not hasattr(cam, "GetImageView"):
+        console.log(
+            f"{cam_params['cameraMake']} cameras can't lend frame buffers. Copying frames."
+        )
+        return False
+    if not hasattr(writeQueue, "lend"):
+        # Frames are copied into the writer process's ring anyway
+        return False
+    writeQueue.lend(cam.ReleaseFrame, max(1, cam_params["bufferSize"] // 2))
+    return True
+
+
+def GrabFrames(cam_params, writeQueue, dispQueue, readyQueue=None):
+    t0 = time.perf_counter()
 
+    # Pin the grab thread before opening the camera, so SDK threads inherit its placement
+    placement.PlaceGrabThread(cam_params)
 
-def GrabFrames(cam_params, writeQueue, dispQueue, stopReadQueue, stopWriteQueue):
     # Open the camera object
-    cam, camera, cam_params = OpenCamera(cam_params, stopWriteQueue)
+    cam, camera, cam_params = OpenCamera(cam_params, writeQueue)
+    if camera is None:
+        # OpenCamera already told the writer to stop
+        readiness.Report(
+            readyQueue,
+            cam_params["cameraName"],
+            readiness.FAILED,
+            time.perf_counter() - t0,
+        )
+        return
 
     console.log("Camera parameters:")
     pprint(cam_params)
     print()
 
     # Use Basler's default display window on Windows. Not supported on Linux
-    if sys.platform == "win32" and cam_params["cameraMake"] == "basler":
+    headless = cam_params["displayFrameRate"] <= 0
+    if (
+        sys.platform == "win32"
+        and cam_params["cameraMake"] == "basler"
+        and not headless
+    ):
         dispQueue = cam.OpenPylonImageWindow(cam_params)
 
     # Create dictionary for appending frame number and timestamp information
     grabdata = GrabData(cam_params)
+    grabdata["droppedFrames"] = writeQueue.dropped
+    grabdata["writeQueue"] = writeQueue
+
+    # Frames dropped by the camera show up as gaps in its hardware frame IDs
+    if hasattr(cam, "GetFrameID"):
+        grabdata["frameIDGaps"] = FrameIDGaps()
+    frameIDGaps = grabdata["frameIDGaps"]
+
+    # Lend camera buffers to the writer instead of copying frames if configured
+    lending = cam_params["lendFrames"] and LendFrames(cam, cam_params, writeQueue)
+    grabdata["lending"] = lending
+    GetImage = cam.GetImageView if lending else cam.GetImageArray
 
     # Start grabbing frames from the camera
-    grabbing = StartGrabbing(camera, cam_params, cam)
+    grabbing, grab = StartGrabbing(camera, cam_params, cam)
+    readiness.Report(
+        readyQueue,
+        cam_params["cameraName"],
+        "armed" if grabbing else readiness.FAILED,
+        time.perf_counter() - t0,
+    )
 
+    frameTimes = grabdata["frameTimes"]
+    frameStats = grabdata["frameStats"]
     frameNumber = 0
     firstTimeStamp = None
-    while not stopReadQueue:
+    done = False
+    while grabbing and not writeQueue.stop_requested:
         try:
-            # Grab image from camera buffer if available
-            grabResult = cam.GrabFrame(camera, frameNumber)
-            img = cam.GetImageArray(grabResult)
-
-            # Append timeStamp and frameNumber to grabdata
-            frameNumber += 1
-            grabdata["frameNumber"].append(frameNumber)  # first frame = 1
-            timeStamp = cam.GetTimeStamp(grabResult)
-            grabdata["timeStamp"].append(timeStamp)
-            if firstTimeStamp is None:
-                firstTimeStamp = timeStamp
-
-            # Append numpy array to writeQueue for writer to append to file
-            writeQueue.append((frameNumber, timeStamp, img))
-
-            # Display converted, downsampled image in the Window
-            if frameNumber % grabdata["frameRatio"] == 0:
-                img = cam.DisplayImage(cam_params, dispQueue, grabResult)
-
-            CountFPS(grabdata, frameNumber, timeStamp)
-
-            cam.ReleaseFrame(grabResult)
-
-            if (frameNumber >= grabdata["numImagesToGrab"]) or (
-                (timeStamp - firstTimeStamp) >= cam_params["recTimeInSec"]
-            ):
+            # Wait for the next image, taking any backlog in the camera buffer with it
+            grabResults = grab(frameNumber)
+            if not grabResults:
+                continue
+
+            # Results not handed to the writer are released, even on errors
+            handed = 0
+            try:
+                # Append timeStamp and frameNumber to grabdata (first frame = 1)
+                items = []
+                for grabResult in grabResults:
+                    # Read the frame before any bookkeeping, so a frame that fails
+                    # here is dropped from both the metadata and the video
+                    try:
+                        timeStamp = cam.GetTimeStamp(grabResult)
+                        img = GetImage(grabResult)
+                        frameID = None
+                        if frameIDGaps is not None:
+                            frameID = cam.GetFrameID(grabResult)
+                    except Exception:
+                        if cam_params["cameraDebug"]:
+                            console.log(
+                                "Dropped a frame at cameras/unicam.py GrabFrames:\n"
+                                + traceback.format_exc()
+                            )
+                        break
+                    if firstTimeStamp is None:
+                        firstTimeStamp = timeStamp
+                    frameNumber += 1
+                    frameTimes.append(frameNumber, timeStamp)
+                    frameStats.update(timeStamp)
+                    flags = 0
+                    if frameID is not None:
+                        flags = frameIDGaps.update(frameNumber, frameID)
+                    items.append((frameNumber, timeStamp, img, flags))
+                    if (frameNumber >= grabdata["numImagesToGrab"]) or (
+                        (timeStamp - firstTimeStamp) >= cam_params["recTimeInSec"]
+                    ):
+                        done = True
+                        break
+                if not items:
+                    continue
+
+                # Display the newest frame if the batch reached a display frame
+                if frameNumber // grabdata["frameRatio"] > (
+                    frameNumber - len(items)
+                ) // grabdata["frameRatio"]:
+                    cam.DisplayImage(cam_params, dispQueue, grabResults[len(items) - 1])
+
+                # Put numpy arrays in writeQueue for writer to append to file.
+                # Lent buffers are released by the write queue once written.
+                if lending:
+                    writeQueue.put_batch(items, grabResults=grabResults[: len(items)])
+                    handed = len(items)
+                else:
+                    writeQueue.put_batch(items)
+            finally:
+                for grabResult in grabResults[handed:]:
+                    cam.ReleaseFrame(grabResult)
+
+            if frameNumber >= grabdata["nextReport"]:
+                CountFPS(grabdata, frameNumber, items[-1][1])
+
+            if done:
                 break
 
         except Exception as e:
@@ -239,48 +458,93 @@ def GrabFrames(cam_params, writeQueue, dispQueue, stopReadQueue, stopWriteQueue)
             time.sleep(0.001)
 
     # Close the camaera, save metadata, and tell writer and display to close
+    if lending and not writeQueue.wait_lent(timeout=10):
+        console.log(
+            f"{cam_params['cameraName']}: writer still holds camera buffers at close."
+        )
     cam.CloseCamera(cam_params, camera)
     SaveMetadata(cam_params, grabdata)
     if not sys.platform == "win32" or not cam_params["cameraMake"] == "basler":
         dispQueue.append("STOP")
-    stopWriteQueue.append("STOP")
+    writeQueue.put_stop()
 
 
 def SaveMetadata(cam_params, grabdata):
     full_folder_name = os.path.join(cam_params["videoFolder"], cam_params["cameraName"])
 
     try:
-        # Zero timeStamps
-        timeFirstGrab = grabdata["timeStamp"][0]
-        grabdata["timeStamp"] = [i - timeFirstGrab for i in grabdata["timeStamp"]]
+        # Frame data (with zeroed timeStamps) is already in frametimes.npy
+        frameTimes = grabdata["frameTimes"]
+        frameTimes.close()
 
         # Get the frame and time counts to save into metadata
-        frame_count = grabdata["frameNumber"][-1]
-        time_count = grabdata["timeStamp"][-1]
-        fps_count = frame_count / time_count
+        frame_count = frameTimes.lastFrameNumber
+        time_count = frameTimes.lastTimeStamp
+        # No frames at all if the start was aborted before the triggers
+        fps_count = frame_count / time_count if time_count > 0 else 0.0
         console.log(
             f"Camera {cam_params['cameraName']} saved {frame_count} "
             f"frames at {fps_count} fps."
         )
+        if grabdata["droppedFrames"]:
+            console.log(
+                f"Camera {cam_params['cameraName']} dropped "
+                f"{len(grabdata['droppedFrames'])} frames from the write queue."
+            )
 
         meta = cam_params
 
-        # Save frame data to numpy file
-        npy_filename = os.path.join(full_folder_name, "frametimes.npy")
-        x = np.array([grabdata["frameNumber"], grabdata["timeStamp"]])
-        np.save(npy_filename, x)
+        # Also save frame data to MATLAB file if configured (loads scipy)
+        if cam_params["frametimesMat"]:
+            from scipy import io as sio
+
+            x = frameTimes.load()
+            mat_filename = os.path.join(full_folder_name, "frametimes.mat")
+            matdata = {}
+            matdata["frameNumber"] = x[0]
+            matdata["timeStamp"] = x[1]
+            matdata["droppedFrames"] = grabdata["droppedFrames"]
+            sio.savemat(mat_filename, matdata, do_compression=True)
 
-        # Also save frame data to MATLAB file
-        mat_filename = os.path.join(full_folder_name, "frametimes.mat")
-        matdata = {}
-        matdata["frameNumber"] = grabdata["frameNumber"]
-        matdata["timeStamp"] = grabdata["timeStamp"]
-        sio.savemat(mat_filename, matdata, do_compression=True)
+        # Save numbers of frames dropped by the write queue (not in the video)
+        dropped_filename = os.path.join(full_folder_name, "droppedframes.npy")
+        np.save(dropped_filename, np.array(grabdata["droppedFrames"], dtype="int64"))
 
         # Save parameters and recording metadata to csv spreadsheet
         csv_filename = os.path.join(full_folder_name, "metadata.csv")
-        meta["totalFrames"] = grabdata["frameNumber"][-1]
-        meta["totalTime"] = grabdata["timeStamp"][-1]
+        meta["totalFrames"] = frame_count
+        meta["totalTime"] = time_count
+        meta["droppedFrames"] = len(grabdata["droppedFrames"])
+        spool = grabdata["writeQueue"].spool
+        if grabdata["lending"]:
+            meta["copiedFrames"] = grabdata["writeQueue"].copied
+        if spool is not None:
+            meta["spooledFrames"] = spool.spilled
+            meta["maxSpoolDepth"] = spool.maxDepth
+
+        # Frame interval statistics and hardware frame ID gaps, with the jitter
+        # histogram and the list of gaps in framestats.json
+        stats = grabdata["frameStats"].summary()
+        keys = [
+            "intervalMean",
+            "intervalStd",
+            "intervalMin",
+            "intervalMax",
+            "missedTriggers",
+        ]
+        frameIDGaps = grabdata["frameIDGaps"]
+        if frameIDGaps is not None:
+            stats.update(frameIDGaps.summary())
+            keys += ["frameIDGaps", "framesLostByCamera", "maxFrameIDGap"]
+            if frameIDGaps.lost:
+                console.log(
+                    f"Camera {cam_params['cameraName']} lost {frameIDGaps.lost} "
+                    f"frames in {frameIDGaps.numGaps} frame ID gaps."
+                )
+        with open(os.path.join(full_folder_name, "framestats.json"), "w") as f:
+            json.dump(stats, f, indent=1)
+        for key in keys:
+            meta[key] = stats[key]
 
         with open(csv_filename, "w", newline="") as f:
             w = csv.writer(f, delimiter=",", quoting=csv.QUOTE_ALL)
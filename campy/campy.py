@@ -19,11 +19,15 @@
 import os, time, sys, logging, threading, queue
 from collections import deque
 import multiprocessing as mp
-from functools import partial
-from campy import writer, display, configurator
+from campy import writer, configurator, scheduler, readiness
+from campy.framequeue import OpenWriteQueue
 from campy.trigger import trigger
 from campy.cameras import unicam
-from campy.utils.utils import HandleKeyboardInterrupt, get_datetime
+from campy.utils.utils import (
+    HandleKeyboardInterrupt,
+    QueueKeyboardInterrupt,
+    get_datetime,
+)
 
 
 def OpenSystems():
@@ -34,8 +38,8 @@ def OpenSystems():
     systems = unicam.LoadSystems(params)
     systems = unicam.GetDeviceList(systems, params)
 
-    # Start camera triggers if configured
-    systems = trigger.StartTriggers(systems, params)
+    # Connect to camera triggers if configured. They start once every camera is ready
+    systems = trigger.OpenTriggers(systems, params)
 
     return systems, params
 
@@ -45,27 +49,134 @@ def CloseSystems(systems, params):
     unicam.CloseSystems(systems, params)
 
 
-def AcquireOneCamera(n_cam, start_time=None):
-    # Initialize param dictionary for this camera stream
-    cam_params = configurator.ConfigureCamParams(
-        systems, params, n_cam, start_time=start_time
-    )
+def OpenWriterProcesses(cam_params_list, readyQueue):
+    # Shared-memory frame rings and writer processes for cameras with writerProcess
+    # enabled, and one mosaic writer process per mosaicGroup
+    rings, writers = {}, []
+    ctx = mp.get_context("spawn")
+    for n_cam, cam_params in enumerate(cam_params_list):
+        if not cam_params["writerProcess"] and cam_params["mosaicGroup"] < 0:
+            continue
 
-    # Initialize queues for display, video writer, and stop messages
-    dispQueue = deque([], 2)
-    writeQueue = deque()
-    stopReadQueue = deque([], 1)
-    stopWriteQueue = deque([], 1)
+        from campy.framering import FrameRing, RingSlots
 
-    # Start image window display thread
-    threading.Thread(
-        target=display.DisplayFrames,
-        daemon=True,
-        args=(
-            cam_params,
-            dispQueue,
-        ),
-    ).start()
+        rings[n_cam] = FrameRing(
+            cam_params, RingSlots(cam_params), policy=cam_params["writeQueuePolicy"]
+        )
+        if cam_params["mosaicGroup"] >= 0:
+            continue
+        w = ctx.Process(
+            target=writer.WriteFrames,
+            args=(
+                cam_params,
+                rings[n_cam],
+                readyQueue,
+            ),
+        )
+        w.start()
+        writers.append(w)
+
+    if any(cam_params["mosaicGroup"] >= 0 for cam_params in cam_params_list):
+        from campy import mosaic
+
+        for group in mosaic.MosaicGroups(cam_params_list).values():
+            w = ctx.Process(
+                target=mosaic.WriteMosaic,
+                args=(
+                    group,
+                    [rings[cam_params["n_cam"]] for cam_params in group],
+                    readyQueue,
+                ),
+            )
+            w.start()
+            writers.append(w)
+    return rings, writers
+
+
+def OpenLiveView(plans):
+    # Preview slots and one display process tiling every displayed camera
+    ctx = mp.get_context("spawn")
+    stop = ctx.Event()
+    if not any(cam_params["displayFrameRate"] > 0 for cam_params in plans):
+        return {}, None, stop
+
+    from campy import liveview
+
+    views = liveview.PreviewViews(plans)
+    slots = {n_cam: liveview.PreviewSlot(plans[n_cam]) for n_cam in views}
+    display = None
+    if slots:
+        display = ctx.Process(
+            target=liveview.DisplayMosaic,
+            args=(
+                list(slots.values()),
+                list(views.values()),
+                stop,
+            ),
+        )
+        display.start()
+    return slots, display, stop
+
+
+def CloseLiveView(slots, display, stop):
+    stop.set()
+    if display is not None:
+        display.join()
+    for slot in slots.values():
+        slot.unlink()
+
+
+def CloseWriterProcesses(rings, writers):
+    for w in writers:
+        w.join()
+    for ring in rings.values():
+        ring.unlink()
+
+
+def InitWorker(rings, ready, slots, abort):
+    # Frame rings, the readiness queue, preview slots and the abort event are handed
+    # to pool workers as they spawn (their semaphores can't be pickled later)
+    global frameRings, readyQueue, previewSlots, abortEvent
+    frameRings = rings
+    readyQueue = ready
+    previewSlots = slots
+    abortEvent = abort
+
+
+def StopOnAbort(writeQueue):
+    # Stop a camera when the start is aborted (another camera failed to get ready)
+    abortEvent.wait()
+    writeQueue.request_stop()
+
+
+def OpenPipeline(cam_params):
+    # The ring's writer process watches this process while waiting for frames
+    if cam_params["n_cam"] in frameRings:
+        frameRings[cam_params["n_cam"]].set_producer()
+
+    # Open this camera's device from its launch plan
+    cam_params = unicam.OpenDevice(cam_params)
+
+    # Initialize queue for video writer (carries stop messages in-band)
+    if cam_params["n_cam"] in frameRings:
+        writeQueue = frameRings[cam_params["n_cam"]]
+    else:
+        writeQueue = OpenWriteQueue(cam_params)
+    threading.Thread(target=StopOnAbort, daemon=True, args=(writeQueue,)).start()
+    return cam_params, writeQueue
+
+
+def RunPipeline(cam_params, writeQueue):
+    # Display frames go to the live view process (headless if displayFrameRate is 0)
+    dispQueue = previewSlots.get(cam_params["n_cam"], deque([], 2))
+
+    # Frames are encoded by a writer process reading from the shared-memory ring
+    if cam_params["n_cam"] in frameRings:
+        readQueue = {}
+        readQueue["queue"] = writeQueue
+        with QueueKeyboardInterrupt(readQueue):
+            unicam.GrabFrames(cam_params, writeQueue, dispQueue, readyQueue)
+        return
 
     # Start grabbing frames ("producer" thread)
     threading.Thread(
@@ -75,25 +186,93 @@ def AcquireOneCamera(n_cam, start_time=None):
             cam_params,
             writeQueue,
             dispQueue,
-            stopReadQueue,
-            stopWriteQueue,
+            readyQueue,
         ),
     ).start()
 
-    # Start video file writer (main "consumer" process)
-    writer.WriteFrames(cam_params, writeQueue, stopReadQueue, stopWriteQueue)
+    # Start video file writer ("consumer")
+    writer.WriteFrames(cam_params, writeQueue, readyQueue)
+
+
+def AcquireOneCamera(cam_params):
+    RunPipeline(*OpenPipeline(cam_params))
+
+
+def AcquireCameras(plans):
+    # One worker process runs the grab/write pipelines of one or more cameras
+    if len(plans) == 1:
+        AcquireOneCamera(plans[0])
+        unicam.CloseDevices()
+        return
+
+    pipelines = [OpenPipeline(cam_params) for cam_params in plans]
+    threads = [
+        threading.Thread(target=RunPipeline, daemon=True, args=pipeline)
+        for pipeline in pipelines
+    ]
+    for t in threads:
+        t.start()
+
+    # Signals reach the main thread only, which stops every camera in this worker
+    readQueue = {}
+    readQueue["queue"] = [writeQueue for _, writeQueue in pipelines]
+    with QueueKeyboardInterrupt(readQueue):
+        for t in threads:
+            while t.is_alive():
+                t.join(0.5)
+    unicam.CloseDevices()
 
 
 def Main():
+    # Config and devices are resolved once here. Workers only get their launch plans
+    t0 = time.perf_counter()
+    systems, params = OpenSystems()
+    print("Opened systems in {:.2f} s".format(time.perf_counter() - t0))
+
     with HandleKeyboardInterrupt():
-        # Acquire cameras in parallel with Windows- and Linux-compatible pool
-        p = mp.get_context("spawn").Pool(params["numCams"])
         start_time = get_datetime()
-        acquire = partial(AcquireOneCamera, start_time=start_time)
-        p.map_async(acquire, range(params["numCams"])).get()
+        plans = configurator.LaunchPlans(systems, params, start_time=start_time)
+        ctx = mp.get_context("spawn")
+        ready = ctx.Queue()
+        abort = ctx.Event()
+        rings, writers = OpenWriterProcesses(plans, ready)
+        slots, display, stopDisplay = OpenLiveView(plans)
+
+        # Cameras spread over worker processes (by default, one per camera)
+        groups = scheduler.WorkerGroups(
+            plans, params["numWorkers"], params["workerBandwidthInMBps"]
+        )
+        if len(groups) < params["numCams"]:
+            names = params["cameraNames"]
+            print("Camera workers:", [[names[n] for n in group] for group in groups])
+
+        # Acquire cameras in parallel with Windows- and Linux-compatible pool
+        p = ctx.Pool(
+            len(groups), initializer=InitWorker, initargs=(rings, ready, slots, abort)
+        )
+        launches = [[plans[n_cam] for n_cam in group] for group in groups]
+        acquiring = p.map_async(AcquireCameras, launches)
+
+        # Start the triggers once every camera is armed and its encoder warmed
+        cameraNames = [cam_params["cameraName"] for cam_params in plans]
+        status = readiness.WaitReady(
+            ready, cameraNames, t0, params["readyTimeoutInSec"]
+        )
+        if not status:
+            print("Not starting triggers. Stopping every camera...")
+            abort.set()
+        else:
+            systems = trigger.FireTriggers(systems, params)
+            print("Started triggers at {:.2f} s".format(time.perf_counter() - t0))
+        acquiring.get()
+
+        CloseWriterProcesses(rings, writers)
+        CloseLiveView(slots, display, stopDisplay)
 
     CloseSystems(systems, params)
 
 
-# Open systems, creates global 'systems' and 'params' variables
-systems, params = OpenSystems()
+frameRings = {}
+readyQueue = None
+previewSlots = {}
+abortEvent = None
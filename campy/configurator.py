@@ -3,7 +3,6 @@
 
 import os, ast, yaml, time, logging
 from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
-from campy.cameras import unicam
 from pathlib import Path
 from campy.utils.utils import get_datetime
 
@@ -19,8 +18,11 @@ def DefaultParams():
     params["numCams"] = 1
     params["videoFolder"] = "./test"
     params["videoFilename"] = "0.mp4"
+    params["frametimesMat"] = True
     params["frameRate"] = 100
     params["recTimeInSec"] = 10
+    params["numWorkers"] = 0  # 0: one process per camera, -1: auto
+    params["workerBandwidthInMBps"] = 500
 
     # Camera default parameters
     params["cameraMake"] = "basler"
@@ -28,12 +30,23 @@ def DefaultParams():
     params["frameWidth"] = 1152
     params["frameHeight"] = 1024
     params["cameraDebug"] = False
+    params["grabMode"] = "blocking"
+    params["grabTimeoutInMs"] = 100
+    params["emuNumFrames"] = 0  # 0: whole source recording
+
+    # CPU placement (Linux)
+    params["grabCpus"] = "None"  # "2-3" or "node0"
+    params["writerCpus"] = "None"
+    params["ffmpegCpus"] = "None"
+    params["grabPriority"] = 0
+    params["lockMemory"] = False
 
     # Flir camera default parameters
     params["cameraTrigger"] = "None"  # "Line3"
     params["cameraOut"] = 2
     params["bufferMode"] = "OldestFirst"
     params["bufferSize"] = 100
+    params["lendFrames"] = False
     params["cameraExposureTimeInUs"] = 1500
     params["cameraGain"] = 1
     params["disableGamma"] = True
@@ -45,6 +58,7 @@ def DefaultParams():
     # Compression default parameters
     params["ffmpegLogLevel"] = "quiet"
     params["ffmpegPath"] = "None"  # "/home/usr/Documents/ffmpeg/ffmpeg"
+    params["writerBackend"] = "native"  # "native" or "imageio"
     params["pixelFormatInput"] = "rgb24"  # "bayer_bggr8" "rgb24"
     params["pixelFormatOutput"] = "rgb0"
     params["gpuID"] = -1
@@ -53,10 +67,24 @@ def DefaultParams():
     params["quality"] = 21
     params["preset"] = "None"
     params["videoSegmentLengthInSec"] = 0
+    params["rawChunkLengthInSec"] = 60
+    params["numEncoders"] = 1
+    params["mosaicGroup"] = -1  # [0, 0, 0, 0, 1, 1, 1, 1]
+    params["gopSize"] = 0
+    params["videoRenditions"] = "None"  # [{"name": "preview", "downsample": 4, "quality": 28}]
+
+    # Grabber to writer queue parameters
+    params["writeQueueSize"] = 0
+    params["writeQueueSizeInMB"] = 0
+    params["writeQueuePolicy"] = "Block"
+    params["writerProcess"] = False
+    params["spoolFolder"] = "None"
+    params["spoolSizeInMB"] = 8192
 
     # Display parameters
     params["chunkLengthInSec"] = 5
-    params["displayFrameRate"] = 10
+    params["missedTriggerThreshold"] = 1.5
+    params["displayFrameRate"] = 10  # 0: headless
     params["displayDownsample"] = 2
 
     # Trigger parameters
@@ -64,6 +92,7 @@ def DefaultParams():
     params["startArduino"] = False
     params["serialPort"] = "COM3"
     params["digitalPins"] = [0, 1, 2, 3, 4, 5, 6]
+    params["readyTimeoutInSec"] = 30
 
     return params
 
@@ -81,14 +110,18 @@ def AutoParams(params, default_params):
         "cameraExposureTimeInUs",
         "quality",
         "chunkLengthInSec",
-        "displayFrameRate",
         "displayDownsample",
     ]
 
     for i in range(len(range_params)):
         key = range_params[i]
         default_value = default_params[key]
-        if params[key] <= 0:
+        # Per-camera lists (e.g. quality from campy-autotune) are checked per item
+        if type(params[key]) is list:
+            invalid = any(value <= 0 for value in params[key])
+        else:
+            invalid = params[key] <= 0
+        if invalid:
             params[key] = default_value
             print(
                 "{} set to invalid value in config. Setting to default ({}).".format(
@@ -125,9 +158,25 @@ def ConfigureParams():
     return params
 
 
-def ConfigureCamParams(systems, params, n_cam, start_time=None):
-    # Insert camera-specific metadata from parameters into cam_params dictionary
-    cam_params = params
+def LaunchPlans(systems, params, start_time=None):
+    """
+    Serializable launch plan of each camera, resolved once in the main process:
+    its camera-specific parameters and the serial number of its device.
+    Workers open their device from the plan (unicam.OpenDevice).
+    """
+    plans = []
+    for n_cam in range(params["numCams"]):
+        cam_params = ResolveCamParams(params, n_cam, start_time=start_time)
+        cam_make = cam_params["cameraMake"]
+        cam_idx = cam_params["cameraSelection"]
+        cam_params["cameraSerialNo"] = systems[cam_make]["serials"][cam_idx]
+        plans.append(cam_params)
+    return plans
+
+
+def ResolveCamParams(params, n_cam, start_time=None):
+    # Camera-specific parameters without any camera device (e.g. for a writer process)
+    cam_params = dict(params)
     cam_params["n_cam"] = n_cam
     cam_params["baseFolder"] = os.getcwd()
     cam_params["cameraName"] = params["cameraNames"][n_cam]
@@ -142,13 +191,6 @@ def ConfigureCamParams(systems, params, n_cam, start_time=None):
     cam_params["videoFolder"] = p.as_posix()
 
     cam_params = OptParams(cam_params)
-    cam_make = cam_params["cameraMake"]
-    cam_idx = cam_params["cameraSelection"]
-
-    cam_params["device"] = systems[cam_make]["deviceList"][cam_idx]
-    cam_params = unicam.LoadDevice(systems, params, cam_params)
-
-    cam_params["cameraSerialNo"] = systems[cam_make]["serials"][cam_idx]
 
     return cam_params
 
@@ -158,6 +200,11 @@ def OptParams(cam_params):
     # String is passed to all cameras. Else, each list item is passed to its respective camera
     for key in cam_params:
         if type(cam_params[key]) is list:
+            if key == "videoRenditions" and all(
+                type(r) is dict for r in cam_params[key]
+            ):
+                # One list of renditions shared by all cameras
+                continue
             if len(cam_params[key]) == cam_params["numCams"]:
                 cam_params[key] = cam_params[key][cam_params["n_cam"]]
             elif key == "digitalPins":
@@ -236,6 +283,12 @@ def ParseClargs(parser):
         dest="videoFilename",
         help="Name for video output file.",
     )
+    parser.add_argument(
+        "--frametimesMat",
+        dest="frametimesMat",
+        type=bool,
+        help="If True, also save frame numbers and timestamps to frametimes.mat (loads scipy).",
+    )
     parser.add_argument(
         "--frameRate",
         dest="frameRate",
@@ -268,6 +321,20 @@ def ParseClargs(parser):
                 List length must be equal to numCams",
     )
 
+    parser.add_argument(
+        "--numWorkers",
+        dest="numWorkers",
+        type=int,
+        help="Number of camera worker processes. Cameras are spread over them by bandwidth. "
+        "If 0, one process per camera. If -1, sized from the core count and workerBandwidthInMBps.",
+    )
+    parser.add_argument(
+        "--workerBandwidthInMBps",
+        dest="workerBandwidthInMBps",
+        type=float,
+        help="Frame bandwidth (in MB/s) one worker process handles, for numWorkers -1.",
+    )
+
     # Camera arguments. May be specific to particular camera make
     parser.add_argument(
         "--cameraMake",
@@ -299,6 +366,61 @@ def ParseClargs(parser):
         type=bool,
         help="Flag to turn on camera debug mode.",
     )
+    parser.add_argument(
+        "--grabMode",
+        dest="grabMode",
+        type=ast.literal_eval,
+        help="'blocking': the grab thread waits for each frame. "
+        "'callback': the camera's own grab thread delivers frames (emu only; other "
+        "cameras use 'blocking').",
+    )
+    parser.add_argument(
+        "--grabTimeoutInMs",
+        dest="grabTimeoutInMs",
+        type=int,
+        help="Longest wait for a frame before checking for a stop request.",
+    )
+    parser.add_argument(
+        "--emuNumFrames",
+        dest="emuNumFrames",
+        type=int,
+        help="Frames of the source recording looped by emulated cameras ('emu'), "
+        "held in memory. If 0, the whole recording (or 100 synthetic frames).",
+    )
+    parser.add_argument(
+        "--grabCpus",
+        dest="grabCpus",
+        type=ast.literal_eval,
+        help="CPUs for the grab thread as a cpu-list string ('2-3', '0,4') "
+        "or a NUMA node ('node0'). Linux only.",
+    )
+    parser.add_argument(
+        "--writerCpus",
+        dest="writerCpus",
+        type=ast.literal_eval,
+        help="CPUs for the writer loop (cpu-list string or NUMA node). Linux only.",
+    )
+    parser.add_argument(
+        "--ffmpegCpus",
+        dest="ffmpegCpus",
+        type=ast.literal_eval,
+        help="CPUs for the ffmpeg encoder processes (cpu-list string or NUMA node). "
+        "Linux only.",
+    )
+    parser.add_argument(
+        "--grabPriority",
+        dest="grabPriority",
+        type=int,
+        help="SCHED_FIFO priority (1-99) of the grab thread. 0 (default) leaves it off. "
+        "Needs CAP_SYS_NICE or an rtprio limit.",
+    )
+    parser.add_argument(
+        "--lockMemory",
+        dest="lockMemory",
+        type=bool,
+        help="If True, lock the camera process's memory in RAM (mlockall). "
+        "Needs CAP_IPC_LOCK or a large enough memlock limit.",
+    )
     parser.add_argument(
         "--cameraTrigger",
         dest="cameraTrigger",
@@ -355,6 +477,13 @@ def ParseClargs(parser):
         type=int,
         help="Size of buffer to use in camera in frames (default: 100).",
     )
+    parser.add_argument(
+        "--lendFrames",
+        dest="lendFrames",
+        type=bool,
+        help="If True, frames are passed to the writer as views into camera buffers "
+        "(up to bufferSize/2 at once) instead of copies.",
+    )
 
     # ffmpeg arguments
     parser.add_argument(
@@ -369,6 +498,13 @@ def ParseClargs(parser):
         help="Sets verbosity level for ffmpeg logging. ('quiet' (no warnings), \
             'warning', 'info' (real-time stats)).",
     )
+    parser.add_argument(
+        "--writerBackend",
+        dest="writerBackend",
+        type=ast.literal_eval,
+        help="How frames are piped to ffmpeg. 'native' writes frame memory straight into \
+            an enlarged pipe, 'imageio' uses imageio-ffmpeg write_frames.",
+    )
     parser.add_argument(
         "--pixelFormatInput",
         dest="pixelFormatInput",
@@ -398,7 +534,8 @@ def ParseClargs(parser):
         "--codec",
         dest="codec",
         type=ast.literal_eval,
-        help="Video codec for compression Currently supported: 'h264', 'h265' (hevc).",
+        help="Video codec for compression Currently supported: 'h264', 'h265' (hevc). \
+            'raw' saves uncompressed chunks to transcode later with campy-transcode.",
     )
     parser.add_argument(
         "--quality",
@@ -421,6 +558,83 @@ def ParseClargs(parser):
         type=int,
         help="Length of video segments to break long videos up into. If 0, no segmenting is applied.",
     )
+    parser.add_argument(
+        "--rawChunkLengthInSec",
+        dest="rawChunkLengthInSec",
+        type=float,
+        help="Length of raw chunk files when codec is 'raw' and videoSegmentLengthInSec is 0.",
+    )
+
+    parser.add_argument(
+        "--numEncoders",
+        dest="numEncoders",
+        type=int,
+        help="Number of ffmpeg processes encoding each camera in parallel, round-robin \
+            in closed GOP blocks of gopSize frames. Blocks are joined into one video on close.",
+    )
+    parser.add_argument(
+        "--mosaicGroup",
+        dest="mosaicGroup",
+        type=ast.literal_eval,
+        help="Per-camera mosaic group index. Cameras in the same group (same frame rate and \
+            pixelFormatInput) are tiled into one video encoded by one ffmpeg process. -1 encodes alone.",
+    )
+    parser.add_argument(
+        "--gopSize",
+        dest="gopSize",
+        type=int,
+        help="Frames per GOP block when numEncoders > 1. If 0, one second of frames.",
+    )
+    parser.add_argument(
+        "--videoRenditions",
+        dest="videoRenditions",
+        type=ast.literal_eval,
+        help="Extra downsampled or re-encoded copies written by the same ffmpeg process, e.g. \
+            [{'name': 'preview', 'downsample': 4, 'quality': 28}]. Keys: name, downsample, \
+            frameWidth, frameHeight, codec, quality, preset, gpuID, gpuMake, pixelFormatOutput, \
+            videoSegmentLengthInSec.",
+    )
+
+    # Grabber to writer queue arguments
+    parser.add_argument(
+        "--writeQueueSize",
+        dest="writeQueueSize",
+        type=int,
+        help="Maximum number of frames buffered between grabber and writer. \
+            If 0, unbounded (or bufferSize frames when writerProcess is True).",
+    )
+    parser.add_argument(
+        "--writeQueueSizeInMB",
+        dest="writeQueueSizeInMB",
+        type=float,
+        help="Maximum memory (in MB) of frames buffered between grabber and writer. If 0, no limit.",
+    )
+    parser.add_argument(
+        "--writeQueuePolicy",
+        dest="writeQueuePolicy",
+        type=ast.literal_eval,
+        help="What to do when the write queue is full: 'Block' the grabber, \
+            'DropOldest' or 'DropNewest' frame, or 'Spill' frames to a spool file on disk. \
+            Dropped frame numbers are saved in metadata.",
+    )
+    parser.add_argument(
+        "--spoolFolder",
+        dest="spoolFolder",
+        type=ast.literal_eval,
+        help="Folder on fast local disk for the 'Spill' write queue policy. If 'None', the system temp folder.",
+    )
+    parser.add_argument(
+        "--spoolSizeInMB",
+        dest="spoolSizeInMB",
+        type=float,
+        help="Maximum size (in MB) of each camera's spool file for the 'Spill' write queue policy.",
+    )
+    parser.add_argument(
+        "--writerProcess",
+        dest="writerProcess",
+        type=bool,
+        help="If True, encode in a separate process fed by a shared-memory frame ring (Python 3.8+).",
+    )
 
     # Display and CLI feedback arguments
     parser.add_argument(
@@ -429,11 +643,18 @@ def ParseClargs(parser):
         type=float,
         help="Length of video chunks in seconds for reporting recording progress.",
     )
+    parser.add_argument(
+        "--missedTriggerThreshold",
+        dest="missedTriggerThreshold",
+        type=float,
+        help="Frame intervals longer than this multiple of 1/frameRate count as missed triggers.",
+    )
     parser.add_argument(
         "--displayFrameRate",
         dest="displayFrameRate",
         type=float,
-        help="Display frame rate in Hz. Max ~30.",
+        help="Display frame rate in Hz in the live view window. "
+        "If 0, headless: no display window, and no GUI toolkit (cv2) is loaded.",
     )
     parser.add_argument(
         "--displayDownsample",
@@ -455,6 +676,13 @@ def ParseClargs(parser):
         type=bool,
         help="If True, start Arduino after initializing cameras.",
     )
+    parser.add_argument(
+        "--readyTimeoutInSec",
+        dest="readyTimeoutInSec",
+        type=float,
+        help="Longest wait for every camera to be armed and its encoder warmed. "
+        "If a camera is not ready in time, or fails, the triggers never start.",
+    )
     parser.add_argument(
         "--serialPort",
         dest="serialPort",
@@ -0,0 +1,410 @@
+"""
+Frame queue connecting the camera grabber ("producer") to the video writer ("consumer").
+"""
+
+import os, threading, time, logging, tempfile
+from collections import deque
+import numpy as np
+
+
+# In-band message marking the end of the frame stream
+STOP = "STOP"
+
+# What put() does when the queue is over budget
+OVERFLOW_POLICIES = ["Block", "DropOldest", "DropNewest", "Spill"]
+
+SPOOL_HEADER_DTYPE = np.dtype(
+    [
+        ("frameNumber", "<i8"),
+        ("timeStamp", "<f8"),
+        ("flags", "<i8"),
+    ]
+)
+SPOOL_FLAG_STOP = 1 << 32  # Above the per-frame flags (campy.timestamps)
+
+
+def OpenWriteQueue(cam_params):
+    # In-process write queue configured by the writeQueue* and spool* parameters
+    spool = None
+    if cam_params["writeQueuePolicy"] == "Spill":
+        folder = cam_params["spoolFolder"]
+        if folder == "None":
+            folder = tempfile.gettempdir()
+        spool = FrameSpool(
+            folder,
+            cam_params["cameraName"],
+            int(cam_params["spoolSizeInMB"] * 2 ** 20),
+        )
+    return FrameQueue(
+        maxsize=cam_params["writeQueueSize"],
+        maxbytes=int(cam_params["writeQueueSizeInMB"] * 2 ** 20),
+        policy=cam_params["writeQueuePolicy"],
+        spool=spool,
+    )
+
+
+class FrameQueue:
+    """
+    Bounded, blocking frame channel between unicam.GrabFrames and writer.WriteFrames.
+    The writer sleeps in get_batch() until frames arrive instead of polling,
+    and the grabber ends the stream in-band with put_stop().
+
+    The queue can be bounded by frame count (maxsize) and/or memory (maxbytes).
+    When it is over budget, policy selects whether put() blocks the grabber,
+    drops the oldest queued frame or the incoming one, or spills frames to a
+    FrameSpool on disk. Numbers of dropped frames are recorded in dropped.
+
+    Usage:
+    writeQueue = FrameQueue(maxsize=0, maxbytes=0, policy="Block")  # 0 is unbounded
+
+    # Grabber thread
+    writeQueue.put((frameNumber, timeStamp, img, flags))
+    writeQueue.put_stop()
+
+    # Writer thread
+    batch = writeQueue.get_batch()
+    for item in batch:
+            if item is STOP:
+                    <stop writing>
+    writeQueue.release(batch)
+    """
+
+    def __init__(self, maxsize=0, maxbytes=0, policy="Block", spool=None):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(
+                "writeQueuePolicy should be one of {}, got '{}'.".format(
+                    OVERFLOW_POLICIES, policy
+                )
+            )
+        if policy == "Spill" and spool is None:
+            raise ValueError("writeQueuePolicy 'Spill' needs a FrameSpool.")
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.policy = policy
+        self.spool = spool
+        self.dropped = []
+        self.copied = 0
+        self.stop_requested = False
+        self._progress = {}
+        self._items = deque()
+        self._bytes = 0
+        self._spooled_in_batch = 0
+        self._lent = {}
+        self._max_lent = 0
+        self._release_frame = None
+        self._mutex = threading.Lock()
+        self._not_empty = threading.Condition(self._mutex)
+        self._not_full = threading.Condition(self._mutex)
+
+    def __len__(self):
+        if self.spool is not None:
+            return len(self._items) + self.spool.depth
+        return len(self._items)
+
+    @property
+    def nbytes(self):
+        return self._bytes
+
+    def _spilling(self):
+        # Once frames are on disk, newer frames follow them there to keep frame order
+        return self.spool is not None and self.spool.depth > 0
+
+    def _full(self, nbytes):
+        if self.maxsize > 0 and len(self._items) >= self.maxsize:
+            return True
+        # A single frame larger than the budget is still let through an empty queue
+        if self.maxbytes > 0 and self._items and self._bytes + nbytes > self.maxbytes:
+            return True
+        return False
+
+    def lend(self, release_frame, max_lent):
+        """
+        Accept frames whose images are views into camera buffers, passed with their
+        grab results to put(..., grabResults=...). Each buffer is handed back with
+        release_frame(grabResult) once the writer releases the frame's batch, or as
+        soon as the frame is dropped or spilled. At most max_lent buffers are out at
+        once; beyond that, frames are copied and their buffers handed back right away
+        (counted in copied), so the camera always has buffers left to fill.
+        """
+        self._release_frame = release_frame
+        self._max_lent = max_lent
+
+    def _lend(self, items, grabResults):
+        with self._mutex:
+            free = max(0, self._max_lent - len(self._lent))
+            for item, grabResult in zip(items[:free], grabResults[:free]):
+                self._lent[item[0]] = grabResult
+        if len(items) <= free:
+            return items
+        copies = []
+        for item, grabResult in zip(items[free:], grabResults[free:]):
+            copies.append((item[0], item[1], item[2].copy(), item[3]))
+            self._release_frame(grabResult)
+        self.copied += len(copies)
+        return items[:free] + copies
+
+    def _return(self, frameNumber):
+        # Hand a lent camera buffer back (called with the lock held)
+        grabResult = self._lent.pop(frameNumber, None)
+        if grabResult is not None:
+            self._release_frame(grabResult)
+
+    def put(self, item, timeout=None, grabResult=None):
+        """
+        Append a frame (frameNumber, timeStamp, img, flags), applying the overflow policy
+        while the queue is over budget. Returns False if the frame was not queued.
+        """
+        if grabResult is not None:
+            item = self._lend([item], [grabResult])[0]
+        nbytes = item[2].nbytes
+        with self._not_full:
+            while self._spilling() or self._full(nbytes):
+                if self.policy == "Spill" and self.spool.put(item):
+                    self._return(item[0])
+                    self._not_empty.notify()
+                    return True
+                elif self.policy == "DropNewest":
+                    self.dropped.append(item[0])
+                    self._return(item[0])
+                    return False
+                elif self.policy == "DropOldest":
+                    oldest = self._items.popleft()
+                    self._bytes -= oldest[2].nbytes
+                    self.dropped.append(oldest[0])
+                    self._return(oldest[0])
+                elif not self._not_full.wait(timeout):
+                    self._return(item[0])
+                    return False
+            self._items.append(item)
+            self._bytes += nbytes
+            self._not_empty.notify()
+        return True
+
+    def put_batch(self, items, timeout=None, grabResults=None):
+        """
+        Append several frames, taking the lock once while they fit in the budget.
+        The rest go through put(). Returns the number of frames queued.
+        """
+        if grabResults is not None:
+            items = self._lend(items, grabResults)
+        queued = 0
+        with self._not_full:
+            for item in items:
+                nbytes = item[2].nbytes
+                if self._spilling() or self._full(nbytes):
+                    break
+                self._items.append(item)
+                self._bytes += nbytes
+                queued += 1
+            if queued:
+                self._not_empty.notify()
+        for item in items[queued:]:
+            queued += self.put(item, timeout)
+        return queued
+
+    def producer_alive(self):
+        """The grabber runs in this process (see FrameRing.producer_alive)."""
+        return True
+
+    def put_stop(self):
+        """Send the stop message behind any queued frames. Never blocks on maxsize."""
+        with self._not_full:
+            if self._spilling():
+                while not self.spool.put_stop():
+                    self._not_full.wait()
+            else:
+                self._items.append(STOP)
+            self._not_empty.notify()
+
+    def get_batch(self, max_items=64, timeout=None):
+        """
+        Wait until at least one item is queued, then dequeue up to max_items at once.
+        Returns an empty list on timeout.
+        """
+        with self._not_empty:
+            while not self._items and not self._spilling():
+                if not self._not_empty.wait(timeout):
+                    return []
+            # In-memory frames are always older than spooled frames
+            n = min(len(self._items), max_items)
+            batch = [self._items.popleft() for _ in range(n)]
+            self._bytes -= sum(item[2].nbytes for item in batch if item is not STOP)
+            while len(batch) < max_items and self._spilling():
+                batch.append(self.spool.get())
+                self._spooled_in_batch += 1
+            self._not_full.notify(n)
+        return batch
+
+    def release(self, batch):
+        """
+        Called by the writer once a batch is written. In-memory frames own their memory
+        (or lend a camera buffer, handed back here), while spooled frames are views into
+        the spool file until their records are freed.
+        """
+        if self._lent:
+            with self._not_full:
+                for item in batch:
+                    if item is not STOP:
+                        self._return(item[0])
+                self._not_full.notify_all()
+        if self._spooled_in_batch:
+            with self._not_full:
+                self.spool.free(self._spooled_in_batch)
+                self._spooled_in_batch = 0
+                self._not_full.notify()
+
+    def spool_stats(self):
+        """Spool depth in frames and drain rate in frames/sec since the previous call."""
+        if self.spool is None:
+            return 0, 0.0
+        return self.spool.depth, self.spool.drain_rate()
+
+    def set_progress(self, stats):
+        """Encoder progress reported by the writer (see writer.OpenFFmpegWriter)."""
+        self._progress = stats
+
+    def progress(self):
+        return self._progress
+
+    def wait_lent(self, timeout=None):
+        """Wait until the writer has handed back all lent camera buffers."""
+        with self._not_full:
+            return self._not_full.wait_for(lambda: not self._lent, timeout)
+
+    def close(self):
+        with self._mutex:
+            for frameNumber in list(self._lent):
+                self._return(frameNumber)
+        if self.spool is not None:
+            self.spool.close()
+
+    def request_stop(self):
+        """
+        Ask the grabber to stop acquiring (e.g. on SIGINT).
+        Called from signal handlers, so it must not take the queue lock.
+        """
+        self.stop_requested = True
+
+
+class FrameSpool:
+    """
+    Memory-mapped ring of raw frame records on fast local disk, used by FrameQueue
+    (writeQueuePolicy "Spill") as an overflow tier behind the in-memory queue.
+    Frames are spilled here by the grabber while the encoder is behind, and drained
+    back to the writer in order once it catches up. The file is sized on the first
+    spilled frame and deleted on close().
+
+    Record layout: header (frameNumber, timeStamp, flags) followed by the frame.
+    """
+
+    def __init__(self, folder, name, maxbytes):
+        self.path = os.path.join(folder, "campy_spool_{}_{}.raw".format(name, os.getpid()))
+        self.maxbytes = maxbytes
+        self.numSlots = 0
+        self.spilled = 0
+        self.drained = 0
+        self.maxDepth = 0
+        self._map = None
+        self._write_index = 0
+        self._read_index = 0
+        self._free_index = 0
+        self._last_drained = (time.perf_counter(), 0)
+
+    @property
+    def depth(self):
+        return self._write_index - self._read_index
+
+    def _open(self, img):
+        self.shape, self.dtype = img.shape, img.dtype
+        self._record_bytes = (SPOOL_HEADER_DTYPE.itemsize + img.nbytes + 4095) // 4096 * 4096
+        self.numSlots = int(self.maxbytes // self._record_bytes)
+        if self.numSlots < 1:
+            return False
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._map = np.memmap(
+            self.path,
+            dtype="uint8",
+            mode="w+",
+            shape=(self.numSlots * self._record_bytes,),
+        )
+        return True
+
+    # Views of a slot are built on use: the spool can hold millions of small frames,
+    # and it is opened by the grab thread at the moment the queue overflows
+    def _header(self, slot):
+        return np.ndarray(
+            (), dtype=SPOOL_HEADER_DTYPE, buffer=self._map, offset=slot * self._record_bytes
+        )
+
+    def _frame(self, slot):
+        return np.ndarray(
+            self.shape,
+            dtype=self.dtype,
+            buffer=self._map,
+            offset=slot * self._record_bytes + SPOOL_HEADER_DTYPE.itemsize,
+        )
+
+    def _next_slot(self):
+        if self.numSlots < 1 or self._write_index - self._free_index >= self.numSlots:
+            return None
+        return self._write_index % self.numSlots
+
+    def _publish(self):
+        self._write_index += 1
+        self.maxDepth = max(self.maxDepth, self.depth)
+
+    def put(self, item):
+        """Append a frame record. Returns False if the spool is full."""
+        frameNumber, timeStamp, img, flags = item
+        if self._map is None and not self._open(img):
+            return False
+        if img.shape != self.shape or img.dtype != self.dtype:
+            return False
+        slot = self._next_slot()
+        if slot is None:
+            return False
+        np.copyto(self._frame(slot), img, casting="no")
+        self._header(slot)[()] = (frameNumber, timeStamp, flags)
+        self._publish()
+        self.spilled += 1
+        return True
+
+    def put_stop(self):
+        slot = self._next_slot()
+        if slot is None:
+            return False
+        self._header(slot)[()] = (0, 0.0, SPOOL_FLAG_STOP)
+        self._publish()
+        return True
+
+    def get(self):
+        """Take the oldest record. Its frame is a view that stays valid until free()."""
+        slot = self._read_index % self.numSlots
+        self._read_index += 1
+        header = self._header(slot)
+        if header["flags"] & SPOOL_FLAG_STOP:
+            return STOP
+        self.drained += 1
+        return (
+            int(header["frameNumber"]),
+            float(header["timeStamp"]),
+            self._frame(slot),
+            int(header["flags"]),
+        )
+
+    def free(self, count):
+        self._free_index += count
+
+    def drain_rate(self):
+        t, drained = time.perf_counter(), self.drained
+        t0, drained0 = self._last_drained
+        self._last_drained = (t, drained)
+        return (drained - drained0) / max(t - t0, 1e-9)
+
+    def close(self):
+        self._map = None
+        try:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+        except OSError as e:
+            logging.warning("Could not remove spool file {}: {}".format(self.path, e))
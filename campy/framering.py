@@ -0,0 +1,358 @@
+"""
+Shared-memory frame ring connecting the camera grabber to a video writer in another process.
+Grabbing and encoding then run under separate interpreters (and GILs) on separate cores.
+
+Layout of the shared memory block:
+    control: int64 [writeCount, readCount, stopRequested, encoder progress...]
+    headers: one record per slot (frameNumber, timeStamp, sequence, flags)
+    slots:   fixed-size frame buffers sized from frameWidth, frameHeight and pixelFormatInput
+
+Requires Python 3.8+ (multiprocessing.shared_memory).
+"""
+
+import os, sys, logging
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+from campy.framequeue import STOP, OVERFLOW_POLICIES
+
+
+# Numpy dtype and channel count of supported input pixel formats
+PIXEL_FORMATS = {
+    "gray": ("uint8", 1),
+    "bayer_bggr8": ("uint8", 1),
+    "bayer_rggb8": ("uint8", 1),
+    "bayer_gbrg8": ("uint8", 1),
+    "bayer_grbg8": ("uint8", 1),
+    "gray16le": ("uint16", 1),
+    "rgb24": ("uint8", 3),
+    "bgr24": ("uint8", 3),
+    "rgb0": ("uint8", 4),
+    "bgr0": ("uint8", 4),
+}
+
+HEADER_DTYPE = np.dtype(
+    [
+        ("frameNumber", "<i8"),
+        ("timeStamp", "<f8"),
+        ("sequence", "<i8"),
+        ("flags", "<i8"),
+    ]
+)
+
+CONTROL_SIZE = 9  # int64 fields
+WRITE_COUNT, READ_COUNT, STOP_REQUESTED = 0, 1, 2
+# Encoder progress from the writer process (rates in thousandths)
+PROGRESS_FRAME, PROGRESS_FPS, PROGRESS_SPEED = 3, 4, 5
+PROGRESS_BITRATE, PROGRESS_SIZE = 6, 7
+PRODUCER_PID = 8  # Grabber process, 0 until it registers
+FLAG_STOP = 1 << 32  # Above the per-frame flags (campy.timestamps)
+ALIGN = 64
+
+
+def FrameShape(cam_params):
+    dtype, channels = PIXEL_FORMATS[cam_params["pixelFormatInput"]]
+    shape = (cam_params["frameHeight"], cam_params["frameWidth"])
+    if channels > 1:
+        shape += (channels,)
+    return shape, np.dtype(dtype)
+
+
+def RingSlots(cam_params):
+    # Number of slots fitting the writeQueueSize and writeQueueSizeInMB budgets
+    shape, dtype = FrameShape(cam_params)
+    frame_bytes = int(np.prod(shape)) * dtype.itemsize
+    limits = []
+    if cam_params["writeQueueSize"] > 0:
+        limits.append(cam_params["writeQueueSize"])
+    if cam_params["writeQueueSizeInMB"] > 0:
+        limits.append(int(cam_params["writeQueueSizeInMB"] * 2 ** 20 // frame_bytes))
+    if not limits:
+        limits.append(cam_params["bufferSize"])
+    return max(2, min(limits))
+
+
+def ProcessAlive(pid):
+    # Whether a process is still running, without signalling it
+    if sys.platform == "win32":
+        import ctypes
+
+        SYNCHRONIZE, WAIT_TIMEOUT = 0x00100000, 0x102
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(SYNCHRONIZE, False, pid)
+        if not handle:
+            return False
+        try:
+            return kernel32.WaitForSingleObject(handle, 0) == WAIT_TIMEOUT
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    # An exited process that was not reaped yet (zombie) still has a pid on Linux
+    try:
+        with open("/proc/{}/stat".format(pid)) as f:
+            return f.read().rpartition(")")[2].split()[0] != "Z"
+    except OSError:
+        return True
+
+
+def _Align(nbytes):
+    return (nbytes + ALIGN - 1) // ALIGN * ALIGN
+
+
+class FrameRing:
+    """
+    Preallocated single-producer, single-consumer ring of frame slots in shared memory.
+    Exposes the same interface as campy.framequeue.FrameQueue, so unicam.GrabFrames
+    and writer.WriteFrames work with either one.
+
+    When the ring is full, policy "Block" waits for a free slot and "DropNewest"
+    drops the incoming frame. "DropOldest" would race with the writer reading the
+    oldest slot, so the ring applies "DropNewest" instead. Numbers of dropped frames
+    are recorded in dropped (in the grabber process).
+
+    Usage:
+    # Main process (before spawning the grabber and writer processes)
+    ring = FrameRing(cam_params, numSlots=RingSlots(cam_params), policy="Block")
+
+    # Grabber process: frame is copied once, straight into its slot
+    ring.put((frameNumber, timeStamp, img, flags))
+
+    # Grabber process (before opening the camera)
+    ring.set_producer()
+
+    # Writer process: frames are views into the slots until released
+    batch = ring.get_batch()
+    <write batch>
+    ring.release(batch)
+
+    # Main process (after both processes exit)
+    ring.unlink()
+    """
+
+    def __init__(self, cam_params, numSlots, policy="Block"):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(
+                "writeQueuePolicy should be one of {}, got '{}'.".format(
+                    OVERFLOW_POLICIES, policy
+                )
+            )
+        if policy == "DropOldest":
+            logging.warning(
+                "{}: writeQueuePolicy 'DropOldest' is not supported with writerProcess. "
+                "Using 'DropNewest'.".format(cam_params["cameraName"])
+            )
+            policy = "DropNewest"
+        elif policy == "Spill":
+            logging.warning(
+                "{}: writeQueuePolicy 'Spill' is not supported with writerProcess. "
+                "Using 'Block'.".format(cam_params["cameraName"])
+            )
+            policy = "Block"
+        self.policy = policy
+        shape, dtype = FrameShape(cam_params)
+        self._init(shape, dtype, numSlots)
+        size = self._slots_offset + numSlots * self._slot_bytes
+        self._shm = shared_memory.SharedMemory(create=True, size=size)
+        ctx = mp.get_context("spawn")
+        self._free = ctx.Semaphore(numSlots)
+        self._filled = ctx.Semaphore(0)
+        self._attach()
+        self._control[:] = 0
+
+    def _init(self, shape, dtype, numSlots):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.numSlots = numSlots
+        self._slot_bytes = _Align(int(np.prod(self.shape)) * self.dtype.itemsize)
+        self._headers_offset = _Align(CONTROL_SIZE * 8)
+        self._slots_offset = self._headers_offset + _Align(
+            numSlots * HEADER_DTYPE.itemsize
+        )
+        self._write_index = 0
+        self._read_index = 0
+        self.dropped = []
+        self.spool = None
+
+    def _attach(self):
+        buf = self._shm.buf
+        self._control = np.ndarray((CONTROL_SIZE,), dtype="<i8", buffer=buf)
+        self._headers = np.ndarray(
+            (self.numSlots,),
+            dtype=HEADER_DTYPE,
+            buffer=buf,
+            offset=self._headers_offset,
+        )
+        self._slots = [
+            np.ndarray(
+                self.shape,
+                dtype=self.dtype,
+                buffer=buf,
+                offset=self._slots_offset + i * self._slot_bytes,
+            )
+            for i in range(self.numSlots)
+        ]
+
+    def __getstate__(self):
+        # Semaphores can only be shared when the process is spawned
+        return (
+            self._shm.name,
+            self.shape,
+            self.dtype.str,
+            self.numSlots,
+            self.policy,
+            self._free,
+            self._filled,
+        )
+
+    def __setstate__(self, state):
+        name, shape, dtype, numSlots, self.policy, self._free, self._filled = state
+        self._init(shape, dtype, numSlots)
+        self._shm = shared_memory.SharedMemory(name=name)
+        self._attach()
+
+    def __len__(self):
+        return int(self._control[WRITE_COUNT] - self._control[READ_COUNT])
+
+    @property
+    def stop_requested(self):
+        return bool(self._control[STOP_REQUESTED])
+
+    def request_stop(self):
+        """Ask the grabber to stop acquiring. Lock-free, so it is safe in signal handlers."""
+        self._control[STOP_REQUESTED] = 1
+
+    def set_producer(self):
+        """Register the calling process as the grabber, watched by producer_alive()."""
+        self._control[PRODUCER_PID] = os.getpid()
+
+    def producer_alive(self):
+        """False once the registered grabber process has exited (True until then)."""
+        pid = int(self._control[PRODUCER_PID])
+        return pid == 0 or ProcessAlive(pid)
+
+    def set_progress(self, stats):
+        """Encoder progress reported by the writer process (see writer.OpenFFmpegWriter)."""
+        self._control[PROGRESS_FPS] = int(stats["fps"] * 1000)
+        self._control[PROGRESS_SPEED] = int(stats["speed"] * 1000)
+        self._control[PROGRESS_BITRATE] = int(stats["bitrate"] * 1000)
+        self._control[PROGRESS_SIZE] = stats["totalSize"]
+        # Written last: a nonzero frame count marks the progress as valid
+        self._control[PROGRESS_FRAME] = stats["frame"]
+
+    def progress(self):
+        if not self._control[PROGRESS_FRAME]:
+            return {}
+        return {
+            "frame": int(self._control[PROGRESS_FRAME]),
+            "fps": self._control[PROGRESS_FPS] / 1000,
+            "speed": self._control[PROGRESS_SPEED] / 1000,
+            "bitrate": self._control[PROGRESS_BITRATE] / 1000,
+            "totalSize": int(self._control[PROGRESS_SIZE]),
+        }
+
+    def _next_slot(self, timeout):
+        if not self._free.acquire(block=timeout != 0, timeout=timeout or None):
+            return None
+        return self._write_index % self.numSlots
+
+    def _publish(self, slot):
+        self._headers[slot]["sequence"] = self._write_index
+        self._write_index += 1
+        self._control[WRITE_COUNT] = self._write_index
+        self._filled.release()
+
+    @property
+    def nbytes(self):
+        return len(self) * self._slot_bytes
+
+    def put(self, item, timeout=None):
+        """
+        Copy a frame into the next free slot, applying the overflow policy
+        while the ring is full. Returns False if the frame was not queued.
+        """
+        frameNumber, timeStamp, img, flags = item
+        if img.shape != self.shape or img.dtype != self.dtype:
+            self.request_stop()
+            msg = "Frame {} {} does not fit ring slot {} {}. Check frameWidth, frameHeight and pixelFormatInput.".format(
+                img.shape, img.dtype, self.shape, self.dtype
+            )
+            logging.error(msg)
+            raise ValueError(msg)
+
+        if self.policy == "DropNewest":
+            slot = self._next_slot(timeout=0)
+        else:
+            slot = self._next_slot(timeout)
+        if slot is None:
+            if self.policy == "DropNewest":
+                self.dropped.append(frameNumber)
+            return False
+        np.copyto(self._slots[slot], img, casting="no")
+        header = self._headers[slot]
+        header["frameNumber"] = frameNumber
+        header["timeStamp"] = timeStamp
+        header["flags"] = flags
+        self._publish(slot)
+        return True
+
+    def put_batch(self, items, timeout=None):
+        """Copy several frames into the ring. Returns the number of frames queued."""
+        return sum(self.put(item, timeout) for item in items)
+
+    def put_stop(self):
+        """Send the stop message behind any queued frames."""
+        slot = self._next_slot(timeout=None)
+        self._headers[slot]["flags"] = FLAG_STOP
+        self._publish(slot)
+
+    def get_batch(self, max_items=64, timeout=None):
+        """
+        Wait until at least one slot is filled, then take up to max_items at once.
+        Frames are returned as views into shared memory and stay valid until release().
+        """
+        if not self._filled.acquire(timeout=timeout):
+            return []
+        count = 1
+        while count < max_items and self._filled.acquire(block=False):
+            count += 1
+
+        batch = []
+        for i in range(count):
+            slot = (self._read_index + i) % self.numSlots
+            header = self._headers[slot]
+            if header["flags"] & FLAG_STOP:
+                batch.append(STOP)
+            else:
+                batch.append(
+                    (
+                        int(header["frameNumber"]),
+                        float(header["timeStamp"]),
+                        self._slots[slot],
+                        int(header["flags"]),
+                    )
+                )
+        return batch
+
+    def release(self, batch):
+        """Hand the slots of a batch returned by get_batch() back to the grabber."""
+        self._read_index += len(batch)
+        self._control[READ_COUNT] = self._read_index
+        for i in range(len(batch)):
+            self._free.release()
+
+    def close(self):
+        self._slots = self._headers = self._control = None
+        try:
+            self._shm.close()
+        except BufferError:
+            # Caller still holds frame views; the mapping is released when they are
+            pass
+
+    def unlink(self):
+        self.close()
+        self._shm.unlink()
@@ -0,0 +1,144 @@
+"""
+Streaming frame timing statistics for the grab loop, updated in constant time per
+frame with no per-chunk allocation. Intervals between frame timestamps are tracked
+with running mean and std (Welford's method), min and max, a fixed-bin jitter
+histogram over [0, 2 x nominal interval), and a count of intervals longer than
+missedTriggerThreshold x nominal interval, which indicate missed triggers or frames.
+
+FrameIDGaps counts frames dropped by the camera itself, from gaps in the hardware
+frame IDs (FLIR FrameID, Basler BlockID) of consecutive grabbed frames.
+"""
+
+import math
+import numpy as np
+from campy.timestamps import TIMESTAMP_FLAG_GAP
+
+
+class FrameStats:
+    """
+    Usage:
+    frameStats = FrameStats(frameRate, missedThreshold=1.5)
+    frameStats.update(timeStamp)  # every grabbed frame
+    fps_avg, fps_std = frameStats.chunk()  # frame rate since the previous call
+    frameStats.summary()  # dict for metadata
+    """
+
+    def __init__(self, frameRate, missedThreshold=1.5, bins=100):
+        self.period = 1.0 / frameRate
+        self.missedThreshold = missedThreshold
+        self.count = 0
+        self.mean = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self.missed = 0
+        self.histogram = np.zeros(bins + 1, dtype="int64")  # last bin: overflow
+        self._m2 = 0.0
+        self._bins = bins
+        self._bin_width = 2 * self.period / bins
+        self._missed_interval = missedThreshold * self.period
+        self._last = None
+        self._chunk_count = 0
+        self._chunk_mean = 0.0
+        self._chunk_m2 = 0.0
+
+    def update(self, timeStamp):
+        last, self._last = self._last, timeStamp
+        if last is None:
+            return
+        dt = timeStamp - last
+
+        # Interval statistics over the whole recording
+        self.count += 1
+        delta = dt - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (dt - self.mean)
+        if dt < self.min:
+            self.min = dt
+        if dt > self.max:
+            self.max = dt
+        if dt > self._missed_interval:
+            self.missed += 1
+        b = int(dt / self._bin_width)
+        self.histogram[min(max(b, 0), self._bins)] += 1
+
+        # Frame rate statistics of the current reporting chunk
+        if dt > 0:
+            fps = 1.0 / dt
+            self._chunk_count += 1
+            delta = fps - self._chunk_mean
+            self._chunk_mean += delta / self._chunk_count
+            self._chunk_m2 += delta * (fps - self._chunk_mean)
+
+    @property
+    def std(self):
+        return math.sqrt(self._m2 / self.count) if self.count else 0.0
+
+    def chunk(self):
+        """Mean and std of the frame rate since the previous call, then reset."""
+        if not self._chunk_count:
+            return 0.0, 0.0
+        fps_avg = self._chunk_mean
+        fps_std = math.sqrt(self._chunk_m2 / self._chunk_count)
+        self._chunk_count = 0
+        self._chunk_mean = 0.0
+        self._chunk_m2 = 0.0
+        return fps_avg, fps_std
+
+    def summary(self):
+        return {
+            "numIntervals": self.count,
+            "nominalInterval": self.period,
+            "intervalMean": self.mean,
+            "intervalStd": self.std,
+            "intervalMin": self.min if self.count else 0.0,
+            "intervalMax": self.max,
+            "missedTriggerThreshold": self.missedThreshold,
+            "missedTriggers": self.missed,
+            "jitterBinWidth": self._bin_width,
+            "jitterHistogram": self.histogram.tolist(),
+        }
+
+
+class FrameIDGaps:
+    """
+    Usage:
+    frameIDGaps = FrameIDGaps()
+    flags = frameIDGaps.update(frameNumber, frameID)  # every grabbed frame
+    frameIDGaps.summary()  # dict for metadata
+
+    update() returns TIMESTAMP_FLAG_GAP for a frame preceded by a gap, else 0.
+    The first maxGaps gaps are kept as (frameNumber, frameID, framesLost).
+    A frame ID at or below the previous one (counter reset or wraparound)
+    restarts the count without counting a gap.
+    """
+
+    def __init__(self, maxGaps=10000):
+        self.numGaps = 0
+        self.lost = 0
+        self.maxGap = 0
+        self.gaps = []
+        self._maxGaps = maxGaps
+        self._last = None
+
+    def update(self, frameNumber, frameID):
+        last, self._last = self._last, frameID
+        if last is None:
+            return 0
+        lost = frameID - last - 1
+        if lost <= 0:
+            return 0
+        self.numGaps += 1
+        self.lost += lost
+        if lost > self.maxGap:
+            self.maxGap = lost
+        if len(self.gaps) < self._maxGaps:
+            self.gaps.append((frameNumber, frameID, lost))
+        return TIMESTAMP_FLAG_GAP
+
+    def summary(self):
+        return {
+            "frameIDGaps": self.numGaps,
+            "framesLostByCamera": self.lost,
+            "maxFrameIDGap": self.maxGap,
+            "gaps": self.gaps,
+        }
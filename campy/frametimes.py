@@ -0,0 +1,75 @@
+"""
+Frame numbers and timestamps of grabbed frames, kept in preallocated arrays and
+streamed to frametimes.npy during the recording, so memory use stays constant
+and nothing needs converting at shutdown.
+
+frametimes.npy holds the same (2, numFrames) float64 array campy always saved
+(row 0: frame numbers, row 1: seconds since the first frame). It is written in
+Fortran order, which stores each (frameNumber, timeStamp) pair contiguously, so
+chunks can be appended as they fill. The header reserves room for the final shape,
+which is filled in on close().
+"""
+
+import os, struct
+import numpy as np
+
+
+HEADER_LEN = 128
+MAGIC = b"\x93NUMPY\x01\x00"
+
+
+def NpyHeader(numFrames):
+    # .npy v1.0 header of a Fortran-ordered (2, numFrames) float64 array, padded to HEADER_LEN
+    header = "{'descr': '<f8', 'fortran_order': True, 'shape': (2, %d), }" % numFrames
+    header = header.ljust(HEADER_LEN - len(MAGIC) - 2 - 1) + "\n"
+    return MAGIC + struct.pack("<H", len(header)) + header.encode("latin1")
+
+
+class FrameTimes:
+    """
+    Usage:
+    frameTimes = FrameTimes(folder_name)
+    frameTimes.append(frameNumber, timeStamp)  # every grabbed frame
+    frameTimes.close()
+    x = frameTimes.load()  # (2, numFrames) memmap of frametimes.npy
+    """
+
+    def __init__(self, folder_name, chunk_size=4096):
+        os.makedirs(folder_name, exist_ok=True)
+        self.path = os.path.join(folder_name, "frametimes.npy")
+        self.count = 0
+        self.firstTimeStamp = None
+        self.lastFrameNumber = 0
+        self.lastTimeStamp = 0.0
+        self._chunk = np.zeros((chunk_size, 2), dtype="float64")
+        self._n = 0
+        self._file = open(self.path, "wb")
+        self._file.write(NpyHeader(0))
+
+    def append(self, frameNumber, timeStamp):
+        if self.firstTimeStamp is None:
+            self.firstTimeStamp = timeStamp
+        self.lastTimeStamp = timeStamp - self.firstTimeStamp
+        self._chunk[self._n] = (frameNumber, self.lastTimeStamp)
+        self._n += 1
+        self.count += 1
+        self.lastFrameNumber = frameNumber
+        if self._n == len(self._chunk):
+            self.flush()
+
+    def flush(self):
+        if self._n:
+            self._file.write(memoryview(self._chunk[: self._n]))
+            self._n = 0
+
+    def close(self):
+        if self._file is None:
+            return
+        self.flush()
+        self._file.seek(0)
+        self._file.write(NpyHeader(self.count))
+        self._file.close()
+        self._file = None
+
+    def load(self):
+        return np.load(self.path, mmap_mode="r")
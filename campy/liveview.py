@@ -0,0 +1,222 @@
+"""
+Live view of all cameras in one display process.
+Each displayed camera gets a preview slot in shared memory holding its latest
+downsampled frame. The camera's grab loop writes display frames straight into the
+slot (one small copy, no locks, no GUI in the acquisition process). The display
+process tiles the newest frame of every camera into one window with OpenCV.
+
+Layout of a preview slot:
+    header: int64 [sequence, height, width, channels, itemsize]
+    image:  buffer for the largest downsampled frame (4 channels, 16 bits)
+
+The sequence is odd while a frame is being written, so the display process
+skips frames it caught half-written (seqlock).
+"""
+
+import sys, math, signal, time
+from multiprocessing import shared_memory
+import numpy as np
+from rich.console import Console
+
+
+console = Console()
+
+SEQUENCE, HEIGHT, WIDTH, CHANNELS, ITEMSIZE = range(5)
+HEADER_SIZE = 8  # int64 fields
+WINDOW_NAME = "campy"
+MAX_CANVAS = (1920, 1080)  # [W,H] the tiled view is scaled down to fit
+
+
+def PreviewShape(cam_params):
+    # Largest downsampled frame of a camera
+    ds = cam_params["displayDownsample"]
+    return -(-cam_params["frameHeight"] // ds), -(-cam_params["frameWidth"] // ds)
+
+
+class PreviewSlot:
+    """
+    Latest display frame of one camera in shared memory. Has the append method of
+    the display deque, so drivers' DisplayImage write into it unchanged.
+
+    Usage:
+    # Main process (before spawning the camera and display processes)
+    slot = PreviewSlot(cam_params)
+
+    # Camera process (unicam.GrabFrames, through cam.DisplayImage)
+    slot.append(img)
+
+    # Display process
+    sequence, img = slot.read(sequence)
+
+    # Main process (after both processes exit)
+    slot.unlink()
+    """
+
+    def __init__(self, cam_params):
+        height, width = PreviewShape(cam_params)
+        self.maxBytes = height * width * 4 * 2
+        self._shm = shared_memory.SharedMemory(
+            create=True, size=HEADER_SIZE * 8 + self.maxBytes
+        )
+        self._attach()
+        self._header[:] = 0
+
+    def _attach(self):
+        self._header = np.ndarray((HEADER_SIZE,), dtype="<i8", buffer=self._shm.buf)
+
+    def __getstate__(self):
+        return self._shm.name, self.maxBytes
+
+    def __setstate__(self, state):
+        name, self.maxBytes = state
+        self._shm = shared_memory.SharedMemory(name=name)
+        self._attach()
+
+    def append(self, img):
+        """Write the newest display frame (the "STOP" message at close is ignored)."""
+        if isinstance(img, str):
+            return
+        img = np.asarray(img)
+        if img.ndim == 2:
+            img = img[:, :, None]
+        # Frames larger than configured (e.g. a camera's own settings file) are
+        # decimated further until they fit
+        step = 1
+        while img[::step, ::step].nbytes > self.maxBytes:
+            step += 1
+        img = img[::step, ::step]
+        self._header[SEQUENCE] += 1
+        self._header[HEIGHT : ITEMSIZE + 1] = img.shape + (img.itemsize,)
+        view = np.ndarray(
+            img.shape, dtype=img.dtype, buffer=self._shm.buf, offset=HEADER_SIZE * 8
+        )
+        np.copyto(view, img)
+        self._header[SEQUENCE] += 1
+
+    def read(self, sequence):
+        """Copy of the newest frame if it changed since sequence, else None."""
+        start = int(self._header[SEQUENCE])
+        if start == sequence or start % 2:
+            return sequence, None
+        height, width, channels, itemsize = (int(v) for v in self._header[1:5])
+        dtype = np.uint8 if itemsize == 1 else np.uint16
+        img = np.ndarray(
+            (height, width, channels),
+            dtype=dtype,
+            buffer=self._shm.buf,
+            offset=HEADER_SIZE * 8,
+        ).copy()
+        if int(self._header[SEQUENCE]) != start:
+            return sequence, None
+        return start, img
+
+    def close(self):
+        self._header = None
+        self._shm.close()
+
+    def unlink(self):
+        self.close()
+        self._shm.unlink()
+
+
+def Layout(views, maxCanvas=MAX_CANVAS):
+    """
+    Near-square grid of equal cells sized to the largest preview, scaled down so
+    the canvas fits maxCanvas. Returns the canvas size [W,H], the cell size [W,H]
+    and the number of columns.
+    """
+    cols = math.ceil(math.sqrt(len(views)))
+    rows = math.ceil(len(views) / cols)
+    cell_h = max(view["height"] for view in views)
+    cell_w = max(view["width"] for view in views)
+    scale = min(1.0, maxCanvas[0] / (cols * cell_w), maxCanvas[1] / (rows * cell_h))
+    cell_w, cell_h = max(1, int(cell_w * scale)), max(1, int(cell_h * scale))
+    return [cols * cell_w, rows * cell_h], [cell_w, cell_h], cols
+
+
+def DrawTile(cv2, canvas, img, x, y, cell, view):
+    # Fit the frame into its cell and convert it to BGR, in place on the canvas
+    canvas[y : y + cell[1], x : x + cell[0]] = 0
+    if img.dtype != np.uint8:
+        img = (img >> 8).astype(np.uint8)
+    h, w = img.shape[:2]
+    scale = min(1.0, cell[0] / w, cell[1] / h)
+    if scale < 1.0:
+        w, h = max(1, int(w * scale)), max(1, int(h * scale))
+        img = cv2.resize(img, (w, h), interpolation=cv2.INTER_NEAREST)
+    if img.ndim == 2:
+        img = img[:, :, None]
+    tile = canvas[y : y + h, x : x + w]
+    channels = img.shape[2]
+    if channels == 1:
+        tile[:] = img
+    elif view["bgr"]:
+        tile[:] = img[:, :, :3]
+    else:
+        tile[:] = img[:, :, 2::-1]
+    cv2.putText(
+        canvas,
+        view["cameraName"],
+        (x + 4, y + 16),
+        cv2.FONT_HERSHEY_SIMPLEX,
+        0.5,
+        (0, 255, 0),
+        1,
+        cv2.LINE_AA,
+    )
+
+
+def DisplayMosaic(slots, views, stop):
+    """
+    Display process: show the newest frame of every camera, tiled into one window,
+    until stop (a multiprocessing Event) is set or the window is closed.
+    views holds each camera's cameraName, preview height and width, whether its
+    frames are BGR, and its displayFrameRate.
+    """
+    # Ctrl+C stops the recording. The live view closes when the cameras are done
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    import cv2
+
+    try:
+        cv2.namedWindow(WINDOW_NAME, cv2.WINDOW_NORMAL)
+    except cv2.error as e:
+        console.log("Live view is not available (no OpenCV GUI support): {}".format(e))
+        return
+
+    size, cell, cols = Layout(views)
+    canvas = np.zeros((size[1], size[0], 3), dtype=np.uint8)
+    sequences = [0] * len(slots)
+    period = 1.0 / min(60, max(view["displayFrameRate"] for view in views))
+    while not stop.is_set():
+        t = time.perf_counter()
+        for i, (slot, view) in enumerate(zip(slots, views)):
+            sequences[i], img = slot.read(sequences[i])
+            if img is not None:
+                x, y = (i % cols) * cell[0], (i // cols) * cell[1]
+                DrawTile(cv2, canvas, img, x, y, cell, view)
+        cv2.imshow(WINDOW_NAME, canvas)
+        cv2.waitKey(max(1, int((period - (time.perf_counter() - t)) * 1000)))
+        if cv2.getWindowProperty(WINDOW_NAME, cv2.WND_PROP_VISIBLE) < 1:
+            break
+    cv2.destroyAllWindows()
+    for slot in slots:
+        slot.close()
+
+
+def PreviewViews(plans):
+    # Cameras shown in the live view (Basler cameras on Windows use the Pylon window)
+    views = {}
+    for cam_params in plans:
+        if cam_params["displayFrameRate"] <= 0:
+            continue
+        if sys.platform == "win32" and cam_params["cameraMake"] == "basler":
+            continue
+        height, width = PreviewShape(cam_params)
+        views[cam_params["n_cam"]] = {
+            "cameraName": cam_params["cameraName"],
+            "height": height,
+            "width": width,
+            "bgr": cam_params["pixelFormatInput"].startswith("bgr"),
+            "displayFrameRate": cam_params["displayFrameRate"],
+        }
+    return views
@@ -0,0 +1,289 @@
+"""
+Mosaic encoding packs a group of same-rate cameras into one video stream.
+Each camera in a group (mosaicGroup) grabs into its own shared-memory frame ring.
+One writer process per group tiles the frames of every camera with the same
+frameNumber into a canvas and encodes the canvas with a single ffmpeg process.
+
+Each camera folder still gets its own cam_params.json and timestamps.bin.
+cam_params["mosaicTile"] records the tile placement and the mosaic video.
+Record k of a camera's timestamps.bin is frame k of the mosaic video. Frames a
+camera dropped are padded with a black tile and a record flagged
+TIMESTAMP_FLAG_PADDED, so the other tiles stay aligned.
+
+Usage (extract one camera's view back into its own video):
+campy-mosaic-extract ./test.221018_101010/Camera3
+"""
+
+import os, ast, json, glob, math, time, subprocess, traceback
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from pathlib import Path
+import numpy as np
+from rich.console import Console
+from campy import writer, placement, readiness
+from campy.framequeue import STOP
+from campy.framering import FrameShape
+from campy.timestamps import CountTimestamps, TIMESTAMP_FLAG_PADDED
+from campy.utils.utils import QueueKeyboardInterrupt
+
+
+console = Console()
+
+# Canvas sizes are kept at codec macroblock multiples, so ffmpeg never rescales tiles
+MACRO_BLOCK_SIZE = 16
+
+
+def MosaicGroups(cam_params_list):
+    # Cameras grouped by mosaicGroup (cameras with a negative group are encoded alone)
+    groups = {}
+    for cam_params in cam_params_list:
+        if cam_params["mosaicGroup"] >= 0:
+            groups.setdefault(cam_params["mosaicGroup"], []).append(cam_params)
+    return groups
+
+
+def MosaicLayout(group):
+    """
+    Tile placement of a camera group on a near-square grid of equal cells,
+    sized to fit the largest camera. Returns the canvas size [W,H] and one tile
+    (cameraName, x, y, frameWidth, frameHeight) per camera.
+    """
+    for key in ["pixelFormatInput", "frameRate"]:
+        values = set(cam_params[key] for cam_params in group)
+        if len(values) > 1:
+            msg = "Cameras in mosaicGroup {} need the same {}, got {}.".format(
+                group[0]["mosaicGroup"], key, values
+            )
+            console.log(msg)
+            raise ValueError(msg)
+
+    cols = math.ceil(math.sqrt(len(group)))
+    rows = math.ceil(len(group) / cols)
+    cell_w = max(cam_params["frameWidth"] for cam_params in group)
+    cell_h = max(cam_params["frameHeight"] for cam_params in group)
+    tiles = []
+    for i, cam_params in enumerate(group):
+        tiles.append(
+            {
+                "cameraName": cam_params["cameraName"],
+                "x": (i % cols) * cell_w,
+                "y": (i // cols) * cell_h,
+                "frameWidth": cam_params["frameWidth"],
+                "frameHeight": cam_params["frameHeight"],
+            }
+        )
+    width = -(-cols * cell_w // MACRO_BLOCK_SIZE) * MACRO_BLOCK_SIZE
+    height = -(-rows * cell_h // MACRO_BLOCK_SIZE) * MACRO_BLOCK_SIZE
+    return [width, height], tiles
+
+
+def MosaicParams(group):
+    # Encoder params of the mosaic stream: the first camera's settings at canvas size
+    size, tiles = MosaicLayout(group)
+    mosaic_params = dict(group[0])
+    mosaic_params["cameraName"] = "Mosaic{}".format(group[0]["mosaicGroup"])
+    mosaic_params["frameWidth"], mosaic_params["frameHeight"] = size
+    mosaic_params["mosaicTiles"] = tiles
+    # The canvas is reused for every frame
+    mosaic_params["writerProcess"] = True
+    return mosaic_params
+
+
+def WriteMosaic(group, rings, readyQueue=None):
+    """
+    Writer process of one camera group: take the frames of every camera's ring with
+    the next frameNumber, copy them into their tiles of the canvas, and encode the
+    canvas. A camera without that frame (dropped by its ring) gets a black tile
+    and a padded timestamp record. A camera that stops early leaves a black tile
+    until every camera has stopped.
+    """
+    mosaic_params = MosaicParams(group)
+
+    def Progress(stats):
+        # Every camera in the group shows the mosaic encoder's progress
+        for ring in rings:
+            ring.set_progress(stats)
+
+    def ReportWarmed(phase):
+        for cam_params in group:
+            readiness.Report(
+                readyQueue, cam_params["cameraName"], phase, time.perf_counter() - t0
+            )
+
+    t0 = time.perf_counter()
+    placement.PlaceWriter(mosaic_params)
+    try:
+        with placement.SpawnOn(mosaic_params):
+            warmed = writer.WarmEncoder(mosaic_params)
+            if warmed:
+                video_writer, metadata_writer, writing, readQueue = writer.OpenWriter(
+                    mosaic_params, rings[0], progress=Progress
+                )
+    except Exception:
+        ReportWarmed(readiness.FAILED)
+        raise
+    ReportWarmed("warmed" if warmed else readiness.FAILED)
+    if not warmed:
+        # Triggers won't start: let the grabbers stop, without starting ffmpeg
+        for cam_params, ring in zip(group, rings):
+            writer.DiscardFrames(ring, cam_params["cameraName"])
+            ring.close()
+        return
+    # Ctrl+C stops every camera of the group
+    readQueue["queue"] = list(rings)
+    video_name = Path(mosaic_params["videoFolder"]) / mosaic_params["cameraName"]
+    video_name = (video_name / mosaic_params["videoFilename"]).as_posix()
+    if mosaic_params["videoSegmentLengthInSec"] > 0:
+        _, video_name = writer.SegmentParams(
+            mosaic_params["videoSegmentLengthInSec"], video_name
+        )
+
+    # Per-camera metadata, with the tile placement saved in cam_params.json
+    cam_writers = []
+    for cam_params, tile in zip(group, mosaic_params["mosaicTiles"]):
+        folder_name = os.path.join(cam_params["videoFolder"], cam_params["cameraName"])
+        os.makedirs(folder_name, exist_ok=True)
+        cam_params = dict(cam_params)
+        cam_params["mosaicTile"] = dict(tile, video=video_name)
+        cam_writer = writer.OpenMetadataWriter(folder_name, cam_params)
+        cam_writer.send(None)  # Initialize the generator
+        cam_writers.append(cam_writer)
+    console.log(
+        "Encoding {} cameras into {} ({}x{}).".format(
+            len(group),
+            video_name,
+            mosaic_params["frameWidth"],
+            mosaic_params["frameHeight"],
+        )
+    )
+
+    shape, dtype = FrameShape(mosaic_params)
+    canvas = np.zeros(shape, dtype=dtype)
+    views = [
+        canvas[t["y"] : t["y"] + t["frameHeight"], t["x"] : t["x"] + t["frameWidth"]]
+        for t in mosaic_params["mosaicTiles"]
+    ]
+    stopped = [False] * len(rings)
+    # Next frame of each camera (a one-item batch), held until its frameNumber is due
+    pending = [None] * len(rings)
+    # Mosaic frames are numbered like camera frames (first frame = 1)
+    frameNumber = 0
+
+    try:
+        with QueueKeyboardInterrupt(readQueue):
+            while True:
+                for i, ring in enumerate(rings):
+                    if stopped[i] or pending[i] is not None:
+                        continue
+                    batch = writer.NextBatch(ring, group[i]["cameraName"], 1)
+                    if batch and batch[0] is not STOP:
+                        pending[i] = batch
+                        continue
+                    stopped[i] = True
+                    views[i][...] = 0
+                    ring.release(batch)
+                due = [batch[0][0] for batch in pending if batch is not None]
+                if not due:
+                    break
+
+                # Tile every camera's frame with the lowest pending frameNumber
+                target = min(due)
+                timeStamp = None
+                for i, batch in enumerate(pending):
+                    if batch is None:
+                        continue
+                    camFrameNumber, camTimeStamp, img, flags = batch[0]
+                    if camFrameNumber == target:
+                        views[i][...] = img
+                        cam_writers[i].send(batch)
+                        if timeStamp is None:
+                            timeStamp = camTimeStamp
+                        rings[i].release(batch)
+                        pending[i] = None
+                    else:
+                        # Dropped by this camera: pad with a black tile
+                        views[i][...] = 0
+                        padTimeStamp = camTimeStamp - (camFrameNumber - target) / (
+                            mosaic_params["frameRate"]
+                        )
+                        cam_writers[i].send(
+                            [(target, padTimeStamp, None, TIMESTAMP_FLAG_PADDED)]
+                        )
+                frameNumber += 1
+                video_writer.send(canvas)
+                metadata_writer.send([(frameNumber, timeStamp, None, 0)])
+    except Exception:
+        console.log(
+            "Caught exception at mosaic.py WriteMosaic:\n" + traceback.format_exc()
+        )
+        raise
+    finally:
+        for i, batch in enumerate(pending):
+            if batch is not None:
+                rings[i].release(batch)
+        console.log(f"Closing mosaic writer for {video_name}. Please wait...")
+        video_writer.close()
+        metadata_writer.close()
+        for cam_writer in cam_writers:
+            cam_writer.close()
+        for ring in rings:
+            ring.close()
+
+
+def ExtractCamera(folder_name, loglevel="quiet"):
+    """
+    Crop one camera's tile out of its mosaic video and encode it into the camera
+    folder with the camera's own encoder settings. Returns the ffmpeg return code.
+    """
+    with open(Path(folder_name) / "cam_params.json", "r") as f:
+        cam_params = json.load(f)
+    tile = cam_params["mosaicTile"]
+    codec, pix_fmt_out, output_params = writer.EncoderParams(cam_params)
+
+    # One output per mosaic file (e.g. per segment)
+    video = tile["video"]
+    if "%" in video:
+        videos = sorted(glob.glob(video.replace("%05d", "[0-9]" * 5)))
+    else:
+        videos = [video]
+    crop = "crop={}:{}:{}:{}".format(
+        tile["frameWidth"], tile["frameHeight"], tile["x"], tile["y"]
+    )
+    # Skip the black frames after this camera stopped (one timestamp record per frame)
+    numFrames = CountTimestamps(folder_name)
+
+    for video in videos:
+        output = (Path(folder_name) / Path(video).name).as_posix()
+        cmd = [writer.FFmpegExe(), "-y", "-i", video, "-vf", crop]
+        cmd += ["-vcodec", codec, "-pix_fmt", pix_fmt_out, "-v", loglevel]
+        if len(videos) == 1:
+            cmd += ["-frames:v", str(numFrames)]
+        cmd += output_params + [output]
+        result = subprocess.run(cmd)
+        if result.returncode != 0:
+            console.log(f"Failed to extract {cam_params['cameraName']} from {video}.")
+            return result.returncode
+        console.log(f"Extracted {cam_params['cameraName']} from {video} -> {output}")
+    return 0
+
+
+def Main():
+    parser = ArgumentParser(
+        description="Extract camera views from campy mosaic videos",
+        formatter_class=ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "folders",
+        metavar="folders",
+        nargs="+",
+        help="Camera folders (containing cam_params.json with a mosaicTile).",
+    )
+    parser.add_argument(
+        "--ffmpegLogLevel",
+        dest="ffmpegLogLevel",
+        type=ast.literal_eval,
+        default="'quiet'",
+        help="Sets verbosity level for ffmpeg logging.",
+    )
+    clargs = parser.parse_args()
+    for folder_name in clargs.folders:
+        ExtractCamera(folder_name, clargs.ffmpegLogLevel)
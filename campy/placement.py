@@ -0,0 +1,197 @@
+"""
+CPU placement of a camera's threads and encoders (Linux).
+Core sets are Linux cpu-list strings ("2", "2-3", "0-3,8") or NUMA nodes ("node1").
+A thread pins itself with PinThread. Child processes (ffmpeg) inherit the core set
+of the thread that launches them, so encoders are launched inside SpawnOn. Threads
+inherit it too, so helper threads started inside SpawnOn are made with HelperThread,
+which moves them back to the core set the launching thread had before SpawnOn.
+The placement actually obtained is read back from the kernel and logged.
+"""
+
+import os, threading
+from contextlib import contextmanager
+from rich.console import Console
+
+
+console = Console()
+
+MCL_CURRENT, MCL_FUTURE = 1, 2
+
+# Core set of the calling thread before it entered SpawnOn
+_spawning = threading.local()
+
+
+def ParseCpus(spec):
+    """Return the set of CPUs in a core set spec, or None if placement is off."""
+    if spec is None or spec == "None" or spec == "":
+        return None
+    if type(spec) is int:
+        return {spec}
+    spec = str(spec).strip()
+    if spec.startswith("node"):
+        try:
+            with open("/sys/devices/system/node/{}/cpulist".format(spec)) as f:
+                spec = f.read().strip()
+        except FileNotFoundError:
+            raise ValueError("No NUMA node {}".format(spec))
+    cpus = set()
+    for part in spec.split(","):
+        first, _, last = part.strip().partition("-")
+        cpus.update(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def FormatCpus(cpus):
+    """Format a set of CPUs as a cpu-list string, e.g. {0, 1, 2, 5} -> '0-2,5'."""
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(str(a) if a == b else "{}-{}".format(a, b) for a, b in ranges)
+
+
+def Supported():
+    return hasattr(os, "sched_setaffinity")
+
+
+def PinThread(spec):
+    """Pin the calling thread to a core set. Returns the CPUs it now runs on."""
+    cpus = ParseCpus(spec)
+    if cpus is not None:
+        # On Linux, pid 0 is the calling thread, not the whole process
+        os.sched_setaffinity(0, cpus)
+    return os.sched_getaffinity(0)
+
+
+def SetRealtime(priority):
+    """Run the calling thread with SCHED_FIFO at priority (1-99)."""
+    os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+
+
+def LockMemory(future=True):
+    """Lock the process's current (and future) pages in RAM (mlockall)."""
+    import ctypes, ctypes.util
+
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    if libc.mlockall(MCL_CURRENT | (MCL_FUTURE if future else 0)) != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+
+
+def Scheduler():
+    # Scheduling policy and priority of the calling thread, e.g. "SCHED_FIFO 50"
+    policy = os.sched_getscheduler(0)
+    if policy == os.SCHED_FIFO:
+        return "SCHED_FIFO {}".format(os.sched_getparam(0).sched_priority)
+    if policy == os.SCHED_RR:
+        return "SCHED_RR {}".format(os.sched_getparam(0).sched_priority)
+    return "SCHED_OTHER"
+
+
+def Report(cam_params, role, cpus=None):
+    console.log(
+        "[green]{}[/green] {}: CPUs {}, {}".format(
+            cam_params["cameraName"],
+            role,
+            FormatCpus(cpus if cpus is not None else os.sched_getaffinity(0)),
+            Scheduler(),
+        )
+    )
+
+
+def PlaceGrabThread(cam_params):
+    """Pin the grab thread, optionally with real-time priority and locked memory."""
+    if not Supported():
+        if cam_params["grabCpus"] != "None" or cam_params["grabPriority"]:
+            console.log("CPU placement is only supported on Linux.")
+        return
+    try:
+        PinThread(cam_params["grabCpus"])
+    except (OSError, ValueError) as e:
+        console.log(
+            "Could not pin {} grab thread: {}".format(cam_params["cameraName"], e)
+        )
+    if cam_params["grabPriority"] > 0:
+        try:
+            SetRealtime(cam_params["grabPriority"])
+        except (OSError, ValueError) as e:
+            console.log(
+                "Could not set SCHED_FIFO for {} grab thread: {} "
+                "(needs CAP_SYS_NICE or an rtprio limit).".format(
+                    cam_params["cameraName"], e
+                )
+            )
+    if cam_params["lockMemory"]:
+        # Future mappings would include the multi-GB spill spool (locked or failing)
+        future = cam_params["writeQueuePolicy"] != "Spill"
+        if not future:
+            console.log(
+                "{}: with writeQueuePolicy 'Spill', lockMemory only locks memory "
+                "allocated so far (not the spool file or later frames).".format(
+                    cam_params["cameraName"]
+                )
+            )
+        try:
+            LockMemory(future)
+            console.log(
+                "[green]{}[/green] memory locked.".format(cam_params["cameraName"])
+            )
+        except OSError as e:
+            console.log(
+                "Could not lock {} memory: {} "
+                "(needs CAP_IPC_LOCK or ulimit -l unlimited).".format(
+                    cam_params["cameraName"], e
+                )
+            )
+    Report(cam_params, "grab thread")
+
+
+def PlaceWriter(cam_params):
+    """
+    Pin the writer loop to its core set (called from the writer thread, before
+    SpawnOn, so helper threads started there return to it).
+    """
+    if not Supported():
+        return
+    try:
+        PinThread(cam_params["writerCpus"])
+    except (OSError, ValueError) as e:
+        console.log("Could not pin {} writer: {}".format(cam_params["cameraName"], e))
+    Report(cam_params, "writer")
+
+
+@contextmanager
+def SpawnOn(cam_params):
+    """Launch child processes (ffmpeg) inside this block to place them on ffmpegCpus."""
+    if not Supported() or cam_params["ffmpegCpus"] in (None, "None", ""):
+        yield
+        return
+    saved = os.sched_getaffinity(0)
+    try:
+        Report(cam_params, "ffmpeg", PinThread(cam_params["ffmpegCpus"]))
+    except (OSError, ValueError) as e:
+        console.log("Could not pin {} ffmpeg: {}".format(cam_params["cameraName"], e))
+    _spawning.saved = saved
+    try:
+        yield
+    finally:
+        _spawning.saved = None
+        os.sched_setaffinity(0, saved)
+
+
+def HelperThread(target, args=()):
+    """
+    Daemon thread for target(*args). Started inside SpawnOn, it runs on the core
+    set the launching thread had before SpawnOn instead of ffmpegCpus.
+    """
+    cpus = getattr(_spawning, "saved", None)
+    if cpus is None:
+        return threading.Thread(target=target, args=args, daemon=True)
+
+    def Run():
+        os.sched_setaffinity(0, cpus)
+        target(*args)
+
+    return threading.Thread(target=Run, daemon=True)
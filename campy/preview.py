@@ -0,0 +1,59 @@
+"""
+Cheap display frames for the live view, computed in the grab thread.
+Frames are reduced by displayDownsample with strided views before any pixel work:
+mono and RGB frames are decimated, and raw Bayer frames are binned straight into a
+small RGB image (one 2x2 Bayer cell per output pixel, green averaged), instead of
+debayering the full frame and then throwing most of it away.
+"""
+
+import numpy as np
+
+
+# Position (row, column) of each color in a 2x2 Bayer cell, in pattern order
+OFFSETS = [(0, 0), (0, 1), (1, 0), (1, 1)]
+
+
+def BayerPattern(pixelFormat):
+    """Color order of a Bayer pixel format ("bayer_rggb8" -> "rggb"), else None."""
+    if not pixelFormat.startswith("bayer_"):
+        return None
+    return pixelFormat[len("bayer_") : len("bayer_") + 4]
+
+
+def Decimate(img, factor):
+    """Every factor-th pixel of a mono or RGB frame (a view, no copy)."""
+    return img[::factor, ::factor]
+
+
+def BinBayer(raw, pattern, factor=2):
+    """
+    RGB image of a raw Bayer frame, reduced by factor (rounded down to an even
+    number, at least 2). Every output pixel is one 2x2 Bayer cell, taken from every
+    factor/2-th cell.
+    """
+    step = 2 * max(1, factor // 2)
+    raw = raw[: raw.shape[0] & ~1, : raw.shape[1] & ~1]
+    planes = [raw[dy::step, dx::step] for dy, dx in OFFSETS]
+    greens = [i for i, color in enumerate(pattern) if color == "g"]
+    g1, g2 = (np.ascontiguousarray(planes[i]) for i in greens)
+    # Average of the two greens without widening: (a & b) + ((a ^ b) >> 1)
+    half = np.bitwise_xor(g1, g2)
+    half >>= 1
+    g1 &= g2
+    g1 += half
+    rgb = np.empty(g1.shape + (3,), dtype=raw.dtype)
+    rgb[:, :, 0] = planes[pattern.index("r")]
+    rgb[:, :, 1] = g1
+    rgb[:, :, 2] = planes[pattern.index("b")]
+    return rgb
+
+
+def PreviewImage(cam_params, img, pattern=None):
+    """
+    Display frame of a grabbed frame, reduced by displayDownsample. Raw Bayer frames
+    (pixelFormatInput "bayer_*", or an explicit pattern) become RGB.
+    """
+    pattern = pattern or BayerPattern(cam_params["pixelFormatInput"])
+    if pattern is not None and img.ndim == 2:
+        return BinBayer(img, pattern, cam_params["displayDownsample"])
+    return Decimate(img, cam_params["displayDownsample"])
@@ -0,0 +1,62 @@
+"""
+Cross-process start barrier. Each camera reports when it is armed (grabbing and
+waiting for triggers) and when its encoder is warmed (ffmpeg launched and primed).
+The main process waits for every camera before it starts the triggers, so the
+first frames land on open cameras and running encoders. Phase durations are logged.
+A camera that fails a phase reports FAILED instead. Then, or if a camera is not
+ready in time, the triggers are not started.
+"""
+
+import time, queue
+from rich.console import Console
+
+
+console = Console()
+
+PHASES = ["armed", "warmed"]
+FAILED = "failed"
+
+
+def Report(readyQueue, cameraName, phase, seconds):
+    """Report that a camera finished a startup phase (or FAILED), after seconds."""
+    if readyQueue is not None:
+        readyQueue.put((cameraName, phase, seconds))
+
+
+def WaitReady(readyQueue, cameraNames, t0, timeout=30):
+    """
+    Wait until every camera reported every phase, logging each report with its
+    duration and the time since t0 (perf_counter). Returns None on timeout, False
+    as soon as a camera failed, else True.
+    """
+    waiting = {(name, phase) for name in cameraNames for phase in PHASES}
+    deadline = time.perf_counter() + timeout
+    while waiting:
+        try:
+            cameraName, phase, seconds = readyQueue.get(
+                timeout=max(0.01, min(0.5, deadline - time.perf_counter()))
+            )
+        except queue.Empty:
+            if time.perf_counter() > deadline:
+                console.log(
+                    "Not ready after {} s: {}".format(
+                        timeout,
+                        ", ".join("{} {}".format(*w) for w in sorted(waiting)),
+                    )
+                )
+                return None
+            continue
+        if phase == FAILED:
+            console.log(
+                "[red]{}[/red] failed to get ready after {:.2f} s (at {:.2f} s)".format(
+                    cameraName, seconds, time.perf_counter() - t0
+                )
+            )
+            return False
+        waiting.discard((cameraName, phase))
+        console.log(
+            "[green]{}[/green] {} in {:.2f} s (at {:.2f} s)".format(
+                cameraName, phase, seconds, time.perf_counter() - t0
+            )
+        )
+    return True
@@ -0,0 +1,42 @@
+"""
+Assignment of cameras to acquisition worker processes.
+By default (numWorkers 0) every camera gets its own process. Otherwise several
+cameras share a worker process, each with its own grab and write threads, so large
+arrays start fewer Python interpreters.
+Cameras are spread by frame bandwidth: largest first, onto the least loaded worker.
+"""
+
+import os, math
+import numpy as np
+from campy.framering import FrameShape
+
+
+def Bandwidth(cam_params):
+    # Bytes per second grabbed from the camera
+    shape, dtype = FrameShape(cam_params)
+    return int(np.prod(shape)) * dtype.itemsize * cam_params["frameRate"]
+
+
+def NumWorkers(cam_params_list, numWorkers, workerBandwidthInMBps):
+    """Number of worker processes for numWorkers (0: one per camera, -1: auto)."""
+    numCams = len(cam_params_list)
+    if numWorkers == 0:
+        return numCams
+    if numWorkers < 0:
+        # Enough workers for the total bandwidth, at most one per core
+        total = sum(Bandwidth(cam_params) for cam_params in cam_params_list)
+        numWorkers = math.ceil(total / (workerBandwidthInMBps * 2 ** 20))
+        numWorkers = min(numWorkers, os.cpu_count() or 1)
+    return max(1, min(numWorkers, numCams))
+
+
+def WorkerGroups(cam_params_list, numWorkers, workerBandwidthInMBps):
+    """Camera indices (n_cam) run by each worker process."""
+    numWorkers = NumWorkers(cam_params_list, numWorkers, workerBandwidthInMBps)
+    groups = [[] for i in range(numWorkers)]
+    loads = [0] * numWorkers
+    for cam_params in sorted(cam_params_list, key=Bandwidth, reverse=True):
+        w = loads.index(min(loads))
+        groups[w].append(cam_params["n_cam"])
+        loads[w] += Bandwidth(cam_params)
+    return sorted(sorted(group) for group in groups)
@@ -0,0 +1,87 @@
+"""
+Binary timestamp records written next to each video by writer.OpenMetadataWriter.
+
+timestamps.bin is a headerless, append-only array of TIMESTAMP_DTYPE records,
+one per frame written to the video, in video frame order:
+    frameNumber: int64, camera frame number
+    timeStamp:   int64, nanoseconds since the first written frame
+    flags:       int64, per-frame status bits (TIMESTAMP_FLAG_*)
+
+TIMESTAMP_FLAG_GAP marks frames preceded by a gap in the camera's hardware frame
+IDs, i.e. the camera dropped frames right before this one (see metadata.csv and
+framestats.json for the number of frames lost).
+
+TIMESTAMP_FLAG_PADDED marks placeholder records of mosaic cameras (campy.mosaic):
+the camera has no frame with this frameNumber, and its tile in the mosaic video
+frame is black. Their timeStamp is estimated from the camera's next frame.
+
+Load it with LoadTimestamps (or np.memmap(path, dtype=TIMESTAMP_DTYPE, mode="r")).
+The absolute time of the first frame is saved as "firstTimeStamp" in timing.json.
+
+Usage (export to timestamps.csv with frameNumber and timeStamp in seconds):
+campy-timestamps ./test.221018_101010/Camera0 ./test.221018_101010/Camera1
+"""
+
+import os, csv
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from pathlib import Path
+import numpy as np
+
+
+TIMESTAMP_DTYPE = np.dtype(
+    [
+        ("frameNumber", "<i8"),
+        ("timeStamp", "<i8"),
+        ("flags", "<i8"),
+    ]
+)
+
+TIMESTAMP_FLAG_GAP = 1
+TIMESTAMP_FLAG_PADDED = 2
+
+
+def TimestampPath(folder_name):
+    return (Path(folder_name) / "timestamps.bin").as_posix()
+
+
+def LoadTimestamps(folder_name):
+    # Memory-mapped records (read-only); also works while the file is being written
+    path = TimestampPath(folder_name)
+    if os.path.getsize(path) < TIMESTAMP_DTYPE.itemsize:
+        return np.zeros(0, dtype=TIMESTAMP_DTYPE)
+    return np.memmap(path, dtype=TIMESTAMP_DTYPE, mode="r")
+
+
+def CountTimestamps(folder_name):
+    return os.path.getsize(TimestampPath(folder_name)) // TIMESTAMP_DTYPE.itemsize
+
+
+def ExportCSV(folder_name, chunk_size=2 ** 20):
+    # Same columns as the CSV written by earlier campy versions
+    records = LoadTimestamps(folder_name)
+    csv_path = (Path(folder_name) / "timestamps.csv").as_posix()
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.writer(f, delimiter=",")
+        writer.writerow(["frameNumber", "timeStamp"])
+        for i in range(0, len(records), chunk_size):
+            chunk = records[i : i + chunk_size]
+            writer.writerows(
+                zip(chunk["frameNumber"].tolist(), (chunk["timeStamp"] / 1e9).tolist())
+            )
+    return csv_path
+
+
+def Main():
+    parser = ArgumentParser(
+        description="Export campy timestamps.bin files to CSV",
+        formatter_class=ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "folders",
+        metavar="folders",
+        nargs="+",
+        help="Camera folders containing timestamps.bin.",
+    )
+    clargs = parser.parse_args()
+    for folder_name in clargs.folders:
+        print("Saved", ExportCSV(folder_name))
@@ -0,0 +1,202 @@
+"""
+"campy-transcode" converts raw chunks recorded with codec: "raw" into compressed video.
+Chunks from every camera in a session are encoded in parallel with a process pool,
+using the same encoder parameters as the real-time writer (writer.EncoderParams).
+Unless the recording was segmented (videoSegmentLengthInSec), the encoded chunks
+are then joined (stream copy, no re-encoding) into one video file per camera.
+
+Usage:
+campy-transcode ./test.221018_101010 --quality 21
+"""
+
+import os, ast, json, subprocess, time
+import multiprocessing as mp
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from pathlib import Path
+from rich.console import Console
+from campy import writer
+
+
+console = Console()
+
+
+def ParseClargs(parser):
+    parser.add_argument(
+        "folder",
+        metavar="folder",
+        help="Session folder (or single camera folder) containing raw recordings.",
+    )
+    parser.add_argument(
+        "--codec",
+        dest="codec",
+        type=ast.literal_eval,
+        help="Video codec for compression. Currently supported: 'h264', 'h265' (hevc). \
+            Default: as recorded, or 'h264' for raw recordings.",
+    )
+    parser.add_argument(
+        "--gpuID",
+        dest="gpuID",
+        type=int,
+        help="GPU index to compress with. Set to -1 to compress with CPU. Default: as recorded.",
+    )
+    parser.add_argument(
+        "--gpuMake",
+        dest="gpuMake",
+        type=ast.literal_eval,
+        help="Company that produced the GPU. Default: as recorded.",
+    )
+    parser.add_argument(
+        "--quality",
+        dest="quality",
+        type=int,
+        help="Compression quality. Default: as recorded.",
+    )
+    parser.add_argument(
+        "--preset",
+        dest="preset",
+        type=ast.literal_eval,
+        help="Compression preset (e.g. 'slow', 'fast'). Default: as recorded.",
+    )
+    parser.add_argument(
+        "--pixelFormatOutput",
+        dest="pixelFormatOutput",
+        type=ast.literal_eval,
+        help="Pixel format output. Default: as recorded.",
+    )
+    parser.add_argument(
+        "--numWorkers",
+        dest="numWorkers",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of chunks to encode in parallel.",
+    )
+    parser.add_argument(
+        "--deleteRaw",
+        dest="deleteRaw",
+        type=bool,
+        default=False,
+        help="If True, delete raw chunks after they are transcoded successfully.",
+    )
+    return parser.parse_args()
+
+
+def FindRawIndexes(folder):
+    return sorted(Path(folder).glob("**/*.raw.json"))
+
+
+def LoadRawStream(index_path, clargs):
+    # Combine recorded camera params with the encoder options given on the command line
+    index_path = Path(index_path)
+    with open(index_path, "r") as f:
+        index = json.load(f)
+    with open(index_path.parent / "cam_params.json", "r") as f:
+        cam_params = json.load(f)
+
+    for key in ["codec", "gpuID", "gpuMake", "quality", "preset", "pixelFormatOutput"]:
+        value = getattr(clargs, key)
+        if value is not None:
+            cam_params[key] = value
+    if cam_params["codec"] == "raw":
+        cam_params["codec"] = "h264"
+
+    # Video name without the .raw.json suffix (e.g. "0.mp4")
+    video_name = index_path.name[: -len(".raw.json")] + Path(
+        cam_params["videoFilename"]
+    ).suffix
+    return index, cam_params, (index_path.parent / video_name).as_posix()
+
+
+def ChunkTasks(index, cam_params, full_file_name):
+    # One encoding task per raw chunk, with its output file
+    codec, pix_fmt_out, output_params = writer.EncoderParams(cam_params)
+    p = Path(full_file_name)
+    tasks = []
+    for i, chunk in enumerate(index["chunks"]):
+        if index["segmented"]:
+            out_file = p.with_suffix(".{:05d}{}".format(i, p.suffix))
+        else:
+            out_file = p.with_suffix(".{:05d}.part{}".format(i, p.suffix))
+        tasks.append(
+            {
+                "input": (p.parent / chunk["file"]).as_posix(),
+                "output": out_file.as_posix(),
+                "shape": index["shape"],
+                "pixelFormatInput": index["pixelFormatInput"],
+                "frameRate": index["frameRate"],
+                "codec": codec,
+                "pixelFormatOutput": pix_fmt_out,
+                "outputParams": output_params,
+                "ffmpegLogLevel": cam_params["ffmpegLogLevel"],
+            }
+        )
+    return tasks
+
+
+def TranscodeChunk(task):
+    height, width = task["shape"][:2]
+    cmd = writer.FFmpegCommand(
+        [width, height],
+        task["frameRate"],
+        task["codec"],
+        task["pixelFormatInput"],
+        task["pixelFormatOutput"],
+        task["outputParams"],
+        task["output"],
+        ffmpeg_log_level=task["ffmpegLogLevel"],
+        input_file=task["input"],
+    )
+    result = subprocess.run(cmd)
+    return task, result.returncode
+
+
+def Main():
+    parser = ArgumentParser(
+        description="Campy transcoder for raw recordings",
+        formatter_class=ArgumentDefaultsHelpFormatter,
+    )
+    clargs = ParseClargs(parser)
+
+    streams = []
+    for index_path in FindRawIndexes(clargs.folder):
+        index, cam_params, full_file_name = LoadRawStream(index_path, clargs)
+        tasks = ChunkTasks(index, cam_params, full_file_name)
+        streams.append((index, cam_params, full_file_name, tasks))
+    all_tasks = [task for stream in streams for task in stream[3]]
+    if not all_tasks:
+        console.log(f"No raw recordings found in {clargs.folder}.")
+        return
+
+    console.log(
+        f"Transcoding {len(all_tasks)} raw chunks from {len(streams)} cameras "
+        f"with {clargs.numWorkers} workers..."
+    )
+    t0 = time.perf_counter()
+    failed = set()
+    with mp.get_context("spawn").Pool(clargs.numWorkers) as p:
+        for task, returncode in p.imap_unordered(TranscodeChunk, all_tasks):
+            if returncode != 0:
+                failed.add(task["input"])
+                console.log(f"Failed to transcode {task['input']}.")
+            else:
+                console.log(f"Transcoded {task['input']} -> {task['output']}")
+
+    for index, cam_params, full_file_name, tasks in streams:
+        if any(task["input"] in failed for task in tasks):
+            console.log(f"Keeping raw chunks of {full_file_name} (transcode failed).")
+            continue
+        if not index["segmented"]:
+            outputs = [task["output"] for task in tasks]
+            # Exact chunk lengths, so the joined timestamps stay contiguous
+            durations = [
+                chunk["numFrames"] / index["frameRate"] for chunk in index["chunks"]
+            ]
+            loglevel = cam_params["ffmpegLogLevel"]
+            if writer.ConcatChunks(outputs, full_file_name, loglevel, durations) != 0:
+                console.log(f"Failed to join chunks into {full_file_name}.")
+                continue
+        console.log(f"Saved {full_file_name}")
+        if clargs.deleteRaw:
+            for task in tasks:
+                os.remove(task["input"])
+
+    console.log(f"Transcoding took {time.perf_counter() - t0:.1f} sec.")
@@ -4,7 +4,9 @@
 Inputs (from config.yaml -> params):
 	frameRate: rate in frames/sec to trigger
 	serialPort: COM port on PC for Arduino, e.g. 'COM3'
-Currently rely on time delay to allow Arduino to initialize
+The port is opened with the camera systems and triggers are fired once every
+camera is ready. Currently rely on time delay (counted from opening the port)
+to allow Arduino to initialize
 TODO: Implement interactive communication link with Python and Arduino
 E.g. Wait for 'Ready' message from Arduino to Python instead of "dumb" sleep
 """
@@ -13,16 +15,24 @@
 import time, logging
 
 
-def StartTriggers(systems, params):
+def OpenTriggers(systems, params):
 	try:
 		# Open serial connection
 		systems["serial"] = serial.Serial(\
 							port=params["serialPort"],
 							baudrate=115200,
 							timeout=0.1)
+		systems["serialOpenTime"] = time.perf_counter()
+
+	except Exception as e:
+		pass
+	return systems
 
-		# This sleep is important. Wait for Arduino to initialize
-		time.sleep(3)
+
+def FireTriggers(systems, params):
+	try:
+		# This sleep is important. Wait for Arduino to initialize (3 s after opening the port)
+		time.sleep(max(0, 3 - (time.perf_counter() - systems["serialOpenTime"])))
 
 		# Serialize pin length, IDs, and frame rate to a single string
 		serialList = [len(params["digitalPins"])] + params["digitalPins"] + [params["frameRate"]]
@@ -40,6 +50,11 @@ def StartTriggers(systems, params):
 	return systems
 
 
+def StartTriggers(systems, params):
+	systems = OpenTriggers(systems, params)
+	return FireTriggers(systems, params)
+
+
 def StopTriggers(systems):
 	print("Closing serial connection...")
 
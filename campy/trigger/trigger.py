@@ -14,14 +14,28 @@ def ImportTrigger(params):
 	return trigger
 
 
-def StartTriggers(systems, params):
+def OpenTriggers(systems, params):
+	# Connect to the trigger controller. Triggers start later, with FireTriggers
+	if params["startArduino"]:
+		if params["triggerController"] != "None":
+			trigger = ImportTrigger(params)
+			systems = trigger.OpenTriggers(systems, params)
+	return systems
+
+
+def FireTriggers(systems, params):
 	if params["startArduino"]:
 		if params["triggerController"] != "None":
 			trigger = ImportTrigger(params)
-			systems = trigger.StartTriggers(systems, params)
+			systems = trigger.FireTriggers(systems, params)
 	return systems
 
 
+def StartTriggers(systems, params):
+	systems = OpenTriggers(systems, params)
+	return FireTriggers(systems, params)
+
+
 def StopTriggers(systems, params):
 	if params["startArduino"]:
 		if params["triggerController"] != "None":
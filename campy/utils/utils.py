@@ -1,4 +1,5 @@
 import signal
+import threading
 import logging
 from datetime import datetime
 
@@ -6,7 +7,7 @@
 class QueueKeyboardInterrupt(object):
     """
     Usage:
-    from campy.utils.utils import HandleKeyboardInterrupt
+    from campy.utils.utils import QueueKeyboardInterrupt
 
     with QueueKeyboardInterrupt(queue):
             # stuff here will not be interrupted by SIGINT
@@ -14,18 +15,21 @@ class QueueKeyboardInterrupt(object):
     """
 
     def __init__(self, object):
-        # Insert queue object into keyboard interrupt handler for signaling
+        # Insert frame queue object (or a list of them) into keyboard interrupt handler for signaling
         self.queue = object["queue"]
-        self.message = object["message"]
 
     def __enter__(self):
         self.signal_received = False
-        self.old_handler = signal.signal(signal.SIGINT, self.handler)
+        # Handlers can only be installed by the main thread, which signals the other threads' queues
+        if threading.current_thread() is threading.main_thread():
+            self.old_handler = signal.signal(signal.SIGINT, self.handler)
 
     def handler(self, sig, frame):
         self.signal_received = (sig, frame)
         print("SIGINT received. KeyboardInterrupt has been queued.", flush=True)
-        self.queue.append(self.message)
+        queues = self.queue if type(self.queue) is list else [self.queue]
+        for queue in queues:
+            queue.request_stop()
 
     def __exit__(self, type, value, traceback):
         pass
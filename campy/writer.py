@@ -1,20 +1,34 @@
 """
 """
-from imageio_ffmpeg import write_frames
-import os, time
+import os, time, subprocess, queue
 from campy.utils.utils import QueueKeyboardInterrupt
+from campy import placement, readiness
+from campy.framequeue import STOP
+from campy.timestamps import TIMESTAMP_DTYPE, TimestampPath
 from rich.console import Console
 import traceback
 from pathlib import Path
-import csv
 import json
+from collections import deque
 from datetime import datetime
+from functools import partial
+import numpy as np
+
+
+# fcntl command to resize a pipe (Linux only, not exposed by the fcntl module before 3.10)
+F_SETPIPE_SZ = 1031
 
 
 console = Console()
 
 
 def OpenMetadataWriter(folder_name, cam_params, flush_every=500):
+    """
+    Append per-frame timestamp records (campy.timestamps) to timestamps.bin in
+    batches. Send a list of frame tuples (frameNumber, timeStamp, img, flags), e.g. the
+    frames of a write queue batch. Records are collected in a preallocated
+    buffer and written to disk every flush_every frames.
+    """
 
     # Save metadata
     cam_params_path = (Path(folder_name) / "cam_params.json").as_posix()
@@ -23,15 +37,11 @@ def OpenMetadataWriter(folder_name, cam_params, flush_every=500):
     console.log("Saved camera params to: " + cam_params_path)
 
     # Setup timestamp streamer
-    ts_path = (Path(folder_name) / "timestamps.csv").as_posix()
+    ts_path = TimestampPath(folder_name)
     console.log("Writing timestamps to: " + ts_path)
-    if Path(ts_path).exists():
-        Path(ts_path).unlink()
-    file = open(ts_path, "a", newline="")
-    writer = csv.DictWriter(
-        file, delimiter=",", fieldnames=["frameNumber", "timeStamp"]
-    )
-    writer.writeheader()
+    file = open(ts_path, "wb")
+    records = np.zeros(flush_every, dtype=TIMESTAMP_DTYPE)
+    n = 0
     t0 = None
 
     timing = {"started": str(datetime.now())}
@@ -39,21 +49,35 @@ def OpenMetadataWriter(folder_name, cam_params, flush_every=500):
     # Create a writer in a generator loop
     try:
         while True:
-            frameNumber, timeStamp = yield  # this blocks until the .send() is called
+            frames = yield  # this blocks until the .send() is called
+            if not frames:
+                continue
             if t0 is None:
-                t0 = timeStamp
+                t0 = frames[0][1]
                 timing["first_frame"] = str(datetime.now())
-            timeStamp -= t0
-            writer.writerow({"frameNumber": frameNumber, "timeStamp": timeStamp})
+                timing["firstTimeStamp"] = t0
+            i = 0
+            while i < len(frames):
+                count = min(len(frames) - i, flush_every - n)
+                chunk = frames[i : i + count]
+                records["frameNumber"][n : n + count] = [frame[0] for frame in chunk]
+                timeStamps = np.array([frame[1] for frame in chunk], dtype="float64")
+                records["timeStamp"][n : n + count] = np.rint((timeStamps - t0) * 1e9)
+                records["flags"][n : n + count] = [frame[3] for frame in chunk]
+                n += count
+                i += count
+                if n == flush_every:
+                    file.write(memoryview(records))
+                    file.flush()
+                    n = 0
             timing["last_frame"] = str(datetime.now())
-            if frameNumber % flush_every == 0:
-                file.flush()
     except GeneratorExit:
         pass
     except:
         console.log(traceback.format_exc())
         raise
     finally:
+        file.write(memoryview(records[:n]))
         file.flush()
         file.close()
         console.log(f"Closed metadata writer for: {ts_path}")
@@ -66,165 +90,831 @@ def OpenMetadataWriter(folder_name, cam_params, flush_every=500):
         console.log("Saved timing metadata to: " + timing_path)
 
 
-def OpenWriter(cam_params, queue):
-    try:
-        writing = False
-        folder_name = os.path.join(cam_params["videoFolder"], cam_params["cameraName"])
-        file_name = cam_params["videoFilename"]
-        full_file_name = os.path.join(folder_name, file_name)
-
-        if not os.path.isdir(folder_name):
-            os.makedirs(folder_name)
-            print("Made directory {}.".format(folder_name))
-
-        # Flip blue and red for flir camera input
-        if (
-            cam_params["pixelFormatInput"] == "bayer_bggr8"
-            and cam_params["cameraMake"] == "flir"
-        ):
-            cam_params["pixelFormatInput"] == "bayer_rggb8"
+def EncoderParams(cam_params):
+    """
+    Build the ffmpeg codec, output pixel format and output params for a camera stream.
+    Shared by the real-time video writer and campy-transcode.
+    """
+    # Load encoding parameters from cam_params
+    pix_fmt_out = cam_params["pixelFormatOutput"]
+    codec = str(cam_params["codec"])
+    quality = str(cam_params["quality"])
+    preset = str(cam_params["preset"])
+    frameRate = str(cam_params["frameRate"])
+    gpuID = str(cam_params["gpuID"])
 
-        # Load encoding parameters from cam_params
-        pix_fmt_out = cam_params["pixelFormatOutput"]
-        codec = str(cam_params["codec"])
-        quality = str(cam_params["quality"])
-        preset = str(cam_params["preset"])
-        frameRate = str(cam_params["frameRate"])
-        gpuID = str(cam_params["gpuID"])
+    # Load defaults
+    output_params = []
 
-        # Load defaults
-        output_params = []
+    # CPU compression
+    if cam_params["gpuID"] == -1:
+        if preset == "None":
+            preset = "fast"
+        output_params = [
+            "-r:v",
+            frameRate,
+            "-preset",
+            preset,
+            "-tune",
+            "fastdecode",
+            "-crf",
+            quality,
+            "-bufsize",
+            "20M",
+            "-maxrate",
+            "10M",
+            "-bf:v",
+            "4",
+            "-vsync",
+            "0",
+        ]
+        if pix_fmt_out == "rgb0" or pix_fmt_out == "bgr0":
+            pix_fmt_out = "yuv420p"
+        if cam_params["codec"] == "h264":
+            codec = "libx264"
+            output_params.append("-x264-params")
+            output_params.append("nal-hrd=cbr")
+        elif cam_params["codec"] == "h265":
+            codec = "libx265"
 
-        # CPU compression
-        if cam_params["gpuID"] == -1:
-            console.log(f"Opened: {full_file_name} using CPU to compress the stream.")
+    # GPU compression
+    else:
+        # Nvidia GPU (NVENC) encoder optimized parameters
+        if cam_params["gpuMake"] == "nvidia":
             if preset == "None":
                 preset = "fast"
             output_params = [
                 "-r:v",
-                frameRate,
+                frameRate,  # important to play nice with vsync "0"
                 "-preset",
-                preset,
-                "-tune",
-                "fastdecode",
-                "-crf",
+                preset,  # set to "fast", "llhp", or "llhq" for h264 or hevc
+                "-qp",
                 quality,
-                "-bufsize",
-                "20M",
-                "-maxrate",
-                "10M",
                 "-bf:v",
-                "4",
+                "0",
                 "-vsync",
                 "0",
+                "-2pass",
+                "0",
+                "-gpu",
+                gpuID,
+            ]
+            if cam_params["codec"] == "h264":
+                codec = "h264_nvenc"
+            elif cam_params["codec"] == "h265":
+                codec = "hevc_nvenc"
+
+        # AMD GPU (AMF/VCE) encoder optimized parameters
+        elif cam_params["gpuMake"] == "amd":
+            # Preset not supported by AMF
+            output_params = [
+                "-r:v",
+                frameRate,
+                "-usage",
+                "lowlatency",
+                "-rc",
+                "cqp",  # constant quantization parameter
+                "-qp_i",
+                quality,
+                "-qp_p",
+                quality,
+                "-qp_b",
+                quality,
+                "-bf:v",
+                "0",
+                "-hwaccel",
+                "auto",
+                "-hwaccel_device",
+                gpuID,
             ]
             if pix_fmt_out == "rgb0" or pix_fmt_out == "bgr0":
                 pix_fmt_out = "yuv420p"
             if cam_params["codec"] == "h264":
-                codec = "libx264"
-                output_params.append("-x264-params")
-                output_params.append("nal-hrd=cbr")
+                codec = "h264_amf"
+            elif cam_params["codec"] == "h265":
+                codec = "hevc_amf"
+
+        # Intel iGPU encoder (Quick Sync) optimized parameters
+        elif cam_params["gpuMake"] == "intel":
+            if preset == "None":
+                preset = "faster"
+            output_params = [
+                "-r:v",
+                frameRate,
+                "-bf:v",
+                "0",
+                "-preset",
+                preset,
+                "-q",
+                str(int(quality) + 1),
+            ]
+            if pix_fmt_out == "rgb0" or pix_fmt_out == "bgr0":
+                pix_fmt_out = "nv12"
+            if cam_params["codec"] == "h264":
+                codec = "h264_qsv"
             elif cam_params["codec"] == "h265":
-                codec = "libx265"
+                codec = "hevc_qsv"
+
+    return codec, pix_fmt_out, output_params
+
+
+def SegmentParams(segment_length_in_sec, full_file_name):
+    # Split output into numbered segments of fixed length (e.g. 0.00000.mp4, 0.00001.mp4)
+    mins, secs = divmod(segment_length_in_sec, 60)
+    hours, mins = divmod(mins, 60)
+    output_params = [
+        "-segment_time",
+        f"{hours:02}:{mins:02}:{secs:02}",
+        "-f",
+        "segment",
+        "-reset_timestamps",
+        "1",
+    ]
+    p = Path(full_file_name)
+    return output_params, p.with_suffix(".%05d" + p.suffix).as_posix()
+
+
+def FFmpegExe():
+    # A configured ffmpegPath (IMAGEIO_FFMPEG_EXE) avoids importing imageio-ffmpeg
+    exe = os.environ.get("IMAGEIO_FFMPEG_EXE")
+    if exe:
+        return exe
+    from imageio_ffmpeg import get_ffmpeg_exe
+
+    return get_ffmpeg_exe()
+
+
+def FFmpegCommand(
+    size,
+    fps,
+    codec,
+    pix_fmt_in,
+    pix_fmt_out,
+    output_params,
+    full_file_name,
+    ffmpeg_log_level="quiet",
+    input_file="-",
+    macro_block_size=16,
+    renditions=(),
+):
+    """
+    Build the ffmpeg command line for a raw frame stream, with the same input and
+    output arguments as imageio-ffmpeg write_frames. Each extra rendition (see
+    RenditionParams) is split off the decoded input inside the same ffmpeg process,
+    scaled and encoded to its own file, so frames cross the pipe only once.
+    """
+    width, height = size
+    cmd = [FFmpegExe(), "-y", "-f", "rawvideo", "-vcodec", "rawvideo"]
+    cmd += ["-s", f"{width}x{height}", "-pix_fmt", pix_fmt_in]
+    cmd += ["-r", "{:.02f}".format(fps), "-an", "-i", input_file]
+
+    # Pad size up to the codec macroblock size, as imageio-ffmpeg does
+    scale = None
+    if width % macro_block_size or height % macro_block_size:
+        out_w = -(-width // macro_block_size) * macro_block_size
+        out_h = -(-height // macro_block_size) * macro_block_size
+        scale = f"scale={out_w}:{out_h}"
+
+    if not renditions:
+        cmd += ["-vcodec", codec, "-pix_fmt", pix_fmt_out]
+        if scale is not None:
+            cmd += ["-vf", scale]
+        cmd += ["-v", ffmpeg_log_level] + output_params + [full_file_name]
+        return cmd
+
+    labels = "".join(f"[v{i}]" for i in range(len(renditions) + 1))
+    graph = [f"[0:v]split={len(renditions) + 1}{labels}"]
+    main = "[v0]"
+    if scale is not None:
+        graph.append(f"[v0]{scale}[main]")
+        main = "[main]"
+    for i, r in enumerate(renditions, 1):
+        graph.append(f"[v{i}]scale={r['frameWidth']}:{r['frameHeight']}[r{i}]")
+    cmd += ["-filter_complex", ";".join(graph), "-v", ffmpeg_log_level]
+    cmd += ["-map", main, "-vcodec", codec, "-pix_fmt", pix_fmt_out]
+    cmd += output_params + [full_file_name]
+    for i, r in enumerate(renditions, 1):
+        cmd += ["-map", f"[r{i}]", "-vcodec", r["codec"], "-pix_fmt", r["pixelFormatOutput"]]
+        cmd += r["outputParams"] + [r["fileName"]]
+    return cmd
+
+
+def RenditionParams(cam_params, full_file_name):
+    """
+    Encoder settings of the extra renditions in cam_params["videoRenditions"]
+    (e.g. downsampled preview copies), each written next to the main video as
+    <name>.<rendition name>.mp4. Rendition keys override the camera's own
+    codec, quality, preset, gpuID, gpuMake, pixelFormatOutput and
+    videoSegmentLengthInSec. Size is set by downsample or frameWidth/frameHeight.
+    """
+    if cam_params["videoRenditions"] == "None":
+        return []
+    renditions = []
+    p = Path(full_file_name)
+    for i, rendition in enumerate(cam_params["videoRenditions"]):
+        r_params = dict(cam_params)
+        r_params.update(rendition)
+        name = rendition.get("name", f"rendition{i}")
+        downsample = rendition.get("downsample", 1)
+        # Even sizes keep 4:2:0 chroma subsampling valid
+        frameWidth = rendition.get("frameWidth", cam_params["frameWidth"] // downsample)
+        frameHeight = rendition.get("frameHeight", cam_params["frameHeight"] // downsample)
+
+        codec, pix_fmt_out, output_params = EncoderParams(r_params)
+        file_name = p.with_suffix(f".{name}{p.suffix}").as_posix()
+        if r_params["videoSegmentLengthInSec"] > 0:
+            segment_params, file_name = SegmentParams(
+                r_params["videoSegmentLengthInSec"], file_name
+            )
+            output_params.extend(segment_params)
+        renditions.append(
+            {
+                "name": name,
+                "frameWidth": frameWidth // 2 * 2,
+                "frameHeight": frameHeight // 2 * 2,
+                "codec": codec,
+                "pixelFormatOutput": pix_fmt_out,
+                "outputParams": output_params,
+                "fileName": file_name,
+            }
+        )
+    return renditions
+
+
+def GrowPipe(fd):
+    """
+    Enlarge a pipe buffer up to the system limit (Linux), so ffmpeg can read
+    whole frames in one go and short encoder stalls do not block the writer.
+    Returns the resulting pipe size in bytes, or None where not supported.
+    """
+    try:
+        import fcntl
+
+        try:
+            with open("/proc/sys/fs/pipe-max-size", "r") as f:
+                size = int(f.read())
+        except (OSError, ValueError):
+            size = 2 ** 20
+        return fcntl.fcntl(fd, F_SETPIPE_SZ, size)
+    except (ImportError, OSError):
+        return None
+
+
+def DrainStderr(stream, lines):
+    # Keep reading ffmpeg output so a full stderr pipe can never stall the encoder
+    for line in iter(stream.readline, b""):
+        lines.append(line.decode(errors="replace").rstrip())
+        if len(lines) == lines.maxlen:
+            lines.popleft()
+    stream.close()
+
+
+def ProgressValue(stats, key, unit="", cast=float):
+    # "N/A" (e.g. total_size of segmented outputs) is reported as 0
+    value = stats.get(key, "N/A").replace(unit, "").strip()
+    return cast(0) if value in ("N/A", "") else cast(value)
+
+
+def ReadProgress(stream, progress):
+    # Parse ffmpeg's machine-readable -progress blocks (key=value lines, ending with "progress=")
+    stats = {}
+    for line in iter(stream.readline, b""):
+        key, _, value = line.decode(errors="replace").strip().partition("=")
+        stats[key] = value
+        if key != "progress":
+            continue
+        try:
+            progress(
+                {
+                    "frame": ProgressValue(stats, "frame", cast=int),
+                    "fps": ProgressValue(stats, "fps"),
+                    "speed": ProgressValue(stats, "speed", "x"),
+                    "bitrate": ProgressValue(stats, "bitrate", "kbits/s"),
+                    "totalSize": ProgressValue(stats, "total_size", cast=int),
+                }
+            )
+        except ValueError:
+            pass
+        stats = {}
+    stream.close()
+
+
+def WarmEncoder(cam_params, numFrames=2):
+    """
+    Encode a few blank frames with the camera's encoder settings and discard them,
+    so the ffmpeg binary, its libraries and the encoder (e.g. a GPU session) are
+    loaded before the first real frame. Returns False if ffmpeg failed.
+    """
+    if cam_params["codec"] == "raw":
+        return True
+    from campy.framering import FrameShape
+
+    codec, pix_fmt_out, output_params = EncoderParams(cam_params)
+    cmd = FFmpegCommand(
+        [cam_params["frameWidth"], cam_params["frameHeight"]],
+        cam_params["frameRate"],
+        codec,
+        cam_params["pixelFormatInput"],
+        pix_fmt_out,
+        output_params + ["-f", "null"],
+        "-",
+    )
+    shape, dtype = FrameShape(cam_params)
+    frames = np.zeros((numFrames,) + shape, dtype=dtype).tobytes()
+    try:
+        result = subprocess.run(
+            cmd,
+            input=frames,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            timeout=30,
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        console.log(f"Encoder warm-up failed for {cam_params['cameraName']}: {e}")
+        return False
+    if result.returncode != 0:
+        console.log(
+            f"Encoder warm-up failed for {cam_params['cameraName']}. "
+            "Set ffmpegLogLevel to 'warning' to see ffmpeg's errors."
+        )
+    return result.returncode == 0
+
+
+def OpenFFmpegWriter(cmd, full_file_name, progress=None):
+    """
+    Launch ffmpeg and write frames to its stdin directly from the frame memory
+    (no conversion to bytes or intermediate copies), with an enlarged pipe.
+    Drop-in replacement for the imageio-ffmpeg write_frames generator.
+
+    If progress is given, ffmpeg reports through -progress on stdout, and
+    progress(stats) is called from a background thread about twice a second with
+    frame (encoded frames), fps, speed (x real time), bitrate (kbit/s) and totalSize (bytes).
+
+    Usage:
+    writer = OpenFFmpegWriter(FFmpegCommand(...), full_file_name)
+    writer.send(None)  # Initialize the generator
+    writer.send(img)
+    writer.close()
+    """
+    if progress is not None:
+        cmd = cmd[:1] + ["-progress", "pipe:1"] + cmd[1:]
+    p = subprocess.Popen(
+        cmd,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.DEVNULL if progress is None else subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        bufsize=0,
+    )
+    fd = p.stdin.fileno()
+    pipe_size = GrowPipe(fd)
+    if pipe_size is not None:
+        console.log(f"ffmpeg pipe buffer for {full_file_name}: {pipe_size // 1024} KiB")
+
+    stderr_lines = deque(maxlen=100)
+    # Helper threads stay off ffmpegCpus when launched inside placement.SpawnOn
+    stderr_thread = placement.HelperThread(DrainStderr, (p.stderr, stderr_lines))
+    stderr_thread.start()
+    if progress is not None:
+        progress_thread = placement.HelperThread(ReadProgress, (p.stdout, progress))
+        progress_thread.start()
+
+    try:
+        while True:
+            img = yield
+            if not img.flags.c_contiguous:
+                img = np.ascontiguousarray(img)
+            view = memoryview(img).cast("B")
+            try:
+                while view:
+                    # os.write may write only part of the frame to a pipe
+                    view = view[os.write(fd, view) :]
+            except (BrokenPipeError, OSError) as e:
+                p.wait()
+                stderr_thread.join(timeout=1)
+                raise IOError(
+                    "ffmpeg stopped while writing {}: {}\n{}".format(
+                        full_file_name, e, "\n".join(stderr_lines)
+                    )
+                ) from None
+    except GeneratorExit:
+        pass
+    finally:
+        try:
+            p.stdin.close()
+        except OSError:
+            pass
+        p.wait()
+        stderr_thread.join(timeout=1)
+        if progress is not None:
+            progress_thread.join(timeout=1)
+        if p.returncode != 0:
+            console.log(
+                f"ffmpeg exited with code {p.returncode} for {full_file_name}:\n"
+                + "\n".join(stderr_lines)
+            )
+
+
+def ConcatChunks(outputs, full_file_name, loglevel, durations=None):
+    """
+    Join encoded chunks without re-encoding. If durations (seconds per chunk) are
+    given, each chunk starts exactly where the previous one ends, instead of where
+    the demuxer estimates the end of its last frame.
+    """
+    list_path = Path(full_file_name).with_suffix(".concat.txt")
+    with open(list_path, "w") as f:
+        for i, output in enumerate(outputs):
+            f.write("file '{}'\n".format(Path(output).name))
+            if durations is not None:
+                f.write("duration {:.9f}\n".format(durations[i]))
+    cmd = [
+        FFmpegExe(),
+        "-y",
+        "-f",
+        "concat",
+        "-safe",
+        "0",
+        "-i",
+        list_path.as_posix(),
+        "-c",
+        "copy",
+        "-v",
+        loglevel,
+        full_file_name,
+    ]
+    result = subprocess.run(cmd)
+    if result.returncode == 0:
+        for output in outputs:
+            os.remove(output)
+        os.remove(list_path)
+    return result.returncode
+
+
+def GopSize(cam_params):
+    # Frames per closed GOP block for parallel encoding (default: one second)
+    if cam_params["gopSize"] > 0:
+        return int(cam_params["gopSize"])
+    return max(1, int(round(cam_params["frameRate"])))
 
-        # GPU compression
+
+def QueuedFrames(cam_params, gop_size):
+    # Frames queued for each parallel encoder: one block, within the write queue budget
+    limits = [gop_size]
+    if cam_params["writeQueueSize"] > 0:
+        limits.append(cam_params["writeQueueSize"] // cam_params["numEncoders"])
+    if cam_params["writeQueueSizeInMB"] > 0:
+        from campy.framering import FrameShape
+
+        shape, dtype = FrameShape(cam_params)
+        frame_bytes = int(np.prod(shape)) * dtype.itemsize
+        budget = cam_params["writeQueueSizeInMB"] * 2 ** 20 // frame_bytes
+        limits.append(int(budget) // cam_params["numEncoders"])
+    return max(1, min(limits))
+
+
+def GopParams(gop_size, frameRate):
+    # Closed GOPs of exactly gop_size frames, each saved as its own numbered file
+    return [
+        "-g",
+        str(gop_size),
+        "-keyint_min",
+        str(gop_size),
+        "-sc_threshold",
+        "0",
+        "-force_key_frames",
+        f"expr:eq(mod(n,{gop_size}),0)",
+        "-f",
+        "segment",
+        "-segment_time",
+        str(gop_size / frameRate),
+        "-segment_time_delta",
+        str(0.5 / frameRate),
+        "-reset_timestamps",
+        "1",
+    ]
+
+
+def FeedEncoder(video_writer, blocks, errors):
+    # Feeder thread: write queued frames to one encoder, until None
+    try:
+        while True:
+            img = blocks.get()
+            if img is None:
+                break
+            video_writer.send(img)
+    except Exception as e:
+        errors.append(e)
+        # Unblock the writer if it is waiting on this encoder
+        while blocks.get() is not None:
+            pass
+    finally:
+        video_writer.close()
+
+
+def OpenParallelWriter(
+    cmds,
+    part_files,
+    full_file_name,
+    gop_size,
+    frameRate,
+    segment_blocks=0,
+    copy_frames=False,
+    loglevel="quiet",
+    progress=None,
+    queue_size=0,
+):
+    """
+    Encode consecutive blocks of gop_size frames round-robin on len(cmds) ffmpeg
+    processes, each fed from its own thread and queue (up to queue_size frames,
+    default one block), so per-camera throughput scales with the number of
+    encoders. Block b is encoded by encoder b % len(cmds) into
+    part_files[b % len(cmds)] % (b // len(cmds)).
+
+    On close, the blocks are joined in frame order without re-encoding into
+    full_file_name, or into segments of segment_blocks blocks when full_file_name
+    is a numbered pattern (e.g. 0.%05d.mp4). Every block lasts exactly its number
+    of frames / frameRate, so the joined video keeps a constant frame rate.
+
+    Frames are queued by reference, so copy_frames must be True when they are views
+    into buffers reused after send() returns (shared-memory ring, spool).
+    Progress of all encoders is summed before it is passed to progress(stats).
+    """
+    numEncoders = len(cmds)
+    errors = []
+    blocks = [queue.Queue(maxsize=queue_size or gop_size) for _ in range(numEncoders)]
+    feeders = []
+    encoder_stats = [{} for _ in cmds]
+
+    def EncoderProgress(k, stats):
+        encoder_stats[k] = stats
+        progress(
+            {
+                key: sum(s.get(key, 0) for s in encoder_stats)
+                for key in ["frame", "fps", "speed", "bitrate", "totalSize"]
+            }
+        )
+
+    for k, cmd in enumerate(cmds):
+        video_writer = OpenFFmpegWriter(
+            cmd,
+            part_files[k],
+            progress=None if progress is None else partial(EncoderProgress, k),
+        )
+        video_writer.send(None)  # Initialize the generator
+        feeder = placement.HelperThread(FeedEncoder, (video_writer, blocks[k], errors))
+        feeder.start()
+        feeders.append(feeder)
+
+    n = 0
+    try:
+        while True:
+            img = yield
+            if errors:
+                raise errors[0]
+            if copy_frames:
+                img = img.copy()
+            blocks[(n // gop_size) % numEncoders].put(img)
+            n += 1
+    except GeneratorExit:
+        pass
+    finally:
+        for k in range(numEncoders):
+            blocks[k].put(None)
+        for feeder in feeders:
+            feeder.join()
+        # Encoders that never got a block still leave an empty first part behind
+        for k in range(-(-n // gop_size), numEncoders):
+            if os.path.exists(part_files[k] % 0):
+                os.remove(part_files[k] % 0)
+
+        # Blocks in frame order, then grouped into output files
+        numBlocks = -(-n // gop_size)
+        parts = [
+            part_files[b % numEncoders] % (b // numEncoders) for b in range(numBlocks)
+        ]
+        durations = [
+            min(gop_size, n - b * gop_size) / frameRate for b in range(numBlocks)
+        ]
+        if segment_blocks > 0:
+            outputs = [
+                (
+                    full_file_name % i,
+                    parts[b : b + segment_blocks],
+                    durations[b : b + segment_blocks],
+                )
+                for i, b in enumerate(range(0, numBlocks, segment_blocks))
+            ]
+        else:
+            outputs = [(full_file_name, parts, durations)]
+        if errors:
+            console.log(f"Keeping encoded blocks of {full_file_name} (encoder failed).")
+        else:
+            for output, output_parts, output_durations in outputs:
+                if (
+                    output_parts
+                    and ConcatChunks(output_parts, output, loglevel, output_durations)
+                    != 0
+                ):
+                    console.log(f"Failed to join encoded blocks into {output}.")
+            console.log(f"Joined {numBlocks} blocks of {gop_size} frames into {full_file_name}")
+
+
+def OpenGopWriter(
+    cam_params, codec, pix_fmt_out, output_params, full_file_name, progress=None
+):
+    # Parallel GOP block encoding on numEncoders ffmpeg processes
+    gop_size = GopSize(cam_params)
+    p = Path(full_file_name)
+    segment_blocks = 0
+    if cam_params["videoSegmentLengthInSec"] > 0:
+        segment_frames = cam_params["videoSegmentLengthInSec"] * cam_params["frameRate"]
+        segment_blocks = max(1, int(round(segment_frames / gop_size)))
+        _, full_file_name = SegmentParams(
+            cam_params["videoSegmentLengthInSec"], full_file_name
+        )
+
+    cmds, part_files = [], []
+    for k in range(cam_params["numEncoders"]):
+        part_file = p.with_suffix(f".enc{k}.%05d{p.suffix}").as_posix()
+        cmds.append(
+            FFmpegCommand(
+                [cam_params["frameWidth"], cam_params["frameHeight"]],
+                cam_params["frameRate"],
+                codec,
+                cam_params["pixelFormatInput"],
+                pix_fmt_out,
+                output_params + GopParams(gop_size, cam_params["frameRate"]),
+                part_file,
+                ffmpeg_log_level=cam_params["ffmpegLogLevel"],
+            )
+        )
+        part_files.append(part_file)
+    console.log(
+        f"Encoding {full_file_name} on {cam_params['numEncoders']} encoders "
+        f"in blocks of {gop_size} frames."
+    )
+
+    # Ring slots, spooled frames and lent camera buffers are reused once the
+    # writer releases them
+    copy_frames = (
+        cam_params["writerProcess"]
+        or cam_params["writeQueuePolicy"] == "Spill"
+        or cam_params["lendFrames"]
+    )
+    return OpenParallelWriter(
+        cmds,
+        part_files,
+        full_file_name,
+        gop_size,
+        cam_params["frameRate"],
+        segment_blocks=segment_blocks,
+        copy_frames=copy_frames,
+        loglevel=cam_params["ffmpegLogLevel"],
+        progress=progress,
+        queue_size=QueuedFrames(cam_params, gop_size),
+    )
+
+
+def OpenRawWriter(cam_params, full_file_name):
+    """
+    Append frames to chunked, memory-mapped raw files (e.g. 0.00000.raw, 0.00001.raw)
+    without encoding. The frame index is saved next to them (e.g. 0.raw.json) and
+    updated after each chunk. Convert to video afterwards with campy-transcode.
+    """
+    p = Path(full_file_name)
+    index_path = p.with_suffix(".raw.json").as_posix()
+    chunk_length = cam_params["videoSegmentLengthInSec"]
+    if chunk_length <= 0:
+        chunk_length = cam_params["rawChunkLengthInSec"]
+    chunk_frames = max(1, int(round(chunk_length * cam_params["frameRate"])))
+
+    index = {
+        "pixelFormatInput": cam_params["pixelFormatInput"],
+        "frameRate": cam_params["frameRate"],
+        "chunkLengthInFrames": chunk_frames,
+        "segmented": cam_params["videoSegmentLengthInSec"] > 0,
+        "chunks": [],
+    }
+    chunk, n = None, 0
+
+    try:
+        while True:
+            img = yield
+            if chunk is None or n == chunk_frames:
+                if chunk is not None:
+                    chunk.flush()
+                    chunk = None  # unmaps the chunk file
+                    CloseRawChunk(index, index_path, p.parent, n)
+                if not index["chunks"]:
+                    index["shape"] = list(img.shape)
+                    index["dtype"] = img.dtype.str
+                    index["frameBytes"] = img.nbytes
+                chunk_file = p.with_suffix(
+                    ".{:05d}.raw".format(len(index["chunks"]))
+                ).name
+                chunk = np.memmap(
+                    os.path.join(p.parent, chunk_file),
+                    dtype=img.dtype,
+                    mode="w+",
+                    shape=(chunk_frames,) + img.shape,
+                )
+                index["chunks"].append(
+                    {
+                        "file": chunk_file,
+                        "firstFrame": sum(c["numFrames"] for c in index["chunks"]),
+                        "numFrames": 0,
+                    }
+                )
+                n = 0
+            chunk[n] = img
+            n += 1
+    except GeneratorExit:
+        pass
+    finally:
+        if chunk is not None:
+            chunk.flush()
+            chunk = None
+            CloseRawChunk(index, index_path, p.parent, n)
+        console.log(f"Closed raw writer for: {index_path}")
+
+
+def CloseRawChunk(index, index_path, folder_name, numFrames):
+    # Trim unused preallocated frames from the last chunk and save the frame index
+    entry = index["chunks"][-1]
+    entry["numFrames"] = numFrames
+    chunk_path = os.path.join(folder_name, entry["file"])
+    os.truncate(chunk_path, numFrames * index["frameBytes"])
+    with open(index_path, "w") as f:
+        json.dump(index, f, indent=4)
+
+
+def OpenWriter(cam_params, queue, progress=None):
+    # Encoder progress is reported to the grabber through the write queue by default
+    if progress is None:
+        progress = queue.set_progress
+
+    try:
+        writing = False
+        folder_name = os.path.join(cam_params["videoFolder"], cam_params["cameraName"])
+        file_name = cam_params["videoFilename"]
+        full_file_name = os.path.join(folder_name, file_name)
+
+        if not os.path.isdir(folder_name):
+            # The grabber may create it at the same time
+            os.makedirs(folder_name, exist_ok=True)
+            print("Made directory {}.".format(folder_name))
+
+        # Flip blue and red for flir camera input
+        if (
+            cam_params["pixelFormatInput"] == "bayer_bggr8"
+            and cam_params["cameraMake"] == "flir"
+        ):
+            cam_params["pixelFormatInput"] == "bayer_rggb8"
+
+        if cam_params["codec"] == "raw":
+            console.log(f"Opened: {full_file_name} raw chunks. Transcode with campy-transcode.")
+        elif cam_params["gpuID"] == -1:
+            console.log(f"Opened: {full_file_name} using CPU to compress the stream.")
         else:
-            # Nvidia GPU (NVENC) encoder optimized parameters
             print(
                 "Opened: {} using GPU {} to compress the stream.".format(
                     full_file_name, cam_params["gpuID"]
                 )
             )
-            if cam_params["gpuMake"] == "nvidia":
-                if preset == "None":
-                    preset = "fast"
-                output_params = [
-                    "-r:v",
-                    frameRate,  # important to play nice with vsync "0"
-                    "-preset",
-                    preset,  # set to "fast", "llhp", or "llhq" for h264 or hevc
-                    "-qp",
-                    quality,
-                    "-bf:v",
-                    "0",
-                    "-vsync",
-                    "0",
-                    "-2pass",
-                    "0",
-                    "-gpu",
-                    gpuID,
-                ]
-                if cam_params["codec"] == "h264":
-                    codec = "h264_nvenc"
-                elif cam_params["codec"] == "h265":
-                    codec = "hevc_nvenc"
-
-            # AMD GPU (AMF/VCE) encoder optimized parameters
-            elif cam_params["gpuMake"] == "amd":
-                # Preset not supported by AMF
-                output_params = [
-                    "-r:v",
-                    frameRate,
-                    "-usage",
-                    "lowlatency",
-                    "-rc",
-                    "cqp",  # constant quantization parameter
-                    "-qp_i",
-                    quality,
-                    "-qp_p",
-                    quality,
-                    "-qp_b",
-                    quality,
-                    "-bf:v",
-                    "0",
-                    "-hwaccel",
-                    "auto",
-                    "-hwaccel_device",
-                    gpuID,
-                ]
-                if pix_fmt_out == "rgb0" or pix_fmt_out == "bgr0":
-                    pix_fmt_out = "yuv420p"
-                if cam_params["codec"] == "h264":
-                    codec = "h264_amf"
-                elif cam_params["codec"] == "h265":
-                    codec = "hevc_amf"
-
-            # Intel iGPU encoder (Quick Sync) optimized parameters
-            elif cam_params["gpuMake"] == "intel":
-                if preset == "None":
-                    preset = "faster"
-                output_params = [
-                    "-r:v",
-                    frameRate,
-                    "-bf:v",
-                    "0",
-                    "-preset",
-                    preset,
-                    "-q",
-                    str(int(quality) + 1),
-                ]
-                if pix_fmt_out == "rgb0" or pix_fmt_out == "bgr0":
-                    pix_fmt_out = "nv12"
-                if cam_params["codec"] == "h264":
-                    codec = "h264_qsv"
-                elif cam_params["codec"] == "h265":
-                    codec = "hevc_qsv"
-
-        if cam_params["videoSegmentLengthInSec"] > 0:
-            mins, secs = divmod(cam_params["videoSegmentLengthInSec"], 60)
-            hours, mins = divmod(mins, 60)
-            output_params.extend(
-                [
-                    "-segment_time",
-                    f"{hours:02}:{mins:02}:{secs:02}",
-                    "-f",
-                    "segment",
-                    "-reset_timestamps",
-                    "1",
-                ]
+
+        codec, pix_fmt_out, output_params = EncoderParams(cam_params)
+
+        renditions = RenditionParams(cam_params, full_file_name)
+        if renditions and (
+            cam_params["codec"] == "raw" or cam_params["writerBackend"] != "native"
+        ):
+            console.log(
+                "videoRenditions need codec other than 'raw' and writerBackend 'native'. "
+                "Only the main video will be written."
+            )
+            renditions = []
+        for r in renditions:
+            console.log(
+                f"Rendition: {r['fileName']} at {r['frameWidth']}x{r['frameHeight']} "
+                f"using {r['codec']}"
             )
-            p = Path(full_file_name)
-            full_file_name = p.with_suffix(".%05d" + p.suffix).as_posix()
+
+        parallel = cam_params["numEncoders"] > 1 and cam_params["codec"] != "raw"
+        if parallel and (cam_params["writerBackend"] != "native" or renditions):
+            console.log(
+                "numEncoders > 1 needs writerBackend 'native' and no videoRenditions. "
+                "Using a single encoder."
+            )
+            parallel = False
+
+        if (
+            cam_params["videoSegmentLengthInSec"] > 0
+            and cam_params["codec"] != "raw"
+            and not parallel
+        ):
+            segment_params, full_file_name = SegmentParams(
+                cam_params["videoSegmentLengthInSec"], full_file_name
+            )
+            output_params.extend(segment_params)
 
     except Exception as e:
         console.log(
@@ -232,27 +922,58 @@ def OpenWriter(cam_params, queue):
         )
         raise
 
-    # Initialize writer object (imageio-ffmpeg)
+    # Initialize writer object (ffmpeg pipe, imageio-ffmpeg, or raw chunks without encoding)
     while True:
         try:
-            console.log("Video writer output_params:\n" " ".join(output_params))
-            writer = write_frames(
-                full_file_name,
-                [cam_params["frameWidth"], cam_params["frameHeight"]],  # size [W,H]
-                fps=cam_params["frameRate"],
-                quality=None,
-                codec=codec,
-                pix_fmt_in=cam_params[
-                    "pixelFormatInput"
-                ],  # "bayer_bggr8", "gray", "rgb24", "bgr0", "yuv420p"
-                pix_fmt_out=pix_fmt_out,
-                bitrate=None,
-                ffmpeg_log_level=cam_params[
-                    "ffmpegLogLevel"
-                ],  # "warning", "quiet", "info"
-                input_params=["-an"],  # "-an" no audio
-                output_params=output_params,
-            )
+            if cam_params["codec"] == "raw":
+                writer = OpenRawWriter(cam_params, full_file_name)
+                writer.send(None)  # Initialize the generator
+                writing = True
+                break
+
+            console.log("Video writer output_params:\n" + " ".join(output_params))
+            if parallel:
+                writer = OpenGopWriter(
+                    cam_params,
+                    codec,
+                    pix_fmt_out,
+                    output_params,
+                    full_file_name,
+                    progress=progress,
+                )
+            elif cam_params["writerBackend"] == "native":
+                cmd = FFmpegCommand(
+                    [cam_params["frameWidth"], cam_params["frameHeight"]],
+                    cam_params["frameRate"],
+                    codec,
+                    cam_params["pixelFormatInput"],
+                    pix_fmt_out,
+                    output_params,
+                    full_file_name,
+                    ffmpeg_log_level=cam_params["ffmpegLogLevel"],
+                    renditions=renditions,
+                )
+                writer = OpenFFmpegWriter(cmd, full_file_name, progress=progress)
+            else:
+                from imageio_ffmpeg import write_frames
+
+                writer = write_frames(
+                    full_file_name,
+                    [cam_params["frameWidth"], cam_params["frameHeight"]],  # size [W,H]
+                    fps=cam_params["frameRate"],
+                    quality=None,
+                    codec=codec,
+                    pix_fmt_in=cam_params[
+                        "pixelFormatInput"
+                    ],  # "bayer_bggr8", "gray", "rgb24", "bgr0", "yuv420p"
+                    pix_fmt_out=pix_fmt_out,
+                    bitrate=None,
+                    ffmpeg_log_level=cam_params[
+                        "ffmpegLogLevel"
+                    ],  # "warning", "quiet", "info"
+                    input_params=["-an"],  # "-an" no audio
+                    output_params=output_params,
+                )
             writer.send(None)  # Initialize the generator
             writing = True
             break
@@ -266,7 +987,6 @@ def OpenWriter(cam_params, queue):
     # Initialize read queue object to signal interrupt
     readQueue = {}
     readQueue["queue"] = queue
-    readQueue["message"] = "STOP"
 
     # Initialize metadata writer
     metadata_writer = OpenMetadataWriter(folder_name, cam_params)
@@ -275,28 +995,89 @@ def OpenWriter(cam_params, queue):
     return writer, metadata_writer, writing, readQueue
 
 
-def WriteFrames(cam_params, writeQueue, stopReadQueue, stopWriteQueue):
-    # Start ffmpeg video writer
-    video_writer, metadata_writer, writing, readQueue = OpenWriter(
-        cam_params, stopReadQueue
+def NextBatch(writeQueue, cameraName, max_items=64, timeout=0.5):
+    """
+    Wait for the next items of a camera's write queue or ring. Returns [] if its
+    grabber process exited without sending the stop message. The timeout keeps
+    SIGINT responsive.
+    """
+    while True:
+        batch = writeQueue.get_batch(max_items=max_items, timeout=timeout)
+        if batch:
+            return batch
+        if not writeQueue.producer_alive():
+            # Anything the grabber queued before exiting is visible now
+            batch = writeQueue.get_batch(max_items=max_items, timeout=0)
+            if not batch:
+                console.log(f"{cameraName} grabber exited without stopping.")
+            return batch
+
+
+def DiscardFrames(writeQueue, cameraName):
+    """
+    Take frames off a write queue or ring without writing them, until the grabber
+    stops, so it never blocks on a full queue. Used when the start was aborted.
+    """
+    while True:
+        batch = NextBatch(writeQueue, cameraName)
+        writeQueue.release(batch)
+        if not batch or any(item is STOP for item in batch):
+            return
+
+
+def WriteFrames(cam_params, writeQueue, readyQueue=None):
+    # Warm up the encoder and start ffmpeg before the first frame
+    # (ffmpeg inherits its CPUs from this thread)
+    t0 = time.perf_counter()
+    placement.PlaceWriter(cam_params)
+    try:
+        with placement.SpawnOn(cam_params):
+            warmed = WarmEncoder(cam_params)
+            if warmed:
+                video_writer, metadata_writer, writing, readQueue = OpenWriter(
+                    cam_params, writeQueue
+                )
+    except Exception:
+        readiness.Report(
+            readyQueue,
+            cam_params["cameraName"],
+            readiness.FAILED,
+            time.perf_counter() - t0,
+        )
+        raise
+    readiness.Report(
+        readyQueue,
+        cam_params["cameraName"],
+        "warmed" if warmed else readiness.FAILED,
+        time.perf_counter() - t0,
     )
+    if not warmed:
+        # Triggers won't start: let the grabber stop, without starting ffmpeg
+        DiscardFrames(writeQueue, cam_params["cameraName"])
+        writeQueue.close()
+        return
 
     with QueueKeyboardInterrupt(readQueue):
         # Write until interrupted and/or stop message received
         while writing:
-            if writeQueue:
-                frameNumber, timeStamp, img = writeQueue.popleft()
-                video_writer.send(img)
-                metadata_writer.send((frameNumber, timeStamp))
-            else:
-                # Once queue is depleted and grabber stops, then stop writing
-                if stopWriteQueue:
+            # Block until frames arrive. A grabber that died counts as stopped
+            batch = NextBatch(writeQueue, cam_params["cameraName"])
+            if not batch:
+                break
+            frames = batch
+            for i, item in enumerate(batch):
+                # Grabber sends the stop message behind its last frame
+                if item is STOP:
                     writing = False
-                # Otherwise continue writing
-                time.sleep(0.01)
+                    frames = batch[:i]
+                    break
+                video_writer.send(item[2])
+            metadata_writer.send(frames)
+            writeQueue.release(batch)
 
     # Close up...
     console.log(f"Closing video writer for {cam_params['cameraName']}. Please wait...")
     time.sleep(1)
     video_writer.close()
     metadata_writer.close()
+    writeQueue.close()
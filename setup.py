@@ -4,9 +4,11 @@
 	name='campy',
 	version='2.0.1',
 	packages=find_packages(),
+	# Frame rings, preview slots and scheduling use multiprocessing.shared_memory
+	python_requires='>=3.8',
 	install_requires=[
 					'imageio',
-					'matplotlib',
+					'opencv-python',
 					'numpy',
 					'pyserial',
 					'pyyaml',
@@ -14,7 +16,11 @@
 					],
 	entry_points={
 		"console_scripts": [
-			"campy-acquire = campy.campy:Main"
+			"campy-acquire = campy.campy:Main",
+			"campy-transcode = campy.transcode:Main",
+			"campy-mosaic-extract = campy.mosaic:Main",
+			"campy-autotune = campy.autotune:Main",
+			"campy-timestamps = campy.timestamps:Main",
 		]
 	}
 )
\ No newline at end of file